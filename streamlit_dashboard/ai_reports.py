@@ -0,0 +1,336 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import database
+
+# Upgrade to Gemini 3 Flash (User Request)
+DEFAULT_MODEL = 'gemini-3-flash-preview'
+
+# Seconds the idle worker waits before checking the queue again
+WORKER_POLL_SECONDS = 2.0
+
+# A running job refreshes its heartbeat every AI_JOB_HEARTBEAT_SECONDS; one silent
+# for AI_JOB_STALE_SECONDS lost its worker and is requeued
+AI_JOB_HEARTBEAT_SECONDS = 15
+AI_JOB_STALE_SECONDS = 120
+
+# Bump when a prompt template changes so cached responses are not reused
+PROMPT_TEMPLATE_VERSION = {'monthly': 2, 'global': 2}
+
+# Identical requests (same model, template version and data) are served from cache for this long
+AI_CACHE_TTL_SECONDS = 30 * 24 * 3600
+
+# Stream the model output and publish partial text while the job runs
+AI_STREAMING = True
+# Minimum seconds between partial-text writes to the jobs table
+STREAM_FLUSH_SECONDS = 0.5
+
+# Prompt-size budget (approximate tokens, ~4 characters per token)
+CHARS_PER_TOKEN = 4
+OPPORTUNITIES_TOKEN_BUDGET = 600
+HISTORY_TOKEN_BUDGET = 1200
+
+# SEO_AI_STUB=1 swaps Gemini for StubModel (offline development / tests)
+STUB_ENV_VAR = "SEO_AI_STUB"
+
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def trim_table_to_budget(table_str, max_tokens, keep="head"):
+    """
+    Trims a DataFrame.to_string() table to roughly max_tokens, keeping the header line
+    and whole rows: the first rows (keep="head") or the most recent ones (keep="tail").
+    """
+    if estimate_tokens(table_str) <= max_tokens:
+        return table_str
+    lines = table_str.splitlines()
+    header, rows = lines[0], lines[1:]
+    if keep == "tail":
+        rows = rows[::-1]
+
+    budget_chars = max_tokens * CHARS_PER_TOKEN - len(header) - 1
+    kept = []
+    for row in rows:
+        budget_chars -= len(row) + 1
+        if budget_chars < 0:
+            break
+        kept.append(row)
+
+    omitted = len(rows) - len(kept)
+    if keep == "tail":
+        kept = kept[::-1]
+        return "\n".join([header, f"... ({omitted} filas anteriores omitidas)"] + kept)
+    return "\n".join([header] + kept + [f"... ({omitted} filas omitidas)"])
+
+
+def build_monthly_prompt(summary_stats, opportunities_sample, analysis_month):
+    """Prompt del informe mensual (Marketing-First)"""
+    opportunities_sample = trim_table_to_budget(opportunities_sample, OPPORTUNITIES_TOKEN_BUDGET)
+    return f"""
+        Actúa como un Director de Marketing y Estratega SEO Senior. Tu audiencia es el equipo de marketing, no técnicos SEO.
+        Analiza los datos del mes: {analysis_month}.
+
+        DATOS CLAVE:
+        {summary_stats}
+
+        TOP OPORTUNIDADES (Volumen alto, Posición 4-10):
+        {opportunities_sample}
+
+        Genera un informe estratégico con EXACTAMENTE esta estructura (usa Markdown):
+
+        ## 1. Resumen Ejecutivo
+        * **Qué ha pasado**: Breve resumen de la situación (visibilidad, tráfico, valor).
+        * **Cambios Clave**: Qué ha mejorado o empeorado respecto al mes anterior.
+        * **Impacto Real**: Traduce los datos a impacto de negocio (posibles leads/ventas).
+
+        ## 2. Diagnóstico basado en Datos
+        * **Keywords Destacadas**: Menciona 2-3 keywords que están moviendo la aguja.
+        * **Quick Wins Identificados**: Oportunidades claras para atacar ya.
+        * **Riesgos**: Dependencia de marca excesiva, caídas en keywords clave, etc.
+
+        ## 3. Recomendaciones para Marketing (ACCIONABLES)
+        *Divide en acciones claras:*
+        * **🛡️ Acciones Prioritarias**:
+            * "Crear contenido nuevo para: [TEMA/KEYWORD]"
+            * "Optimizar landing page de: [URL/KEYWORD]"
+        * **🚫 Acciones a Evitar**:
+            * "No crear contenido sobre X porque canibaliza..."
+
+        ## 4. Checklist Operativo
+        * [ ] Tarea 1
+        * [ ] Tarea 2
+        * [ ] Tarea 3
+
+        **Tono**: Directivo, estratégico, orientado a la acción. NO uses jerga técnica innecesaria. NO inventes datos.
+        """
+
+
+def build_global_prompt(history_stats_str):
+    """Prompt del análisis histórico global"""
+    history_stats_str = trim_table_to_budget(history_stats_str, HISTORY_TOKEN_BUDGET, keep="tail")
+    return f"""
+        Actúa como un Consultor SEO Senior. Analiza la EVOLUCIÓN HISTÓRICA del proyecto SEO y ayuda al cliente a entender el valor generado.
+
+        ## Datos Históricos (Métricas por Mes)
+        {history_stats_str}
+
+        ## Instrucciones:
+        1. Contexto Estratégico: Resume la tendencia general (%) y si hay crecimiento sostenido.
+        2. Hitos de Valor: Destaca el mes con mayor visibilidad o tráfico.
+        3. Recomendación Forward-looking: 1 consejo para el próximo trimestre.
+
+        Sé muy directo, enfocado a negocio. Usa Markdown elegante.
+        """
+
+
+# ============================================
+# Models
+# ============================================
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubModel:
+    """
+    Local stand-in for genai.GenerativeModel: same generate_content() interface,
+    no network or API key. Returns a deterministic Markdown report.
+    """
+
+    def __init__(self, model_name="stub", delay=0.5):
+        self.model_name = model_name
+        self.delay = delay
+
+    def generate_content(self, prompt, stream=False):
+        lines = [l.strip() for l in prompt.strip().splitlines() if l.strip()]
+        parts = [
+            "## Informe de prueba (modelo local)\n",
+            f"* **Modelo solicitado**: {self.model_name}\n",
+            f"* **Tamaño del prompt**: {len(prompt)} caracteres, {len(lines)} líneas\n",
+            f"* **Inicio del prompt**: {lines[0] if lines else '—'}\n"
+        ]
+        if stream:
+            return self._stream(parts)
+        time.sleep(self.delay)
+        return StubResponse("".join(parts))
+
+    def _stream(self, parts):
+        for part in parts:
+            time.sleep(self.delay / len(parts))
+            yield StubResponse(part)
+
+
+def stub_enabled():
+    return os.environ.get(STUB_ENV_VAR) == "1"
+
+
+_configured_api_key = None
+_configure_lock = threading.Lock()
+
+
+def configure_api(api_key):
+    """Configures the Gemini SDK once per process; the SDK is only imported here, on first use"""
+    global _configured_api_key
+    with _configure_lock:
+        if api_key != _configured_api_key:
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            _configured_api_key = api_key
+
+
+def get_model(model_name=DEFAULT_MODEL):
+    """Returns the Gemini model (or the stub when SEO_AI_STUB=1 / model_name == 'stub')"""
+    if stub_enabled() or model_name == "stub":
+        return StubModel(model_name)
+    import google.generativeai as genai
+    return genai.GenerativeModel(model_name)
+
+
+# ============================================
+# Job queue
+# ============================================
+
+def make_cache_key(kind, model_name, inputs):
+    """sha256 over model name, prompt template version and the report input data"""
+    payload = json.dumps({
+        'kind': kind,
+        'model': model_name,
+        'template_version': PROMPT_TEMPLATE_VERSION[kind],
+        'inputs': inputs
+    }, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _store_report(kind, project_id, import_id, report_text):
+    if kind == 'monthly':
+        database.update_report_text(import_id, report_text)
+    else:
+        database.update_global_report(project_id, report_text)
+
+
+def _request_report(kind, project_id, import_id, prompt, inputs, model_name, force=False):
+    """
+    Serves the report from the cache when the same request was answered before,
+    otherwise queues it for the worker. force=True always queues a new generation
+    (its result replaces the cached one).
+    Returns the cached report text, or None if a job was queued.
+    """
+    cache_key = make_cache_key(kind, model_name, inputs)
+    cached = None if force else database.get_cached_ai_response(cache_key)
+    if cached is not None:
+        _store_report(kind, project_id, import_id, cached)
+        return cached
+    database.enqueue_ai_job(kind, project_id, import_id, prompt, model_name, cache_key)
+    _wakeup.set()
+    return None
+
+
+def request_monthly_report(project_id, import_id, summary_stats, opportunities_sample, analysis_month, model_name=DEFAULT_MODEL, force=False):
+    prompt = build_monthly_prompt(summary_stats, opportunities_sample, analysis_month)
+    inputs = {
+        'summary_stats': summary_stats,
+        'opportunities_sample': opportunities_sample,
+        'analysis_month': analysis_month
+    }
+    return _request_report('monthly', project_id, import_id, prompt, inputs, model_name, force)
+
+
+def request_global_report(project_id, history_stats_str, model_name=DEFAULT_MODEL, force=False):
+    prompt = build_global_prompt(history_stats_str)
+    return _request_report('global', project_id, None, prompt, {'history_stats': history_stats_str}, model_name, force)
+
+
+def _generate_streaming(model, job):
+    """Consumes a streamed response, publishing the text received so far for the status display"""
+    chunks = []
+    last_flush = time.monotonic()
+    for chunk in model.generate_content(job['prompt'], stream=True):
+        chunks.append(chunk.text)
+        if time.monotonic() - last_flush >= STREAM_FLUSH_SECONDS:
+            database.update_ai_job_partial(job['id'], "".join(chunks))
+            last_flush = time.monotonic()
+    return "".join(chunks)
+
+
+def _heartbeat_loop(job_id, stop):
+    while not stop.wait(AI_JOB_HEARTBEAT_SECONDS):
+        try:
+            database.touch_ai_job(job_id)
+        except Exception as e:
+            print(f"AI job {job_id} heartbeat failed: {e}")
+
+
+def run_job(job):
+    """Runs one claimed job and stores its result through the report persistence functions"""
+    # Keeps the job marked as alive while the (possibly long) model call runs
+    stop_heartbeat = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat_loop, args=(job['id'], stop_heartbeat), name="ai-job-heartbeat", daemon=True)
+    heartbeat.start()
+    try:
+        model = get_model(job['model_name'])
+        if AI_STREAMING:
+            report_text = _generate_streaming(model, job)
+        else:
+            report_text = model.generate_content(job['prompt']).text
+        _store_report(job['kind'], job['project_id'], job['import_id'], report_text)
+        if job.get('cache_key'):
+            database.put_cached_ai_response(job['cache_key'], job['model_name'], report_text, AI_CACHE_TTL_SECONDS)
+        database.finish_ai_job(job['id'], 'done')
+    except Exception as e:
+        print(f"AI job {job['id']} failed: {e}")
+        database.finish_ai_job(job['id'], 'failed', str(e))
+    finally:
+        stop_heartbeat.set()
+        heartbeat.join()
+
+
+def run_pending_jobs():
+    """Drains the queue in the calling thread. Returns the number of jobs processed"""
+    processed = 0
+    while True:
+        job = database.claim_next_ai_job()
+        if job is None:
+            return processed
+        run_job(job)
+        processed += 1
+
+
+_worker = None
+_worker_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+def _worker_loop():
+    while True:
+        try:
+            run_pending_jobs()
+        except Exception as e:
+            print(f"AI worker error: {e}")
+        _wakeup.wait(WORKER_POLL_SECONDS)
+        _wakeup.clear()
+
+
+def ensure_worker():
+    """Starts the per-process background worker thread (idempotent across reruns and sessions)"""
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            database.requeue_stale_ai_jobs(AI_JOB_STALE_SECONDS)
+            _worker = threading.Thread(target=_worker_loop, name="ai-report-worker", daemon=True)
+            _worker.start()
+    return _worker
+
+
+if __name__ == "__main__":
+    # Offline drain of the queue, e.g.: SEO_AI_STUB=1 python ai_reports.py
+    database.init_db()
+    if not stub_enabled() and os.environ.get("GOOGLE_API_KEY"):
+        configure_api(os.environ["GOOGLE_API_KEY"])
+    database.requeue_stale_ai_jobs(AI_JOB_STALE_SECONDS)
+    print(f"Processed {run_pending_jobs()} AI jobs")
@@ -1,18 +1,25 @@
 import streamlit as st
 import pandas as pd
-import google.generativeai as genai
 import etl
 import database
+import ai_reports
+import report_engine
+import exports
+import history_cube
 import intent_rules
-import utils_metrics
-import plotly.express as px
+import profiling
+import telemetry
 from datetime import datetime
 import os
 import time
 import json
 
-# Initialize Database
-database.init_db()
+_rerun_start = time.perf_counter()
+
+# Initialize Database (once per process, not on every rerun)
+database.ensure_db()
+# Projects and imports are read once per rerun (invalidated by writes)
+database.begin_request()
 
 # Configuration
 st.set_page_config(
@@ -27,9 +34,58 @@ def safe_rerun():
     except AttributeError:
         st.experimental_rerun()
 
+def take_profile_request():
+    """
+    True if this rerun runs under the profiler: requested from the sidebar
+    (management password) or with ?profile=1 outside shared links. One rerun per request.
+    """
+    if st.session_state.pop("profile_next_run", False):
+        return True
+    try:
+        requested = st.query_params.get("profile") == "1" and not st.query_params.get("import_id")
+        if requested:
+            del st.query_params["profile"]
+    except AttributeError:  # Older versions
+        params = st.experimental_get_query_params()
+        requested = params.get("profile") == ["1"] and not params.get("import_id")
+        if requested:
+            st.experimental_set_query_params(**{k: v for k, v in params.items() if k != "profile"})
+    return requested
+
+# A profiled rerun cut short (st.stop / st.rerun) leaves its profiler running
+_stale_profiler = st.session_state.pop("active_profiler", None)
+if _stale_profiler is not None:
+    _stale_profiler.disable()
+_profiler = profiling.start() if take_profile_request() else None
+if _profiler is not None:
+    st.session_state["active_profiler"] = _profiler
+
+# Partial-rerun decorator: st.fragment(run_every=...) needs Streamlit >= 1.37 (pinned in
+# requirements.txt); None on older installs, which rerun the whole script instead
+st_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+
+def plotly_express():
+    """plotly.express, imported by the first view that draws a chart (not at app start)"""
+    import plotly.express as px
+    return px
+
+def show_chart(fig, name):
+    """st.plotly_chart, timed as telemetry section chart:<name> of the current view"""
+    with telemetry.section(current_view, f"chart:{name}"):
+        st.plotly_chart(fig, use_container_width=True)
+
 # ============================================
 # PRO CONSTANTS - Naming & Formatting
 # ============================================
+# Sections of the monthly view (only the active one is computed and rendered)
+MONTHLY_TABS = {
+    'resumen': "📊 Resumen Ejecutivo",
+    'competencia': "⚔️ Competencia",
+    'oportunidades': "🚀 Oportunidades",
+    'inteligencia': "🧠 Inteligencia Avanzada",
+    'deep_dive': "🔎 Deep Dive"
+}
+
 KPI_LABELS = {
     'sov': 'Cuota de Visibilidad (SoV)',
     'traffic': 'Tráfico Estimado',
@@ -88,40 +144,61 @@ def format_number(value):
     """Formatea números grandes con separadores europeos"""
     return f"{value:,.0f}".replace(',', '.')
 
-def normalize_domain(domain):
-    if not domain:
-        return ""
-    d = str(domain).strip().lower()
-    d = d.replace("https://", "").replace("http://", "")
-    if d.startswith("www."):
-        d = d[4:]
-    return d
+TABLE_PAGE_SIZES = [25, 50, 100, 250]
 
-def resolve_main_domain(main_domain, domain_map):
+def render_paginated_table(df, key, formatters=None, default_sort=None, default_ascending=False, compact=False):
     """
-    Intenta resolver el dominio principal contra los dominios detectados en el CSV.
-    Devuelve (resolved_domain, note) donde note es un mensaje si hubo ajuste.
+    Tabla paginada: filtra y ordena en servidor sobre el DataFrame completo y envía
+    al navegador solo la página visible. Filtro, columna de orden, tamaño de página y
+    página se guardan en st.session_state (claves f"{key}_...").
+    formatters: {columna: función} aplicada solo a las filas de la página visible.
+    compact: controles apilados (para tablas dentro de columnas).
     """
-    if not domain_map:
-        return main_domain, None
-
-    if main_domain in domain_map:
-        return main_domain, None
-
-    norm_main = normalize_domain(main_domain)
-    for d in domain_map.keys():
-        if normalize_domain(d) == norm_main:
-            return d, f"Dominio principal normalizado a '{d}'"
-
-    base = norm_main.split('.')[0] if norm_main else ""
-    if base:
-        candidates = [d for d in domain_map.keys() if normalize_domain(d).split('.')[0] == base]
-        if len(candidates) == 1:
-            return candidates[0], f"Dominio principal ajustado a '{candidates[0]}' por coincidencia de marca"
-
-    # Fallback conservador: usar primer dominio detectado
-    first_domain = list(domain_map.keys())[0]
-    return first_domain, f"Dominio principal ajustado a '{first_domain}' (no se encontró coincidencia exacta)"
+    if df is None or df.empty:
+        st.caption("Sin filas.")
+        return
+    columns = list(df.columns)
+    sort_options = ["—"] + columns
+    if f"{key}_sort" not in st.session_state:
+        st.session_state[f"{key}_sort"] = default_sort if default_sort in columns else "—"
+        st.session_state[f"{key}_order"] = "Asc" if default_ascending else "Desc"
+
+    slots = [st.container() for _ in range(5)] if compact else st.columns([3, 2, 1, 1, 1])
+    filter_text = slots[0].text_input("🔍 Filtrar", key=f"{key}_filter")
+    sort_col = slots[1].selectbox("Ordenar por", sort_options, key=f"{key}_sort")
+    order = slots[2].selectbox("Orden", ["Desc", "Asc"], key=f"{key}_order")
+    page_size = slots[3].selectbox("Filas", TABLE_PAGE_SIZES, key=f"{key}_size")
+
+    view = df
+    if filter_text:
+        # pandas >= 3 gives text columns the `str` dtype, not object
+        text_cols = [
+            c for c in columns
+            if pd.api.types.is_object_dtype(view[c]) or pd.api.types.is_string_dtype(view[c])
+        ]
+        mask = pd.Series(False, index=view.index)
+        for c in text_cols:
+            mask |= view[c].astype(str).str.contains(filter_text, case=False, regex=False, na=False)
+        view = view[mask]
+    if sort_col != "—":
+        view = view.sort_values(sort_col, ascending=(order == "Asc"), na_position='last', kind='stable')
+
+    n_pages = max(1, -(-len(view) // page_size))
+    # Back to the first page whenever the filter, order or page size change
+    signature = (filter_text, sort_col, order, page_size, len(df))
+    if st.session_state.get(f"{key}_signature") != signature:
+        st.session_state[f"{key}_signature"] = signature
+        st.session_state[f"{key}_page"] = 1
+    st.session_state[f"{key}_page"] = min(st.session_state.get(f"{key}_page", 1), n_pages)
+    page = slots[4].number_input("Página", min_value=1, max_value=n_pages, step=1, key=f"{key}_page")
+
+    start = (int(page) - 1) * page_size
+    page_df = view.iloc[start:start + page_size].copy()
+    for col, fmt in (formatters or {}).items():
+        if col in page_df.columns:
+            page_df[col] = page_df[col].apply(fmt)
+    st.dataframe(page_df, use_container_width=True)
+    st.caption(f"Filas {start + 1 if len(view) else 0}–{start + len(page_df)} de {len(view)}")
 
 def render_data_quality_panel(df, domain_map):
     """
@@ -166,181 +243,6 @@ def render_data_quality_panel(df, domain_map):
     
     return cpc_coverage  # Return for gating logic
 
-def build_top15_evolution(project_id, selected_domain, imports_list):
-    """
-    Top 15 keywords por clics estimados del último mes.
-    Devuelve:
-      - summary_df: tabla rápida (último mes)
-      - evo_df: histórico long con columnas month, keyword, role, domain, position, clicks
-      - last_month: string YYYY-MM
-      - reason: motivo si no hay datos suficientes
-      - metric_label: métrica utilizada para el Top 15
-      - metric_type: clicks | visibility | position
-    """
-    if imports_list.empty:
-        return None, None, None, "No hay meses cargados", None, None
-
-    df_last = None
-    domain_map_last = None
-    last_month = None
-    main_clicks_col = f'clics_{selected_domain}'
-
-    for _, imp in imports_list.iterrows():
-        last_month = imp['month']
-        df_candidate, dmap_candidate = database.load_import_data(imp['id'])
-        if df_candidate.empty:
-            continue
-        df_last = df_candidate
-        domain_map_last = dmap_candidate
-        break
-
-    if df_last is None or domain_map_last is None:
-        return None, None, last_month, "No hay datos válidos en los meses cargados", None, None
-
-    # Determine best available metric for Top 15
-    metric_type = None
-    metric_label = None
-    metric_col_main = None
-
-    vis_col_main = domain_map_last.get(selected_domain, {}).get('visibility')
-    pos_col_main = domain_map_last.get(selected_domain, {}).get('position')
-
-    if main_clicks_col in df_last.columns and df_last[main_clicks_col].sum() > 0:
-        metric_type = "clicks"
-        metric_label = "Clics estimados"
-        metric_col_main = main_clicks_col
-    elif vis_col_main and vis_col_main in df_last.columns and df_last[vis_col_main].sum() > 0:
-        metric_type = "visibility"
-        metric_label = "Visibilidad"
-        metric_col_main = vis_col_main
-    elif pos_col_main and pos_col_main in df_last.columns and df_last[pos_col_main].notnull().any():
-        metric_type = "position"
-        metric_label = "Posición"
-        metric_col_main = pos_col_main
-    else:
-        return None, None, last_month, "No hay clics/visibilidad/posición disponibles para el dominio seleccionado", None, None
-
-    top15_df = df_last.sort_values(metric_col_main, ascending=(metric_type == "position")).head(15).copy()
-    if top15_df.empty:
-        return None, None, last_month, "No hay suficientes keywords para el Top 15", None, None
-
-    domains = list(domain_map_last.keys())
-    summary_rows = []
-    competitor_by_kw = {}
-
-    for _, row in top15_df.iterrows():
-        keyword = row['keyword']
-        best_domain = None
-        best_value = None
-
-        for domain in domains:
-            if domain == selected_domain:
-                continue
-            if metric_type == "clicks":
-                col = f'clics_{domain}'
-                val = row[col] if col in row and pd.notnull(row[col]) else 0
-                if best_value is None or val > best_value:
-                    best_value = val
-                    best_domain = domain
-            elif metric_type == "visibility":
-                vcol = domain_map_last.get(domain, {}).get('visibility')
-                val = row[vcol] if vcol and vcol in row and pd.notnull(row[vcol]) else 0
-                if best_value is None or val > best_value:
-                    best_value = val
-                    best_domain = domain
-            elif metric_type == "position":
-                pcol = domain_map_last.get(domain, {}).get('position')
-                val = row[pcol] if pcol and pcol in row and pd.notnull(row[pcol]) else None
-                if val is None:
-                    continue
-                if best_value is None or val < best_value:
-                    best_value = val
-                    best_domain = domain
-
-        if metric_type in ("clicks", "visibility") and (best_value is None or best_value <= 0):
-            best_domain = None
-        if metric_type == "position" and best_value is None:
-            best_domain = None
-
-        competitor_by_kw[keyword] = best_domain
-
-        main_pos_col = domain_map_last.get(selected_domain, {}).get('position')
-        comp_pos_col = domain_map_last.get(best_domain, {}).get('position') if best_domain else None
-
-        # Metric values for summary
-        if metric_type == "clicks":
-            main_metric_val = row.get(main_clicks_col, 0)
-            comp_metric_val = row.get(f'clics_{best_domain}', 0) if best_domain else None
-        elif metric_type == "visibility":
-            main_metric_val = row.get(vis_col_main, 0) if vis_col_main else None
-            comp_vis_col = domain_map_last.get(best_domain, {}).get('visibility') if best_domain else None
-            comp_metric_val = row.get(comp_vis_col, 0) if comp_vis_col else None
-        else:  # position
-            main_metric_val = row.get(pos_col_main) if pos_col_main else None
-            comp_metric_val = row.get(comp_pos_col) if comp_pos_col else None
-
-        summary_rows.append({
-            'Keyword': keyword,
-            f'{metric_label} (tu dominio)': main_metric_val,
-            'Competidor referencia': best_domain or "—",
-            f'{metric_label} (competidor)': comp_metric_val
-        })
-
-        # Append positions if metric is not position and columns exist
-        if metric_type != "position":
-            summary_rows[-1]['Posición (tu dominio)'] = row.get(main_pos_col) if main_pos_col else None
-            summary_rows[-1]['Posición (competidor)'] = row.get(comp_pos_col) if comp_pos_col else None
-
-    summary_df = pd.DataFrame(summary_rows)
-
-    evo_rows = []
-    for keyword, comp_domain in competitor_by_kw.items():
-        hist = database.get_keyword_history(project_id, keyword)
-        if hist.empty:
-            continue
-
-        for _, hrow in hist.iterrows():
-            try:
-                domain_data = json.loads(hrow['data_json']) if hrow.get('data_json') else {}
-            except Exception:
-                domain_data = {}
-
-            main_data = domain_data.get(selected_domain, {})
-            if metric_type == "clicks":
-                main_metric = main_data.get('clics', 0)
-            elif metric_type == "visibility":
-                main_metric = main_data.get('vis', 0)
-            else:
-                main_metric = main_data.get('pos')
-            evo_rows.append({
-                'month': hrow['month'],
-                'keyword': keyword,
-                'role': 'Tu dominio',
-                'domain': selected_domain,
-                'position': main_data.get('pos'),
-                'metric': main_metric
-            })
-
-            if comp_domain:
-                comp_data = domain_data.get(comp_domain, {})
-                if metric_type == "clicks":
-                    comp_metric = comp_data.get('clics', 0)
-                elif metric_type == "visibility":
-                    comp_metric = comp_data.get('vis', 0)
-                else:
-                    comp_metric = comp_data.get('pos')
-                evo_rows.append({
-                    'month': hrow['month'],
-                    'keyword': keyword,
-                    'role': 'Competencia',
-                    'domain': comp_domain,
-                    'position': comp_data.get('pos'),
-                    'metric': comp_metric
-                })
-
-    evo_df = pd.DataFrame(evo_rows) if evo_rows else None
-    return summary_df, evo_df, last_month, None, metric_label, metric_type
-
 def render_intent_validation_module(df):
     """Módulo para validar manualmente la intención de búsqueda"""
     st.markdown("### 📝 Validar Intención (Enriquecimiento)")
@@ -381,15 +283,241 @@ def render_intent_validation_module(df):
         # Detect rows that changed
         changed_rows = edited_df[edited_df['Nueva Intención'] != edited_df['Intención Sugerida']]
         if not changed_rows.empty:
+            affected_projects = set()
             for _, row in changed_rows.iterrows():
                 kw_norm = intent_rules.normalize_keyword(row['Palabra Clave'])
-                database.upsert_keyword_intent(kw_norm, row['Palabra Clave'], row['Nueva Intención'])
+                affected_projects.update(database.upsert_keyword_intent(kw_norm, row['Palabra Clave'], row['Nueva Intención']))
+            # Only the months containing these keywords were invalidated: rebuild them now
+            with st.spinner("Actualizando informes afectados..."):
+                for affected_project in sorted(affected_projects):
+                    report_engine.rebuild_stale_reports(affected_project)
             st.success(f"✅ Se han validado {len(changed_rows)} keywords.")
             time.sleep(1)
             safe_rerun()
         else:
             st.warning("No has realizado ningún cambio en la columna 'Nueva Intención'.")
 
+def render_competitor_filter(project_id, import_id, df, domain_map, selected_domain, sov_df):
+    """Competencia: keyword filter + SoV recomputed on the selected keywords (partial rerun)"""
+    comp_search = st.text_input("Buscar keywords para filtrar:", key="comp_kw_search")
+    comp_selected_prev = st.session_state.get("comp_kw_filter", [])
+    comp_matches = database.search_keywords(project_id, comp_search, import_id=import_id)
+    selected_keywords_comp = st.multiselect(
+        "Filtrar por Keywords específicas (deja vacío para ver todo el mercado):",
+        options=list(dict.fromkeys(comp_selected_prev + comp_matches)),
+        key="comp_kw_filter"
+    )
+    
+    # Recalculate SOV if filter is active
+    display_sov_df = sov_df
+    if selected_keywords_comp:
+        filtered_comp_df = df[df['keyword'].isin(selected_keywords_comp)]
+        if not filtered_comp_df.empty:
+            display_sov_df = etl.calculate_sov(filtered_comp_df, domain_map, selected_domain)
+            st.caption(f"Análisis basado en {len(selected_keywords_comp)} keywords seleccionadas.")
+        else:
+            st.warning("No hay datos para las keywords seleccionadas.")
+
+    # Bar chart Top 10
+    st.markdown("### Top 10 Competidores por Cuota de Visibilidad")
+    top_10 = display_sov_df.head(10)
+    px = plotly_express()
+    fig_bar = px.bar(
+        top_10,
+        x='sov',
+        y='domain',
+        orientation='h',
+        title="",
+        labels={'sov': 'Cuota de Visibilidad (%)', 'domain': 'Dominio'},
+        color='sov',
+        color_continuous_scale='Blues'
+    )
+    fig_bar.update_layout(showlegend=False, yaxis={'categoryorder':'total ascending'})
+    show_chart(fig_bar, "sov_bar")
+
+def render_keyword_deep_dive(project_id, import_id, df, pos_col, selected_domain):
+    """Deep Dive: keyword search + history of the selected keyword (partial rerun)"""
+    kw_dive_search = st.text_input("Buscar palabra clave (prefijo o parte del texto, sin acentos):", key="kw_dive_search")
+    kw_dive_matches = database.search_keywords(project_id, kw_dive_search, import_id=import_id)
+    if kw_dive_search and not kw_dive_matches:
+        st.caption("Sin coincidencias.")
+    selected_kw_dive = st.selectbox("Selecciona una palabra clave:", kw_dive_matches)
+    
+    if selected_kw_dive:
+        kw_history_df = database.get_keyword_history(project_id, selected_kw_dive)
+        
+        # Get current keyword data for context messages (P0.5)
+        kw_current_row = df[df['keyword'] == selected_kw_dive]
+        current_pos = kw_current_row[pos_col].values[0] if pos_col and not kw_current_row.empty else None
+        current_traffic = kw_current_row[f'clics_{selected_domain}'].values[0] if f'clics_{selected_domain}' in kw_current_row.columns and not kw_current_row.empty else 0
+        current_value = kw_current_row[f'media_value_{selected_domain}'].values[0] if f'media_value_{selected_domain}' in kw_current_row.columns and not kw_current_row.empty else 0
+        
+        # P0.5: Context message for 0€/0 traffic or zero value
+        if current_traffic == 0 or current_value == 0:
+            st.warning(
+                "💡 **Potencial latente**. Esta keyword aún está fuera del rango de captación significativa. "
+                "Prioriza subir 1–2 posiciones para comenzar a captar tráfico."
+            )
+        
+        # P0.5: Striking distance badge
+        if current_pos and 4 <= current_pos <= 10:
+            st.success(f"🎯 **Striking Distance** (Posición {current_pos:.0f}): Esta keyword está en zona de ataque. Un pequeño impulso puede generar gran impacto.")
+        elif current_pos and current_pos <= 3:
+            st.info(f"🏆 **Top 3** (Posición {current_pos:.0f}): Esta keyword ya está capturando tráfico significativo.")
+        
+        if not kw_history_df.empty:
+            # Parse domain data json
+            history_parsed = []
+            for _, row in kw_history_df.iterrows():
+                d_data = json.loads(row['data_json'])
+                main_d_data = d_data.get(selected_domain, {})
+                history_parsed.append({
+                    'Mes': row['month'],
+                    'Posición': main_d_data.get('pos', 101),
+                    'Tráfico Est.': main_d_data.get('clics', 0),
+                    'Valor (€)': main_d_data.get('media_value', 0),
+                    'CPC': row['cpc']
+                })
+            
+            hp_df = pd.DataFrame(history_parsed)
+            
+            # Metrics Delta
+            if len(hp_df) >= 2:
+                last = hp_df.iloc[-1]
+                prev = hp_df.iloc[-2]
+                
+                k1, k2, k3 = st.columns(3)
+                
+                # Position (Lower is better)
+                pos_delta = last['Posición'] - prev['Posición']
+                
+                k1.metric("Posición Actual", f"{last['Posición']:.0f}", delta=f"{pos_delta:.0f}", delta_color="inverse")
+                k2.metric("Tráfico Est.", f"{last['Tráfico Est.']:.0f}", delta=f"{last['Tráfico Est.'] - prev['Tráfico Est.']:.0f}")
+                k3.metric("Valor (€)", f"{last['Valor (€)']:.2f}€", delta=f"{last['Valor (€)'] - prev['Valor (€)']:.2f}€")
+            else:
+                # Only 1 month of data
+                last = hp_df.iloc[-1]
+                k1, k2, k3 = st.columns(3)
+                k1.metric("Posición Actual", f"{last['Posición']:.0f}")
+                k2.metric("Tráfico Est.", f"{last['Tráfico Est.']:.0f}")
+                k3.metric("Valor (€)", f"{last['Valor (€)']:.2f}€")
+                st.caption("Sin comparativa disponible (solo 1 mes de datos).")
+            
+            # Chart
+            px = plotly_express()
+            fig_kw = px.line(hp_df, x='Mes', y='Posición', markers=True, title=f"Evolución de Posición: {selected_kw_dive}")
+            fig_kw['layout']['yaxis']['autorange'] = "reversed" # 1 is top
+            show_chart(fig_kw, "keyword_history")
+            
+            render_paginated_table(hp_df, key="hp_table")
+        else:
+            st.warning("No hay histórico suficiente para esta keyword.")
+
+# Partial reruns: interacting with these sections only reruns (and redraws) the
+# section itself, with the inputs of the last full run, not the whole report
+if st_fragment:
+    render_intent_validation_module = st_fragment(render_intent_validation_module)
+    render_competitor_filter = st_fragment(render_competitor_filter)
+    render_keyword_deep_dive = st_fragment(render_keyword_deep_dive)
+
+def render_portfolio_page():
+    """Cartera: último mes de cada proyecto (dominio principal) desde los totales guardados por import"""
+    st.title("🗂️ Cartera de Proyectos")
+    st.caption("Último mes cargado de cada proyecto y variación frente al mes anterior (dominio principal).")
+    with telemetry.section("portfolio", "data"):
+        portfolio = report_engine.compute_portfolio()
+    if portfolio.empty:
+        st.info("No hay proyectos.")
+        return
+
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Proyectos con datos", f"{portfolio['month'].notna().sum()} / {len(portfolio)}")
+    c2.metric(KPI_LABELS['traffic'], format_number(portfolio['clics'].sum()))
+    c3.metric(KPI_LABELS['value'], format_currency(portfolio['media_value'].sum()))
+
+    def signed(fmt):
+        return lambda x: "—" if pd.isna(x) else (("+" if x > 0 else "") + fmt(x))
+
+    render_paginated_table(
+        portfolio[['name', 'domain', 'month', 'sov', 'delta_sov', 'clics', 'delta_clics',
+                   'media_value', 'delta_media_value', 'top10', 'delta_top10']].rename(columns={
+            'name': 'Proyecto',
+            'domain': 'Dominio',
+            'month': 'Último Mes',
+            'sov': 'SoV (%)',
+            'delta_sov': 'Δ SoV (pp)',
+            'clics': 'Tráfico Est.',
+            'delta_clics': 'Δ Tráfico',
+            'media_value': 'Valor (€)',
+            'delta_media_value': 'Δ Valor',
+            'top10': 'Top 10',
+            'delta_top10': 'Δ Top 10'
+        }),
+        key="portfolio_table",
+        default_sort='Tráfico Est.',
+        formatters={
+            'Último Mes': lambda x: x if isinstance(x, str) else "Sin datos",
+            'SoV (%)': lambda x: "—" if pd.isna(x) else f"{x:.1f}%",
+            'Δ SoV (pp)': signed(lambda x: f"{x:.1f} pp"),
+            'Tráfico Est.': lambda x: "—" if pd.isna(x) else format_number(x),
+            'Δ Tráfico': signed(format_number),
+            'Valor (€)': lambda x: "—" if pd.isna(x) else format_currency(x),
+            'Δ Valor': signed(format_currency),
+            'Top 10': lambda x: "—" if pd.isna(x) else f"{x:.0f}",
+            'Δ Top 10': signed(lambda x: f"{x:.0f}")
+        }
+    )
+
+def render_telemetry_page():
+    """Admin page: render latency p50/p95 per view and section, regressions vs the previous release"""
+    st.title("⏱️ Rendimiento de la App")
+    days = st.selectbox("Periodo", [1, 7, 30], index=1, format_func=lambda d: f"Últimos {d} días", key="telemetry_days")
+    samples = telemetry.load_samples(days)
+    if samples.empty:
+        st.info("Todavía no hay mediciones en este periodo.")
+        return
+
+    table, newest, previous = telemetry.regressions(samples)
+    st.caption(f"Release actual: `{newest}`" + (f" | anterior: `{previous}`" if previous else " | sin release anterior para comparar"))
+    flagged = table[table['regression']]
+    if not flagged.empty:
+        st.error("📉 Regresiones tras el último despliegue: " + ", ".join(f"{r.view}/{r.section} (p95 ×{r.ratio:.2f})" for r in flagged.itertuples()))
+    else:
+        st.success("✅ Sin regresiones de p95 respecto a la release anterior.")
+
+    display = table.copy()
+    for col in ['p50', 'p95', 'p95_prev']:
+        display[col] = (display[col] * 1000).round(1)
+    display['ratio'] = display['ratio'].round(2)
+    st.dataframe(display.rename(columns={
+        'view': 'Vista', 'section': 'Sección', 'samples': 'Muestras', 'p50': 'p50 (ms)', 'p95': 'p95 (ms)',
+        'samples_prev': 'Muestras (anterior)', 'p95_prev': 'p95 anterior (ms)', 'ratio': 'Ratio p95', 'regression': 'Regresión'
+    }), use_container_width=True)
+
+    daily = telemetry.daily_percentiles(samples)
+    view = st.selectbox("Vista", sorted(daily['view'].unique()), key="telemetry_view")
+    view_daily = daily[daily['view'] == view].assign(p95_ms=lambda d: d['p95'] * 1000)
+    px = plotly_express()
+    fig = px.line(
+        view_daily, x='day', y='p95_ms', color='section', markers=True,
+        labels={'day': 'Día', 'p95_ms': 'p95 (ms)', 'section': 'Sección'},
+        title=f"p95 diario por sección: {view}"
+    )
+    fig.update_xaxes(type='category')
+    st.plotly_chart(fig, use_container_width=True)
+
+def render_profile_report(report, key):
+    st.caption(f"Perfil de la vista '{report['label']}' ({report['created_at']}), funciones más lentas por tiempo acumulado:")
+    st.dataframe(report['top'], use_container_width=True)
+    st.download_button(
+        label="📥 Descargar perfil (.pstats)",
+        data=report['pstats'],
+        file_name=f"perfil_{report['label']}_{report['created_at']}.pstats",
+        mime="application/octet-stream",
+        key=key,
+        help="Ábrelo con `python -m pstats`, snakeviz o conviértelo en flame graph (flameprof)."
+    )
+
 def render_help_section():
     """Renderiza sección de ayuda con glosario de términos"""
     with st.expander("❓ Glosario de Términos SEO"):
@@ -434,7 +562,9 @@ elif "general" in st.secrets and "GOOGLE_API_KEY" in st.secrets["general"]:
 
 if google_api_key:
     google_api_key = google_api_key.strip().strip('"').strip("'")
-    genai.configure(api_key=google_api_key)
+    ai_reports.configure_api(google_api_key)
+    st.session_state["api_key_configured"] = True
+elif ai_reports.stub_enabled():
     st.session_state["api_key_configured"] = True
 else:
     st.session_state["api_key_configured"] = False
@@ -444,97 +574,79 @@ if "pending_ai_import_id" not in st.session_state:
     st.session_state["pending_ai_import_id"] = None
 if "pending_ai_global_project_id" not in st.session_state:
     st.session_state["pending_ai_global_project_id"] = None
+# Manual regeneration (management zone) bypasses the AI response cache
+if "force_ai_import_id" not in st.session_state:
+    st.session_state["force_ai_import_id"] = None
+if "force_ai_global_project_id" not in st.session_state:
+    st.session_state["force_ai_global_project_id"] = None
+
+# Background worker: Gemini calls run off the render thread
+ai_reports.ensure_worker()
 
 # Helper for AI Report
-def get_ai_analysis(import_id, summary_stats, opportunities_sample, analysis_month):
-    """Generates or retrieves AI report from DB with Marketing-First focus"""
+def get_ai_analysis(project_id, import_id, summary_stats, opportunities_sample, analysis_month, force=False):
+    """
+    Solicita el reporte IA mensual (Marketing-First).
+    Returns: (report_text, error) — report_text solo si había una respuesta idéntica en caché;
+    si no, el job queda en cola y ambos son None. force=True ignora la caché (regeneración manual).
+    """
     if not st.session_state.get("api_key_configured"):
-        return "⚠️ Configura una API Key válida para habilitar el reporte de IA."
+        return None, "⚠️ Configura una API Key válida para habilitar el reporte de IA."
     
     try:
-        # Upgrade to Gemini 3 Flash (User Request)
-        # We forcefully try gemini-3-flash-preview first
-        selected_model = 'gemini-3-flash-preview'
-            
-        model = genai.GenerativeModel(selected_model)
-        
-        prompt = f"""
-        Actúa como un Director de Marketing y Estratega SEO Senior. Tu audiencia es el equipo de marketing, no técnicos SEO.
-        Analiza los datos del mes: {analysis_month}.
-        
-        DATOS CLAVE:
-        {summary_stats}
-        
-        TOP OPORTUNIDADES (Volumen alto, Posición 4-10):
-        {opportunities_sample}
-        
-        Genera un informe estratégico con EXACTAMENTE esta estructura (usa Markdown):
-
-        ## 1. Resumen Ejecutivo
-        * **Qué ha pasado**: Breve resumen de la situación (visibilidad, tráfico, valor).
-        * **Cambios Clave**: Qué ha mejorado o empeorado respecto al mes anterior.
-        * **Impacto Real**: Traduce los datos a impacto de negocio (posibles leads/ventas).
-
-        ## 2. Diagnóstico basado en Datos
-        * **Keywords Destacadas**: Menciona 2-3 keywords que están moviendo la aguja.
-        * **Quick Wins Identificados**: Oportunidades claras para atacar ya.
-        * **Riesgos**: Dependencia de marca excesiva, caídas en keywords clave, etc.
-
-        ## 3. Recomendaciones para Marketing (ACCIONABLES)
-        *Divide en acciones claras:*
-        * **🛡️ Acciones Prioritarias**:
-            * "Crear contenido nuevo para: [TEMA/KEYWORD]"
-            * "Optimizar landing page de: [URL/KEYWORD]"
-        * **🚫 Acciones a Evitar**:
-            * "No crear contenido sobre X porque canibaliza..."
-        
-        ## 4. Checklist Operativo
-        * [ ] Tarea 1
-        * [ ] Tarea 2
-        * [ ] Tarea 3
-        
-        **Tono**: Directivo, estratégico, orientado a la acción. NO uses jerga técnica innecesaria. NO inventes datos.
-        """
-        
-        with st.spinner('🧠 Analizando estrategia de marketing (Gemini 3 Flash)...'):
-            response = model.generate_content(prompt)
-            report_text = response.text
-            # Save to DB
-            database.update_report_text(import_id, report_text)
-            return report_text
-            
+        cached = ai_reports.request_monthly_report(project_id, import_id, summary_stats, opportunities_sample, analysis_month, force=force)
+        return cached, None
     except Exception as e:
-        return f"Error en IA: {str(e)}"
+        return None, f"Error en IA: {str(e)}"
 
 def get_global_ai_analysis(project_id, history_stats_str, force=False):
-    """Genera un análisis histórico de tendencias usando Gemini Pro"""
+    """
+    Solicita el análisis histórico de tendencias. force=True ignora la caché (regeneración manual).
+    Returns: (report_text | None, error | None)
+    """
     if not st.session_state.get("api_key_configured"):
-        return "⚠️ Configura una API Key válida para habilitar el análisis global de IA."
+        return None, "⚠️ Configura una API Key válida para habilitar el análisis global de IA."
     
     try:
-        selected_model = 'gemini-3-flash-preview'
-        # We skip the list check to force the preview model
-        model = genai.GenerativeModel(selected_model)
-        
-        prompt = f"""
-        Actúa como un Consultor SEO Senior. Analiza la EVOLUCIÓN HISTÓRICA del proyecto SEO y ayuda al cliente a entender el valor generado.
-        
-        ## Datos Históricos (Métricas por Mes)
-        {history_stats_str}
-        
-        ## Instrucciones:
-        1. Contexto Estratégico: Resume la tendencia general (%) y si hay crecimiento sostenido.
-        2. Hitos de Valor: Destaca el mes con mayor visibilidad o tráfico.
-        3. Recomendación Forward-looking: 1 consejo para el próximo trimestre.
-        
-        Sé muy directo, enfocado a negocio. Usa Markdown elegante.
-        """
-        
-        response = model.generate_content(prompt)
-        report_text = response.text
-        return report_text
+        cached = ai_reports.request_global_report(project_id, history_stats_str, force=force)
+        return cached, None
     except Exception as e:
-        return f"❌ Error en análisis global: {str(e)}"
+        return None, f"❌ Error en análisis global: {str(e)}"
+
+def _show_ai_job_pending(job):
+    if job.get('partial_text'):
+        # Streaming: show the text received so far
+        st.info(job['partial_text'] + " ▌", icon="🤖")
+        st.caption("⏳ Generando análisis IA...")
+        return
+    label = "en cola" if job['status'] == 'queued' else "generándose"
+    st.info(f"⏳ Análisis IA {label} en segundo plano. Puedes seguir usando el dashboard.")
+
+def _poll_ai_job(kind, project_id, import_id):
+    job = database.get_latest_ai_job(kind, project_id, import_id)
+    if job and job['status'] in ('queued', 'running'):
+        _show_ai_job_pending(job)
+    else:
+        # The worker finished: full rerun so the stored report is shown
+        safe_rerun()
+
+if st_fragment:
+    _poll_ai_job = st_fragment(run_every=1)(_poll_ai_job)
+
+def render_ai_job_status(kind, project_id, import_id=None):
+    """Muestra el estado del último job IA sin bloquear el render del dashboard"""
+    job = database.get_latest_ai_job(kind, project_id, import_id)
+    if not job:
+        return
+    if job['status'] in ('queued', 'running'):
+        if st_fragment:
+            _poll_ai_job(kind, project_id, import_id)
+        else:
+            _show_ai_job_pending(job)
+            if st.button("🔄 Actualizar estado", key=f"refresh_ai_{kind}_{project_id}_{import_id}"):
+                safe_rerun()
+    elif job['status'] == 'failed':
+        st.warning(f"❌ Error en IA: {job['error']}")
 
 # --- SIDEBAR & NAVIGATION ---
 with st.sidebar:
@@ -552,11 +664,21 @@ with st.sidebar:
         params = st.experimental_get_query_params()  # Older versions
     shared_import_id = params.get("import_id")
     
+    if isinstance(shared_import_id, list):  # experimental_get_query_params returns lists
+        shared_import_id = shared_import_id[0] if shared_import_id else None
+    
     if shared_import_id:
         st.info("🔗 Vista de Compartida (Lectura)")
         mode = "shared"
         current_import_id = int(shared_import_id)
         current_view = "monthly"
+        shared_import = database.get_import(current_import_id)
+        if shared_import is None:
+            st.error("El enlace compartido no es válido o el mes ha sido eliminado.")
+            st.stop()
+        project_id = shared_import['project_id']
+        main_domain = shared_import['main_domain']
+        stored_report = shared_import['report_text']
     else:
         st.markdown("### Gestión de Proyectos")
         mode = "admin"
@@ -584,6 +706,7 @@ with st.sidebar:
             if del_pwd == "Webyseo@":
                 if st.button("🗑️ ELIMINAR PROYECTO COMPLETO"):
                     database.delete_project(project_id)
+                    history_cube.delete_cube(project_id)
                     st.success(f"Proyecto {selected_p_row['name']} eliminado.")
                     time.sleep(1)
                     safe_rerun()
@@ -630,6 +753,8 @@ with st.sidebar:
                         st.warning("⚠️ No se detectaron columnas de 'Visibilidad'. Las gráficas de cuota de mercado (SoV) estarán vacías. Verifica el formato del CSV.")
                     import_id = database.save_import_data(project_id, new_month, uploaded_file.name, ret['df'], ret['domains'])
                     if import_id:
+                        # Precompute MoM diffs and the read-only snapshot served to shared links
+                        report_engine.refresh_after_import_change(project_id)
                         # Trigger AI only on new CSV upload
                         st.session_state["pending_ai_import_id"] = import_id
                         st.session_state["pending_ai_global_project_id"] = project_id
@@ -648,15 +773,27 @@ with st.sidebar:
             
         st.markdown("---")
         render_help_section()
+        if st.checkbox("🗂️ Cartera de proyectos", key="show_portfolio", help="Último mes de todos los proyectos en una tabla"):
+            current_view = "portfolio"
+        if st.checkbox("⏱️ Rendimiento de la app", key="show_telemetry", help="Latencias p50/p95 por vista y sección"):
+            current_view = "telemetry"
+        with st.expander("🔬 Perfilado de rendimiento"):
+            profile_pwd = st.text_input("🔑 Contraseña de Gestión", type="password", key="profile_pwd")
+            if profile_pwd == "Webyseo@":
+                if st.button("Perfilar la vista actual", key="profile_run", help="Repite la vista actual bajo cProfile y ofrece el informe para descargar."):
+                    st.session_state["profile_next_run"] = True
+                    safe_rerun()
+                if "profile_report" in st.session_state:
+                    render_profile_report(st.session_state["profile_report"], key="profile_download_sidebar")
+            elif profile_pwd:
+                st.error("❌ Contraseña incorrecta.")
 
 # --- MAIN DASHBOARD ---
 if current_view == "global":
-    all_imports = database.get_project_imports(project_id)
-    resolved_global_domain = main_domain
-    domain_note_global = None
-    if not all_imports.empty:
-        df_last_global, d_map_last = database.load_import_data(all_imports.iloc[0]['id'])
-        resolved_global_domain, domain_note_global = resolve_main_domain(main_domain, d_map_last)
+    with telemetry.section("global", "data"):
+        global_report = report_engine.get_global_report_snapshot(project_id)
+    resolved_global_domain = global_report['resolved_domain']
+    domain_note_global = global_report['domain_note']
 
     st.title(f"🌍 Reporte Global: {resolved_global_domain}")
     if resolved_global_domain != main_domain:
@@ -666,58 +803,44 @@ if current_view == "global":
             if mode == "admin":
                 if st.button(f"Actualizar dominio principal a {resolved_global_domain}", key="update_domain_global"):
                     database.update_project_domain(project_id, resolved_global_domain)
+                    report_engine.rebuild_stale_reports(project_id)
                     st.success("Dominio principal actualizado.")
                     time.sleep(1)
                     safe_rerun()
     st.markdown("Comparativa histórica de todos los datos cargados para este proyecto.")
     
-    n_meses_global = len(all_imports)  # P0.4: Track historical depth
+    n_meses_global = global_report['n_meses']  # P0.4: Track historical depth
     
     # P0.4: Show historical depth in global view
-    if not all_imports.empty:
-        last_month_global = all_imports.iloc[0]['month']
+    if n_meses_global:
+        last_month_global = global_report['last_month']
         st.caption(f"📊 **Histórico**: {n_meses_global} meses | Último mes cargado: {last_month_global}")
     
-    if all_imports.empty:
+    if not n_meses_global:
         st.info("Sube más datos mensuales para desbloquear la vista histórica.")
     else:
-        history_data = []
-        progress_bar = st.progress(0)
-        for i, (_, imp) in enumerate(all_imports.iterrows()):
-            df_month, d_map = database.load_import_data(imp['id'])
-            if not df_month.empty:
-                sov_df = etl.calculate_sov(df_month, d_map, resolved_global_domain)
-                sov_rows = sov_df[sov_df['domain'] == resolved_global_domain]
-                sov = sov_rows['sov'].values[0] if not sov_rows.empty else 0
-                history_data.append({
-                    'Mes': imp['month'],
-                    'SoV': sov,
-                    'Tráfico': df_month[f'clics_{resolved_global_domain}'].sum() if f'clics_{resolved_global_domain}' in df_month.columns else 0,
-                    'Ahorro': df_month[f'media_value_{resolved_global_domain}'].sum() if f'media_value_{resolved_global_domain}' in df_month.columns else 0
-                })
-            progress_bar.progress((i + 1) / len(all_imports))
-        progress_bar.empty()
+        h_df = global_report['history']
+        px = plotly_express()
         
-        if history_data:
-            h_df = pd.DataFrame(history_data).sort_values('Mes')
-            
+        if h_df is not None:
             # --- AI GLOBAL INSIGHTS ---
-            stats_summary = h_df.to_string(index=False)
+            stats_summary = global_report['stats_summary']
             global_insights = database.get_global_report(project_id)
             auto_generate_global = st.session_state.get("pending_ai_global_project_id") == project_id
             generation_error = None
 
             if auto_generate_global:
-                generated = get_global_ai_analysis(project_id, stats_summary, force=True)
-                if generated and not (generated.startswith("⚠️") or generated.startswith("❌")):
-                    database.update_global_report(project_id, generated)
-                    global_insights = generated
-                else:
-                    generation_error = generated or "❌ Error en análisis global."
+                with telemetry.section("global", "ai"):
+                    force_global = st.session_state["force_ai_global_project_id"] == project_id
+                    cached_global, generation_error = get_global_ai_analysis(project_id, stats_summary, force=force_global)
+                if cached_global:
+                    global_insights = cached_global
                 st.session_state["pending_ai_global_project_id"] = None
+                st.session_state["force_ai_global_project_id"] = None
             
             if generation_error:
                 st.warning(generation_error)
+            render_ai_job_status('global', project_id)
 
             if global_insights:
                 st.info(global_insights, icon="🤖")
@@ -730,7 +853,7 @@ if current_view == "global":
             c1, c2, c3 = st.columns(3)
             
             # --- VISIBILIDAD HARDENING (Phase 5) ---
-            vis_stats = utils_metrics.get_visibility_stats(h_df['SoV'])
+            vis_stats = global_report['vis_stats']
             
             # Sync the dataframe with corrected values (for the chart)
             h_df['SoV'] = vis_stats['series']
@@ -777,7 +900,7 @@ if current_view == "global":
                     labels={'SoV': 'Cuota de Visibilidad'}
                 )
                 fig_sov.update_xaxes(type='category')
-                st.plotly_chart(fig_sov, use_container_width=True)
+                show_chart(fig_sov, "sov")
             
             with col_chart2:
                 fig_clics = px.area(
@@ -790,7 +913,23 @@ if current_view == "global":
                     labels={'Tráfico': 'Clics Estimados'}
                 )
                 fig_clics.update_xaxes(type='category')
-                st.plotly_chart(fig_clics, use_container_width=True)
+                show_chart(fig_clics, "traffic")
+            
+            # Corrected SoV trend of every competitor (hardened month × domain matrix)
+            sov_trends = global_report['sov_matrix'].reset_index().melt(
+                id_vars='month', var_name='domain', value_name='sov'
+            ).dropna(subset=['sov'])
+            fig_sov_all = px.line(
+                sov_trends,
+                x='month',
+                y='sov',
+                color='domain',
+                title="Cuota de Visibilidad por Competidor (%)",
+                markers=True,
+                labels={'month': 'Mes', 'sov': 'SoV (%)', 'domain': 'Dominio'}
+            )
+            fig_sov_all.update_xaxes(type='category')
+            show_chart(fig_sov_all, "sov_competitors")
             
             st.subheader("📋 Detalle Histórico")
             st.dataframe(h_df.rename(columns={
@@ -799,6 +938,20 @@ if current_view == "global":
                 'Tráfico': 'Tráfico Est.',
                 'Ahorro': 'Valor Media (€)'
             }))
+
+            # Ranking volatility across months (cross-month analytics query, stored in the snapshot)
+            volatility = global_report['volatility']
+            if volatility is not None and not volatility.empty:
+                st.subheader(f"📉 Keywords más volátiles de {resolved_global_domain}")
+                st.caption("Desviación típica de la posición entre los meses en que la keyword posiciona (mínimo 2 meses).")
+                st.dataframe(volatility[['keyword', 'months', 'avg_position', 'best_position', 'worst_position', 'position_std']].rename(columns={
+                    'keyword': 'Keyword',
+                    'months': 'Meses',
+                    'avg_position': 'Posición Media',
+                    'best_position': 'Mejor',
+                    'worst_position': 'Peor',
+                    'position_std': 'Volatilidad (σ)'
+                }).round(1))
             
             # Export all history
             csv_history = h_df.to_csv(index=False).encode('utf-8')
@@ -809,6 +962,26 @@ if current_view == "global":
                 mime="text/csv"
             )
 
+            # Full project export: streamed from SQLite in chunks, built only when requested
+            with st.expander("📦 Exportación completa del proyecto (todas las keywords × dominios × meses)"):
+                export_format = st.radio("Formato", ["CSV (gzip)", "Parquet"], horizontal=True, key="export_format")
+                export_fmt = "parquet" if export_format == "Parquet" else "csv"
+                if st.button("Preparar exportación", key="prepare_export"):
+                    try:
+                        with st.spinner("Generando exportación por bloques..."):
+                            export_bytes = exports.export_project_bytes(project_id, export_fmt)
+                    except RuntimeError as e:
+                        st.error(str(e))
+                    else:
+                        # Handed straight to the button, never to session_state: the
+                        # payload is released on the next rerun
+                        st.download_button(
+                            label="📥 Descargar exportación completa",
+                            data=export_bytes,
+                            file_name=f"proyecto_seo_{resolved_global_domain}{'.parquet' if export_fmt == 'parquet' else '.csv.gz'}",
+                            mime="application/octet-stream"
+                        )
+
             # --- ZONA DE GESTIÓN GLOBAL ---
             st.markdown("---")
             with st.expander("⚙️ Zona de Gestión Global"):
@@ -818,6 +991,7 @@ if current_view == "global":
                 if global_mngt_pwd == "Webyseo@":
                     if st.button("🔄 Regenerar Análisis Global", key="regen_global_ai", help="Genera un nuevo análisis global bajo demanda."):
                         st.session_state["pending_ai_global_project_id"] = project_id
+                        st.session_state["force_ai_global_project_id"] = project_id
                         database.update_global_report(project_id, None)
                         st.success("Solicitud enviada. El análisis global se generará ahora.")
                         safe_rerun()
@@ -829,123 +1003,57 @@ if current_view == "global":
             st.info("Sube datos para ver el reporte global.")
 
 elif current_view == "monthly" and current_import_id:
-    df, domain_map = database.load_import_data(current_import_id)
-    analysis_month = selected_import_row['month'] if 'selected_import_row' in locals() else "Análisis Reciente"
+    # Shared links and the admin view read the precomputed snapshot (rebuilt at write
+    # time by report_engine.refresh_after_import_change), so reruns and section
+    # switches never run the monthly pipeline
+    with telemetry.section("monthly", "data"):
+        report = report_engine.get_monthly_report_snapshot(current_import_id)
+    analysis_month = report['analysis_month']
     
-    if df.empty:
+    if report['empty']:
         st.error(f"⚠️ No hay palabras clave guardadas para {analysis_month}.")
         st.info("Esto puede ocurrir si la subida anterior falló o el archivo estaba vacío. Por favor, intenta subir el CSV de nuevo para este mes en la barra lateral.")
-        if st.button("Eliminar este registro vacío"):
-            conn = database.get_connection()
-            conn.execute("DELETE FROM imports WHERE id = ?", (current_import_id,))
-            conn.commit()
-            conn.close()
+        if mode == "admin" and st.button("Eliminar este registro vacío"):
+            database.delete_import(current_import_id)
+            report_engine.refresh_after_import_change(project_id)
             safe_rerun()
     else:
-        # Filter for selected project domain (with auto-resolve)
-        selected_domain, domain_note = resolve_main_domain(main_domain, domain_map)
+        df = report['df']
+        domain_map = report['domain_map']
+        selected_domain = report['selected_domain']
+        domain_note = report['domain_note']
         if domain_note:
             st.warning(f"Dominio principal configurado '{main_domain}' no aparece en el CSV. Se usará '{selected_domain}' para los cálculos.")
             if mode == "admin":
                 if st.button(f"Actualizar dominio principal a {selected_domain}"):
                     database.update_project_domain(project_id, selected_domain)
+                    report_engine.rebuild_stale_reports(project_id)
                     st.success("Dominio principal actualizado.")
                     time.sleep(1)
                     safe_rerun()
         
-        # Metrics Calculation
-        sov_df = etl.calculate_sov(df, domain_map, selected_domain)
-        sov_rows = sov_df[sov_df['domain'] == selected_domain]
-        main_sov = sov_rows['sov'].values[0] if not sov_rows.empty else 0
-        opportunities = etl.get_striking_distance(df, domain_map, selected_domain)
-        
-        # --- PHASE 4: INTENT ENRICHMENT ---
-        validated_intents = database.get_validated_intents()
-        
-        def enrich_row(row):
-            kw_norm = intent_rules.normalize_keyword(row['keyword'])
-            # Priority: 1. Validated, 2. Suggested
-            if kw_norm in validated_intents:
-                return validated_intents[kw_norm], "Validada"
-            else:
-                suggestion = intent_rules.infer_intent(row['keyword'])
-                return suggestion['intent_suggested'], "Sugerida"
-
-        intent_results = df.apply(enrich_row, axis=1)
-        df['intent'] = [r[0] for r in intent_results]
-        df['origin_intent'] = [r[1] for r in intent_results]
-        
-        # Also update opportunities DF (it's a subset/copy)
-        if not opportunities.empty:
-            opp_intents = opportunities.apply(enrich_row, axis=1)
-            opportunities['intent'] = [r[0] for r in opp_intents]
-            opportunities['origin_intent'] = [r[1] for r in opp_intents]
-
-        pos_col = domain_map.get(selected_domain, {}).get('position')
-        top_10 = len(df[df[pos_col] <= 10]) if pos_col else 0
-        
-        # Advanced Metrics Totals
-        total_clics = df[f'clics_{selected_domain}'].sum() if f'clics_{selected_domain}' in df.columns else 0
-        total_media_value = df[f'media_value_{selected_domain}'].sum() if f'media_value_{selected_domain}' in df.columns else 0
-
-        # --- MoM TREND CALCULATION + P0.1/P0.4 ENHANCEMENTS ---
-        prev_month_id = None
-        imports_list = database.get_project_imports(project_id)
-        n_meses = len(imports_list)  # P0.4: Track historical depth
-        current_idx = imports_list[imports_list['id'] == current_import_id].index[0]
-        if current_idx + 1 < len(imports_list):
-            prev_month_id = imports_list.iloc[current_idx + 1]['id']
-        
-        delta_sov = None
-        delta_clics = None
-        delta_top3 = None
-        delta_top10 = None
-        risks_count = 0  # P0.1: Keywords with significant drops
-        
-        # Calculate current Top3 and Top10
-        top_3 = len(df[df[pos_col] <= 3]) if pos_col else 0
-        top_10 = len(df[df[pos_col] <= 10]) if pos_col else 0
-        
-        if prev_month_id:
-            df_prev, domain_map_prev = database.load_import_data(prev_month_id)
-            if not df_prev.empty:
-                # Calculate previous SoV
-                sov_df_prev = etl.calculate_sov(df_prev, domain_map_prev, selected_domain)
-                prev_sov = sov_df_prev[sov_df_prev['domain'] == selected_domain]['sov'].values[0] if not sov_df_prev.empty else 0
-                delta_sov = main_sov - prev_sov
-                
-                # Calculate previous Clics
-                prev_clics = df_prev[f'clics_{selected_domain}'].sum() if f'clics_{selected_domain}' in df_prev.columns else 0
-                delta_clics = total_clics - prev_clics
-                
-                # Calculate previous Top3/Top10
-                prev_pos_col = domain_map_prev.get(selected_domain, {}).get('position')
-                if prev_pos_col:
-                    prev_top3 = len(df_prev[df_prev[prev_pos_col] <= 3])
-                    prev_top10 = len(df_prev[df_prev[prev_pos_col] <= 10])
-                    delta_top3 = top_3 - prev_top3
-                    delta_top10 = top_10 - prev_top10
-                    
-                    # P0.1: Calculate Risks (keywords that dropped >=2 positions or left Top10)
-                    # Merge on keyword to compare positions
-                    merged = df.merge(
-                        df_prev[['keyword', prev_pos_col]].rename(columns={prev_pos_col: 'prev_pos'}),
-                        on='keyword',
-                        how='left'
-                    )
-                    # Risk: dropped >=2 positions OR was in Top10 and now isn't
-                    risks_mask = (
-                        ((merged[pos_col] - merged['prev_pos']) >= 2) |  # Dropped 2+ positions
-                        ((merged['prev_pos'] <= 10) & (merged[pos_col] > 10))  # Left Top10
-                    )
-                    risks_count = risks_mask.sum()
+        # Metrics (see report_engine.compute_monthly_report, served from the stored snapshot)
+        sov_df = report['sov_df']
+        main_sov = report['main_sov']
+        opportunities = report['opportunities']
+        pos_col = report['pos_col']
+        top_3 = report['top_3']
+        top_10 = report['top_10']
+        total_clics = report['total_clics']
+        total_media_value = report['total_media_value']
+        delta_sov = report['delta_sov']
+        delta_clics = report['delta_clics']
+        delta_top3 = report['delta_top3']
+        delta_top10 = report['delta_top10']
+        risks_count = report['risks_count']
+        n_meses = report['n_meses']
 
         st.title(f"Dashboard SEO: {selected_domain}")
         if selected_domain != main_domain:
             st.caption(f"Dominio configurado: {main_domain}")
         
         # P0.4: Show historical depth in caption
-        last_month = imports_list.iloc[0]['month'] if not imports_list.empty else "N/A"
+        last_month = report['last_month']
         st.caption(f"📅 Mes de Análisis: **{analysis_month}** | 📊 Histórico: **{n_meses} meses** | Último cargado: {last_month}")
         
         # P0.4: Historical warning
@@ -954,20 +1062,35 @@ elif current_view == "monthly" and current_import_id:
         
         # Panel de Calidad de Datos (now returns CPC coverage for gating)
         cpc_coverage = render_data_quality_panel(df, domain_map)
+        px = plotly_express()
         
-        t1, t2, t3, t4, t5 = st.tabs(["📊 Resumen Ejecutivo", "⚔️ Competencia", "🚀 Oportunidades", "🧠 Inteligencia Avanzada", "🔎 Deep Dive"])
+        # New upload: the AI report is requested whatever section is open
+        report_display = stored_report
+        auto_generate_ai = st.session_state.get("pending_ai_import_id") == current_import_id
+        if auto_generate_ai:
+            stats_str, opps_str = report_engine.monthly_ai_inputs(report)
+            with telemetry.section("monthly", "ai"):
+                force_ai = st.session_state["force_ai_import_id"] == current_import_id
+                cached_report, ai_error = get_ai_analysis(project_id, current_import_id, stats_str, opps_str, analysis_month, force=force_ai)
+            if cached_report:
+                report_display = cached_report
+            if ai_error:
+                st.warning(ai_error)
+            st.session_state["pending_ai_import_id"] = None
+            st.session_state["force_ai_import_id"] = None
+
+        # Lazy sections: unlike st.tabs (which runs all five), only the active one
+        # is computed and rendered; its data is cached (report_engine.get_report_section)
+        active_tab = st.radio(
+            "Sección", list(MONTHLY_TABS), format_func=MONTHLY_TABS.get,
+            horizontal=True, key="monthly_tab", label_visibility="collapsed"
+        )
+        tab_start = time.perf_counter()
         
-        with t1:
+        if active_tab == "resumen":
             st.subheader("💡 Análisis Estratégico")
-            
-            report_display = stored_report
-            auto_generate_ai = st.session_state.get("pending_ai_import_id") == current_import_id
-            if auto_generate_ai:
-                stats_str = f"Dom: {selected_domain}, SoV: {main_sov:.2f}%, Top 10: {top_10}, Clics Est: {total_clics:.0f}, Media Value: {total_media_value:.0f}€"
-                opps_str = opportunities.head(10).to_string(index=False)
-                report_display = get_ai_analysis(current_import_id, stats_str, opps_str, analysis_month)
-                if auto_generate_ai:
-                    st.session_state["pending_ai_import_id"] = None
+
+            render_ai_job_status('monthly', project_id, current_import_id)
 
             if not report_display:
                 report_display = "🤖 Análisis no generado. Sube un CSV nuevo o solicita la regeneración en la zona de gestión (requiere contraseña)."
@@ -1048,6 +1171,29 @@ elif current_view == "monthly" and current_import_id:
                         help="Requiere histórico previo para calcular"
                     )
                     st.caption("Histórico insuficiente")
+
+            if show_deltas:
+                with st.expander("🔍 Movimientos vs mes anterior (riesgos y ganancias)"):
+                    f1, f2, f3 = st.columns(3)
+                    min_drop = f1.number_input("Caída mínima (posiciones)", min_value=1, max_value=50, value=report_engine.RISK_MIN_DROP, key="risk_min_drop")
+                    show_lost_top10 = f2.checkbox("Salida de Top10", value=True, key="risk_lost_top10")
+                    show_gained_top3 = f3.checkbox("Entrada en Top3", value=False, key="risk_gained_top3")
+                    changes_df = database.get_keyword_changes(
+                        current_import_id, selected_domain,
+                        min_drop=min_drop, lost_top10=show_lost_top10, gained_top3=show_gained_top3
+                    )
+                    if changes_df.empty:
+                        st.caption("Sin movimientos con estos criterios.")
+                    else:
+                        st.dataframe(changes_df.rename(columns={
+                            'keyword': 'Palabra Clave',
+                            'position': 'Posición',
+                            'prev_position': 'Posición anterior',
+                            'position_delta': 'Δ Posición',
+                            'clics_delta': 'Δ Tráfico Est.',
+                            'value_delta': 'Δ Valor (€)',
+                            'change_type': 'Tipo'
+                        }), use_container_width=True)
             
             # Ranking Chart
             st.markdown("---")
@@ -1079,27 +1225,24 @@ elif current_view == "monthly" and current_import_id:
                         "20+": "#F44336"
                     }
                 )
-                st.plotly_chart(fig, use_container_width=True)
+                show_chart(fig, "rankings")
 
             # ==========================================
             # TOP 15 KEYWORDS - EVOLUCIÓN VS COMPETENCIA
             # ==========================================
             st.markdown("---")
-            st.markdown("### 🔝 Top 15 Keywords — Evolución vs Competencia")
-            summary_df, evo_df, last_month_top15, top15_reason, metric_label, metric_type = build_top15_evolution(
-                project_id,
-                selected_domain,
-                imports_list
-            )
+            top_n = report_engine.TOP_KEYWORDS_N
+            st.markdown(f"### 🔝 Top {top_n} Keywords — Evolución vs Competencia")
+            summary_df, evo_df, last_month_top15, top15_reason, metric_label, metric_type = report_engine.get_report_section(report, 'top15')
 
             if summary_df is None or summary_df.empty:
                 reason_txt = f" ({top15_reason})" if top15_reason else ""
-                st.info(f"No hay datos suficientes para calcular el Top 15.{reason_txt}")
+                st.info(f"No hay datos suficientes para calcular el Top {top_n}.{reason_txt}")
             else:
                 metric_label = metric_label or "Clics estimados"
                 if metric_type and metric_type != "clicks":
                     st.caption(f"Clics estimados no disponibles; se usa {metric_label.lower()} como métrica.")
-                st.caption(f"Top 15 por {metric_label.lower()} del último mes cargado ({last_month_top15}).")
+                st.caption(f"Top {top_n} por {metric_label.lower()} del último mes cargado ({last_month_top15}).")
                 if metric_type == "clicks":
                     st.caption("Competidor referencia: dominio con más clics por keyword en ese mes.")
                 elif metric_type == "visibility":
@@ -1181,10 +1324,10 @@ elif current_view == "monthly" and current_import_id:
                             markers=True,
                             category_orders={'month': month_order},
                             labels={'month': 'Mes', 'position': 'Posición promedio'},
-                            title="Posición promedio Top 15 (menor es mejor)"
+                            title=f"Posición promedio Top {top_n} (menor es mejor)"
                         )
                         fig_pos.update_yaxes(autorange='reversed')
-                        st.plotly_chart(fig_pos, use_container_width=True)
+                        show_chart(fig_pos, "top_position")
                     else:
                         st.caption("No hay posiciones suficientes para mostrar evolución.")
 
@@ -1197,9 +1340,9 @@ elif current_view == "monthly" and current_import_id:
                             markers=True,
                             category_orders={'month': month_order},
                             labels={'month': 'Mes', 'metric': metric_label or 'Métrica'},
-                            title=f"{metric_label or 'Métrica'} Top 15"
+                            title=f"{metric_label or 'Métrica'} Top {top_n}"
                         )
-                        st.plotly_chart(fig_metric, use_container_width=True)
+                        show_chart(fig_metric, "top_metric")
                     else:
                         if metric_type != "position":
                             st.caption("No hay métrica suficiente para mostrar evolución.")
@@ -1218,28 +1361,35 @@ elif current_view == "monthly" and current_import_id:
                 if mngt_pwd == "Webyseo@":
                     if col1.button("🔄 Regenerar Análisis IA", key=f"regen_ai_{current_import_id}", help="Genera un nuevo análisis bajo demanda."):
                         st.session_state["pending_ai_import_id"] = current_import_id
+                        st.session_state["force_ai_import_id"] = current_import_id
                         st.success("Solicitud enviada. El análisis IA se generará ahora.")
                         safe_rerun()
                     
                     if col2.button("🗑️ Borrar este Mes", help="Elimina permanentemente los datos de este mes para que puedas volver a subirlos."):
-                        conn = database.get_connection()
-                        conn.execute("DELETE FROM imports WHERE id = ?", (current_import_id,))
-                        conn.commit()
-                        conn.close()
+                        database.delete_import(current_import_id)
+                        report_engine.refresh_after_import_change(project_id)
                         st.warning(f"Mes {analysis_month} eliminado del sistema.")
                         safe_rerun()
+
+                    if col1.button("🧹 Compactar Base de Datos", help="Elimina métricas huérfanas y libera el espacio de los meses borrados."):
+                        compact_report = database.compact_database()
+                        st.success(
+                            f"Base de datos compactada: {compact_report['before_bytes'] / 1024 / 1024:.1f} MB → "
+                            f"{compact_report['after_bytes'] / 1024 / 1024:.1f} MB "
+                            f"({compact_report['orphans_removed']} filas huérfanas eliminadas)."
+                        )
                 elif mngt_pwd:
                     st.error("❌ Contraseña incorrecta.")
                 else:
                     st.info("💡 Introduce la contraseña para habilitar los botones de gestión.")
 
-        with t2:
+        elif active_tab == "competencia":
             st.subheader("📊 Comparativa de Mercado")
             
             # Calculate HHI with error handling
             try:
-                if not sov_df.empty and 'sov' in sov_df.columns:
-                    hhi_value, hhi_interpretation, hhi_color = etl.calculate_hhi(sov_df)
+                if report['hhi'] is not None:
+                    hhi_value, hhi_interpretation, hhi_color = report['hhi']
                     
                     # Display HHI
                     col_hhi1, col_hhi2 = st.columns([1, 2])
@@ -1265,36 +1415,8 @@ elif current_view == "monthly" and current_import_id:
             
             # Wrapper for Competitor Analysis with Filters (Phase 6)
             st.markdown("### 🔬 Análisis Granular (Filtros)")
-            selected_keywords_comp = st.multiselect(
-                "Filtrar por Keywords específicas (deja vacío para ver todo el mercado):",
-                options=df['keyword'].unique()
-            )
-            
-            # Recalculate SOV if filter is active
-            display_sov_df = sov_df
-            if selected_keywords_comp:
-                filtered_comp_df = df[df['keyword'].isin(selected_keywords_comp)]
-                if not filtered_comp_df.empty:
-                    display_sov_df = etl.calculate_sov(filtered_comp_df, domain_map, selected_domain)
-                    st.caption(f"Análisis basado en {len(selected_keywords_comp)} keywords seleccionadas.")
-                else:
-                    st.warning("No hay datos para las keywords seleccionadas.")
-
-            # Bar chart Top 10
-            st.markdown("### Top 10 Competidores por Cuota de Visibilidad")
-            top_10 = display_sov_df.head(10)
-            fig_bar = px.bar(
-                top_10,
-                x='sov',
-                y='domain',
-                orientation='h',
-                title="",
-                labels={'sov': 'Cuota de Visibilidad (%)', 'domain': 'Dominio'},
-                color='sov',
-                color_continuous_scale='Blues'
-            )
-            fig_bar.update_layout(showlegend=False, yaxis={'categoryorder':'total ascending'})
-            st.plotly_chart(fig_bar, use_container_width=True)
+            # Options come from the keyword search index (server-side), not the whole month
+            render_competitor_filter(project_id, current_import_id, df, domain_map, selected_domain, sov_df)
             
             # Table with data
             st.markdown("### Datos Detallados")
@@ -1303,7 +1425,7 @@ elif current_view == "monthly" and current_import_id:
                 'visibility_score': 'Puntuación de Visibilidad',
                 'sov': 'Cuota de Mercado (%)'
             })
-            st.dataframe(sov_display)
+            render_paginated_table(sov_display, key="sov_table", default_sort='Cuota de Mercado (%)')
             
             # Pie chart (collapsible)
             with st.expander("📊 Ver Gráfico Circular"):
@@ -1314,9 +1436,9 @@ elif current_view == "monthly" and current_import_id:
                     title="Reparto de Cuota de Mercado (Visibilidad)",
                     labels={'domain': 'Dominio', 'sov': 'Cuota (%)'}
                 )
-                st.plotly_chart(fig_pie, use_container_width=True)
+                show_chart(fig_pie, "sov_pie")
 
-        with t3:
+        elif active_tab == "oportunidades":
             st.subheader("🚀 Matriz de Oportunidades")
             
             # P0.3: Enhanced documentation with Motivo explanation
@@ -1329,16 +1451,6 @@ elif current_view == "monthly" and current_import_id:
                 # Add financial columns if CPC exists
                 opp_display = opportunities.copy()
                 
-                # Format CPC
-                if 'cpc' in opp_display.columns:
-                    opp_display['CPC Est.'] = opp_display['cpc'].apply(lambda x: format_currency(x) if x > 0 else "—")
-                
-                # Format Uplift Value (P0.3: show "—" if null)
-                if 'uplift_value' in opp_display.columns:
-                    opp_display['Uplift Valor'] = opp_display['uplift_value'].apply(
-                        lambda x: format_currency(x) if pd.notnull(x) and x > 0 else "Sin estimación €"
-                    )
-                
                 # Intent badge formatting function
                 def format_intent(val):
                     if pd.isna(val):
@@ -1346,25 +1458,33 @@ elif current_view == "monthly" and current_import_id:
                     if "(V)" in str(val) or val == "Validada":
                         return f"✅ {val}"
                     return f"🤖 {val}"
-                
-                if 'intent' in opp_display.columns:
-                    opp_display['Intención'] = opp_display['intent'].apply(format_intent)
 
-                # Use the dynamic position column name for selection, then rename
-                cols_to_select = ['keyword', pos_col, 'volume', 'difficulty', 'Intención', 'CPC Est.', 'uplift_clicks', 'Uplift Valor', 'motivo', 'opportunity_score']
+                # Raw columns stay numeric (server-side sort); currency/intent
+                # formatting is applied to the visible page only
+                cols_to_select = ['keyword', pos_col, 'volume', 'difficulty', 'intent', 'cpc', 'uplift_clicks', 'uplift_value', 'motivo', 'opportunity_score']
                 # Filter strictly for existing columns to avoid KeyError
                 cols_to_select = [c for c in cols_to_select if c in opp_display.columns]
 
-                st.dataframe(
+                render_paginated_table(
                     opp_display[cols_to_select].rename(columns={
                         'keyword': 'Palabra Clave',
                         pos_col: 'Pos. Actual',
                         'volume': 'Búsquedas/mes',
                         'difficulty': 'Dificultad',
+                        'intent': 'Intención',
+                        'cpc': 'CPC Est.',
                         'uplift_clicks': 'Uplift Tráfico',
+                        'uplift_value': 'Uplift Valor',
                         'motivo': '📊 Motivo',
                         'opportunity_score': 'Score'
-                    })
+                    }),
+                    key="opp_table",
+                    formatters={
+                        'CPC Est.': lambda x: format_currency(x) if x > 0 else "—",
+                        # P0.3: show "—" if null
+                        'Uplift Valor': lambda x: format_currency(x) if pd.notnull(x) and x > 0 else "Sin estimación €",
+                        'Intención': format_intent
+                    }
                 )
                 
                 # Export Button
@@ -1382,7 +1502,7 @@ elif current_view == "monthly" and current_import_id:
                 
             else:
                 st.info("No se encontraron oportunidades 'Quick Win' (Pos 4-10) en este mes.")
-        with t4:
+        elif active_tab == "inteligencia":
             st.subheader("🧠 Inteligencia de Valor y Marca")
             
             # Help section
@@ -1406,14 +1526,13 @@ elif current_view == "monthly" and current_import_id:
                 
                 media_col = f'media_value_{selected_domain}'
                 if media_col in df.columns:
-                    mv_df = df.sort_values(media_col, ascending=False).head(15).copy()
-                    mv_display = mv_df.rename(columns={
+                    mv_display = df[['keyword', 'volume', 'cpc', media_col]].rename(columns={
                         'keyword': 'Palabra Clave',
                         'volume': 'Búsquedas',
                         'cpc': 'Coste Clic (Ads)',
                         media_col: 'Ahorro Estimado'
                     })
-                    st.dataframe(mv_display[['Palabra Clave', 'Búsquedas', 'Coste Clic (Ads)', 'Ahorro Estimado']])
+                    render_paginated_table(mv_display, key="mv_table", default_sort='Ahorro Estimado', compact=True)
                 else:
                     st.warning("No se encontraron datos de valor económico (media value) para este dominio.")
             
@@ -1435,11 +1554,11 @@ elif current_view == "monthly" and current_import_id:
                         color='is_branded',
                         color_discrete_sequence=['#1E88E5', '#D81B60']
                     )
-                    st.plotly_chart(fig_brand, use_container_width=True)
+                    show_chart(fig_brand, "brand")
                 else:
                     st.info("Desglose Marca/Genérico no disponible (faltan datos).")
 
-        with t5:
+        elif active_tab == "deep_dive":
             st.subheader("🔎 Keyword Deep Dive (Evolución por Palabra)")
             st.markdown("Analiza la historia de una keyword específica a través de todos los meses cargados.")
             
@@ -1447,78 +1566,15 @@ elif current_view == "monthly" and current_import_id:
             if n_meses < 3:
                 st.info(f"📊 Histórico limitado ({n_meses} meses). Para análisis de tendencia robusto, se recomiendan ≥3 meses.")
             
-            all_keywords = sorted(df['keyword'].unique())
-            selected_kw_dive = st.selectbox("Selecciona una palabra clave:", all_keywords)
-            
-            if selected_kw_dive:
-                import json
-                kw_history_df = database.get_keyword_history(project_id, selected_kw_dive)
-                
-                # Get current keyword data for context messages (P0.5)
-                kw_current_row = df[df['keyword'] == selected_kw_dive]
-                current_pos = kw_current_row[pos_col].values[0] if pos_col and not kw_current_row.empty else None
-                current_traffic = kw_current_row[f'clics_{selected_domain}'].values[0] if f'clics_{selected_domain}' in kw_current_row.columns and not kw_current_row.empty else 0
-                current_value = kw_current_row[f'media_value_{selected_domain}'].values[0] if f'media_value_{selected_domain}' in kw_current_row.columns and not kw_current_row.empty else 0
-                
-                # P0.5: Context message for 0€/0 traffic or zero value
-                if current_traffic == 0 or current_value == 0:
-                    st.warning(
-                        "💡 **Potencial latente**. Esta keyword aún está fuera del rango de captación significativa. "
-                        "Prioriza subir 1–2 posiciones para comenzar a captar tráfico."
-                    )
-                
-                # P0.5: Striking distance badge
-                if current_pos and 4 <= current_pos <= 10:
-                    st.success(f"🎯 **Striking Distance** (Posición {current_pos:.0f}): Esta keyword está en zona de ataque. Un pequeño impulso puede generar gran impacto.")
-                elif current_pos and current_pos <= 3:
-                    st.info(f"🏆 **Top 3** (Posición {current_pos:.0f}): Esta keyword ya está capturando tráfico significativo.")
-                
-                if not kw_history_df.empty:
-                    # Parse domain data json
-                    history_parsed = []
-                    for _, row in kw_history_df.iterrows():
-                        d_data = json.loads(row['data_json'])
-                        main_d_data = d_data.get(selected_domain, {})
-                        history_parsed.append({
-                            'Mes': row['month'],
-                            'Posición': main_d_data.get('pos', 101),
-                            'Tráfico Est.': main_d_data.get('clics', 0),
-                            'Valor (€)': main_d_data.get('media_value', 0),
-                            'CPC': row['cpc']
-                        })
-                    
-                    hp_df = pd.DataFrame(history_parsed)
-                    
-                    # Metrics Delta
-                    if len(hp_df) >= 2:
-                        last = hp_df.iloc[-1]
-                        prev = hp_df.iloc[-2]
-                        
-                        k1, k2, k3 = st.columns(3)
-                        
-                        # Position (Lower is better)
-                        pos_delta = last['Posición'] - prev['Posición']
-                        
-                        k1.metric("Posición Actual", f"{last['Posición']:.0f}", delta=f"{pos_delta:.0f}", delta_color="inverse")
-                        k2.metric("Tráfico Est.", f"{last['Tráfico Est.']:.0f}", delta=f"{last['Tráfico Est.'] - prev['Tráfico Est.']:.0f}")
-                        k3.metric("Valor (€)", f"{last['Valor (€)']:.2f}€", delta=f"{last['Valor (€)'] - prev['Valor (€)']:.2f}€")
-                    else:
-                        # Only 1 month of data
-                        last = hp_df.iloc[-1]
-                        k1, k2, k3 = st.columns(3)
-                        k1.metric("Posición Actual", f"{last['Posición']:.0f}")
-                        k2.metric("Tráfico Est.", f"{last['Tráfico Est.']:.0f}")
-                        k3.metric("Valor (€)", f"{last['Valor (€)']:.2f}€")
-                        st.caption("Sin comparativa disponible (solo 1 mes de datos).")
-                    
-                    # Chart
-                    fig_kw = px.line(hp_df, x='Mes', y='Posición', markers=True, title=f"Evolución de Posición: {selected_kw_dive}")
-                    fig_kw['layout']['yaxis']['autorange'] = "reversed" # 1 is top
-                    st.plotly_chart(fig_kw, use_container_width=True)
-                    
-                    st.dataframe(hp_df)
-                else:
-                    st.warning("No hay histórico suficiente para esta keyword.")
+            render_keyword_deep_dive(project_id, current_import_id, df, pos_col, selected_domain)
+
+        telemetry.record("monthly", f"tab:{active_tab}", time.perf_counter() - tab_start)
+
+elif current_view == "portfolio":
+    render_portfolio_page()
+
+elif current_view == "telemetry":
+    render_telemetry_page()
 
 else:
     st.info("👋 Bienvenido. Selecciona un proyecto y un mes en la barra lateral para comenzar.")
@@ -1526,3 +1582,15 @@ else:
         st.success("✅ IA Configurada y lista.")
     else:
         st.warning("⚠️ IA Deshabilitada (Falta API Key).")
+
+# Rerun latency per view (reruns cut short by st.stop / st.rerun are not counted)
+if current_view != "telemetry":
+    telemetry.record(current_view, "total", time.perf_counter() - _rerun_start)
+telemetry.flush()
+
+if _profiler is not None:
+    st.session_state.pop("active_profiler", None)
+    st.session_state["profile_report"] = profiling.stop(_profiler, current_view)
+    st.markdown("---")
+    st.subheader("🔬 Perfil de este rerun")
+    render_profile_report(st.session_state["profile_report"], key="profile_download")
@@ -0,0 +1,108 @@
+"""
+Headless batch reporting: runs the monthly and global report pipelines
+(report_engine) for every project and import outside Streamlit and stores
+the results (MoM diffs, history cube, monthly snapshots and report sections,
+global snapshots) so the dashboard serves them without recomputing. Projects
+run in parallel in a process pool; the imports of one project run in order
+inside one worker.
+
+Usage:
+    python batch_reports.py                      # every project, valid snapshots kept
+    python batch_reports.py --project-id 3 --force
+    python batch_reports.py --workers 8 --ai     # also queue missing AI reports
+
+Queued AI reports are generated by `python ai_reports.py`.
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import ai_reports
+import database
+import report_engine
+
+
+def _init_worker(db_path):
+    database.DB_PATH = db_path
+
+
+def process_project(project_id, force=False, ai=False):
+    """
+    Runs every pipeline of one project. Returns a summary dict:
+    project_id, imports, snapshots_built, ai_queued, seconds.
+    """
+    start = time.perf_counter()
+    project_id = int(project_id)
+    imports_list = database.get_project_imports(project_id)
+    summary = {'project_id': project_id, 'imports': len(imports_list), 'snapshots_built': 0, 'ai_queued': 0}
+
+    # Rebuilds whatever earlier writes invalidated
+    summary['snapshots_built'] += report_engine.refresh_after_import_change(project_id)
+
+    # Oldest first: each month's deltas only depend on the previous one
+    for _, imp in imports_list.sort_values('month').iterrows():
+        import_id = int(imp['id'])
+        report = None if force else report_engine.load_import_snapshot(import_id)
+        if report is None:
+            report = report_engine.build_import_snapshot(import_id)
+            summary['snapshots_built'] += 1
+        if report is not None and not report['empty']:
+            for section in report_engine.REPORT_SECTIONS:
+                report_engine.get_report_section(report, section, rebuild=force)
+        has_report = isinstance(imp['report_text'], str) and imp['report_text'].strip()
+        if ai and report is not None and not report['empty'] and not has_report:
+            stats_str, opps_str = report_engine.monthly_ai_inputs(report)
+            if ai_reports.request_monthly_report(project_id, import_id, stats_str, opps_str, imp['month']) is None:
+                summary['ai_queued'] += 1
+
+    global_report = report_engine.build_global_snapshot(project_id) if force else report_engine.get_global_report_snapshot(project_id)
+    if ai and global_report and global_report['stats_summary'] and not database.get_global_report(project_id):
+        if ai_reports.request_global_report(project_id, global_report['stats_summary']) is None:
+            summary['ai_queued'] += 1
+
+    summary['seconds'] = round(time.perf_counter() - start, 2)
+    return summary
+
+
+def run(project_ids=None, workers=None, force=False, ai=False):
+    """Processes the given projects (default: all) in a process pool. Returns the list of summaries"""
+    database.init_db()
+    if project_ids is None:
+        project_ids = [int(p) for p in database.get_projects()['id']]
+
+    summaries = []
+    db_path = os.path.abspath(database.DB_PATH)
+    # spawn, not fork: a forked child would inherit the database writer executor
+    # without its thread and block on its first write
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(db_path,)) as pool:
+        futures = {pool.submit(process_project, pid, force, ai): pid for pid in project_ids}
+        for future in as_completed(futures):
+            try:
+                summary = future.result()
+            except Exception as e:
+                print(f"Project {futures[future]}: failed ({e})")
+                continue
+            summaries.append(summary)
+            print(
+                f"Project {summary['project_id']}: {summary['imports']} imports, "
+                f"{summary['snapshots_built']} snapshots built, {summary['ai_queued']} AI reports queued "
+                f"in {summary['seconds']}s"
+            )
+    return summaries
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--project-id", type=int, action="append", help="Project to process (repeatable; default: all)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="Rebuild snapshots even if they are up to date")
+    parser.add_argument("--ai", action="store_true", help="Queue AI reports for months/projects without one")
+    parser.add_argument("--db", default=database.DB_PATH, help="SQLite database file")
+    args = parser.parse_args()
+    database.DB_PATH = args.db
+    start = time.perf_counter()
+    results = run(args.project_id, args.workers, args.force, args.ai)
+    print(f"Processed {len(results)} projects in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+import database
+
+DOMAINS = ["midominio.com", "competidor.com"]
+
+
+def import_frame(keywords, offset=0, positions=None):
+    """
+    CSV-like import (as etl.parse_csv_data returns it) for DOMAINS. positions
+    overrides the main domain's positions; otherwise they rotate with offset.
+    """
+    df = pd.DataFrame({
+        'keyword': keywords,
+        'volume': [100 * (i + 1) for i in range(len(keywords))],
+        'difficulty': 10,
+        'cpc': 1.5,
+        'intent': 'N/D'
+    })
+    for d, domain in enumerate(DOMAINS):
+        df[f"Posición [{domain}]"] = [(i + offset + d) % 20 + 1 for i in range(len(keywords))]
+        df[f"Visibilidad [{domain}]"] = [float(i + offset + d) for i in range(len(keywords))]
+    if positions is not None:
+        df[f"Posición [{DOMAINS[0]}]"] = positions
+    return df, {domain: {'position': f"Posición [{domain}]", 'visibility': f"Visibilidad [{domain}]"} for domain in DOMAINS}
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Fresh database (and history cubes) under tmp_path, analytics on SQLite (test_analytics_engine covers DuckDB)"""
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "seo.db"))
+    monkeypatch.setattr(database, "ANALYTICS_ENGINE", "sqlite")
+    database.init_db()
+    return tmp_path
+
+
+@pytest.fixture
+def save_month():
+    """save_month(project_id, month, keywords, offset=0, positions=None) -> import_id"""
+    def save(project_id, month, keywords, offset=0, positions=None):
+        df, domain_map = import_frame(keywords, offset, positions)
+        return database.save_import_data(project_id, month, "test.csv", df, domain_map)
+    return save
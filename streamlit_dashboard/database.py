@@ -1,19 +1,123 @@
 import sqlite3
+import numpy as np
 import pandas as pd
 import json
 import os
+import time
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import intent_rules
 
 DB_PATH = "seo_dashboard_v2.db"
 
+KEYWORD_METRICS_DDL = """
+    CREATE TABLE {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        import_id INTEGER NOT NULL,
+        keyword_id INTEGER NOT NULL, -- keywords.id (per-project dictionary)
+        volume INTEGER,
+        difficulty INTEGER,
+        intent TEXT,
+        cpc REAL,
+        data_json TEXT, -- Stores positions and visibility for all domains as JSON
+        FOREIGN KEY (import_id) REFERENCES imports (id) ON DELETE CASCADE,
+        FOREIGN KEY (keyword_id) REFERENCES keywords (id)
+    )
+"""
+
+# Cross-month analytics engine: "auto" uses DuckDB over this same SQLite file
+# when the duckdb package (and its sqlite extension) is available, otherwise
+# the aggregations run in SQLite itself. "sqlite" / "duckdb" force one.
+ANALYTICS_ENGINE = os.environ.get("SEO_ANALYTICS_ENGINE", "auto")
+
+# Concurrency model: the database runs in WAL mode, so readers never wait for
+# the writer (and vice versa). Every write goes through one writer thread per
+# process (@serialized_write), retried with backoff if another process holds
+# the lock longer than the busy timeout.
+BUSY_TIMEOUT_SECONDS = 30
+WRITE_RETRIES = 5
+WRITE_RETRY_BASE_SECONDS = 0.2
+WRITER_THREAD_PREFIX = "sqlite-writer"
+
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix=WRITER_THREAD_PREFIX)
+
 def get_connection():
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_SECONDS)
     conn.row_factory = sqlite3.Row
+    # SQLite leaves FK enforcement off per connection; cascades need it on
+    conn.execute("PRAGMA foreign_keys = ON")
+    # Safe with WAL and avoids an fsync per commit
+    conn.execute("PRAGMA synchronous = NORMAL")
     return conn
 
-def init_db():
-    """Initializes the database schema"""
-    conn = get_connection()
+def _is_locked_error(e):
+    return isinstance(e, sqlite3.OperationalError) and ("locked" in str(e) or "busy" in str(e))
+
+def _run_with_retries(fn, *args, **kwargs):
+    for attempt in range(WRITE_RETRIES):
+        try:
+            return fn(*args, **kwargs)
+        except sqlite3.OperationalError as e:
+            if not _is_locked_error(e) or attempt == WRITE_RETRIES - 1:
+                raise
+            wait = WRITE_RETRY_BASE_SECONDS * 2 ** attempt
+            print(f"Database locked in {fn.__name__}, retrying in {wait:.1f}s ({attempt + 1}/{WRITE_RETRIES})")
+            time.sleep(wait)
+
+def serialized_write(fn):
+    """Runs the decorated write on the single writer thread, retrying on 'database is locked'"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if threading.current_thread().name.startswith(WRITER_THREAD_PREFIX):
+            # Nested write (already on the writer thread): run inline
+            return fn(*args, **kwargs)
+        return _writer.submit(_run_with_retries, fn, *args, **kwargs).result()
+    return wrapper
+
+# Request-scoped metadata memo: within one request (a Streamlit rerun, opened
+# with begin_request) projects and imports are read from SQLite once and then
+# served from memory. Any write touching them bumps a process-wide generation,
+# which makes every memoized copy stale.
+_request_memo = threading.local()
+_metadata_generation = 0
+_generation_lock = threading.Lock()
+
+def begin_request():
+    """Starts a new request scope for the calling thread, discarding previously memoized metadata"""
+    _request_memo.data = {}
+
+def _bump_metadata_generation():
+    global _metadata_generation
+    with _generation_lock:
+        _metadata_generation += 1
+
+def _memoized(key, load):
+    memo = getattr(_request_memo, 'data', None)
+    if memo is None:
+        # Outside a request scope (CLI, workers): always read
+        return load()
+    entry = memo.get(key)
+    if entry is None or entry[0] != _metadata_generation:
+        generation = _metadata_generation
+        entry = (generation, load())
+        memo[key] = entry
+    # Callers get their own copy so they cannot alter the memo
+    return entry[1].copy()
+
+def _migrate_baseline(conn):
+    """
+    Schema version 1: every table and index up to the introduction of schema
+    versioning. Idempotent, so databases created before versioning (user_version 0)
+    are brought up to date by the same statements.
+    """
     cursor = conn.cursor()
+
+    # Lets deleted pages be reclaimed by compact_database() (only effective
+    # immediately on a fresh file; existing files switch on their first VACUUM)
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    # Persistent: readers keep working from the last commit while an upload writes
+    cursor.execute("PRAGMA journal_mode = WAL")
     
     # Projects table
     cursor.execute("""
@@ -49,20 +153,36 @@ def init_db():
     except Exception as e:
         print(f"Warning: Could not create unique index on imports table. It might already exist or there's an issue: {e}")
     
-    # Keywords & Metrics table (Denormalized for performance in this MVP)
+    # Per-project keyword dictionary: each keyword text is stored once and
+    # referenced by integer id from every monthly import
     cursor.execute("""
-    CREATE TABLE IF NOT EXISTS keyword_metrics (
+    CREATE TABLE IF NOT EXISTS keywords (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        import_id INTEGER NOT NULL,
+        project_id INTEGER NOT NULL,
         keyword TEXT NOT NULL,
-        volume INTEGER,
-        difficulty INTEGER,
-        intent TEXT,
-        cpc REAL,
-        data_json TEXT, -- Stores positions and visibility for all domains as JSON
-        FOREIGN KEY (import_id) REFERENCES imports (id)
+        keyword_norm TEXT NOT NULL, -- intent_rules.normalize_keyword(keyword)
+        UNIQUE (project_id, keyword),
+        FOREIGN KEY (project_id) REFERENCES projects (id) ON DELETE CASCADE
     )
     """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_keywords_norm ON keywords(keyword_norm)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_keywords_project_norm ON keywords(project_id, keyword_norm)")
+    _init_keyword_search(cursor)
+
+    # Keywords & Metrics table (Denormalized for performance in this MVP)
+    cursor.execute(KEYWORD_METRICS_DDL.format(table="IF NOT EXISTS keyword_metrics"))
+
+    # Older databases store the keyword text per row and/or lack ON DELETE CASCADE:
+    # rebuild the table once, interning keywords and dropping orphaned rows
+    cursor.execute("PRAGMA table_info(keyword_metrics)")
+    metrics_cols = [row[1] for row in cursor.fetchall()]
+    cursor.execute("PRAGMA foreign_key_list(keyword_metrics)")
+    metrics_fks = cursor.fetchall()
+    if "keyword_id" not in metrics_cols or any(fk['table'] == 'imports' and fk['on_delete'] != 'CASCADE' for fk in metrics_fks):
+        _rebuild_keyword_metrics(conn, metrics_cols)
+
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_metrics_import ON keyword_metrics(import_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_metrics_keyword ON keyword_metrics(keyword_id, import_id)")
     
     # NEW: Keyword Intent persistence table (Phase 4)
     cursor.execute("""
@@ -75,15 +195,297 @@ def init_db():
     )
     """)
     
-    conn.commit()
+    # Precomputed monthly report per import, read by shared links
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS import_snapshots (
+        import_id INTEGER PRIMARY KEY,
+        project_id INTEGER NOT NULL,
+        version INTEGER NOT NULL,
+        payload BLOB NOT NULL, -- zlib-compressed pickle of report_engine.compute_monthly_report()
+        built_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (import_id) REFERENCES imports (id) ON DELETE CASCADE
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_project ON import_snapshots(project_id)")
+
+    # Precomputed global (cross-month) report per project
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS project_snapshots (
+        project_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL,
+        payload BLOB NOT NULL, -- zlib-compressed pickle of report_engine.compute_global_report()
+        built_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (project_id) REFERENCES projects (id) ON DELETE CASCADE
+    )
+    """)
+
+    # Stored month-over-month diffs: one header per import (which previous import
+    # it was compared to) and per keyword×domain deltas
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS import_diffs (
+        import_id INTEGER PRIMARY KEY,
+        prev_import_id INTEGER, -- NULL for the first month of a project
+        computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (import_id) REFERENCES imports (id) ON DELETE CASCADE,
+        FOREIGN KEY (prev_import_id) REFERENCES imports (id) ON DELETE CASCADE
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS keyword_diffs (
+        import_id INTEGER NOT NULL,
+        domain TEXT NOT NULL,
+        keyword_id INTEGER NOT NULL,
+        position INTEGER,
+        prev_position INTEGER,
+        position_delta INTEGER, -- position - prev_position (positive = dropped)
+        clics_delta REAL,
+        value_delta REAL,
+        PRIMARY KEY (import_id, domain, keyword_id),
+        FOREIGN KEY (import_id) REFERENCES import_diffs (import_id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+    """)
+
+    # Background AI report queue (status: queued | running | done | failed)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS ai_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL, -- 'monthly' (import report) | 'global' (project report)
+        project_id INTEGER NOT NULL,
+        import_id INTEGER,
+        model_name TEXT NOT NULL,
+        prompt TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        error TEXT,
+        attempts INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP,
+        FOREIGN KEY (project_id) REFERENCES projects (id) ON DELETE CASCADE,
+        FOREIGN KEY (import_id) REFERENCES imports (id) ON DELETE CASCADE
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ai_jobs_status ON ai_jobs(status, id)")
+    cursor.execute("PRAGMA table_info(ai_jobs)")
+    job_cols = [row[1] for row in cursor.fetchall()]
+    if "cache_key" not in job_cols:
+        cursor.execute("ALTER TABLE ai_jobs ADD COLUMN cache_key TEXT")
+    if "partial_text" not in job_cols:
+        # Streamed text received so far while the job is running
+        cursor.execute("ALTER TABLE ai_jobs ADD COLUMN partial_text TEXT")
+
+    # Content-addressed AI response cache (key = hash of model, prompt version and inputs)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS ai_cache (
+        cache_key TEXT PRIMARY KEY,
+        model_name TEXT NOT NULL,
+        response_text TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        expires_at REAL NOT NULL -- unix epoch seconds
+    )
+    """)
+
+def _migrate_render_timings(conn):
+    """Schema version 2: render latency samples (telemetry.py)"""
+    cursor = conn.cursor()
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS render_timings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        recorded_at REAL NOT NULL, -- unix epoch seconds
+        release TEXT NOT NULL, -- telemetry.current_release() of the process that rendered
+        view TEXT NOT NULL, -- 'global' | 'monthly' | ...
+        section TEXT NOT NULL, -- 'data', 'ai', 'tab:...', 'chart:...', 'total'
+        seconds REAL NOT NULL
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_render_timings_time ON render_timings(recorded_at)")
+
+def _migrate_report_sections(conn):
+    """Schema version 3: monthly report parts computed on demand (report_engine.get_report_section)"""
+    cursor = conn.cursor()
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS report_sections (
+        import_id INTEGER NOT NULL,
+        section TEXT NOT NULL, -- report_engine.REPORT_SECTIONS key
+        project_id INTEGER NOT NULL,
+        version INTEGER NOT NULL,
+        payload BLOB NOT NULL, -- zlib-compressed pickle
+        built_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (import_id, section),
+        FOREIGN KEY (import_id) REFERENCES imports (id) ON DELETE CASCADE
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_report_sections_project ON report_sections(project_id)")
+
+def _migrate_import_domain_totals(conn):
+    """Schema version 4: per import × domain totals (portfolio view), backfilled for existing imports"""
+    cursor = conn.cursor()
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS import_domain_totals (
+        import_id INTEGER NOT NULL,
+        domain TEXT NOT NULL,
+        visibility REAL NOT NULL,
+        clics REAL NOT NULL,
+        media_value REAL NOT NULL,
+        ranked INTEGER NOT NULL,
+        top3 INTEGER NOT NULL,
+        top10 INTEGER NOT NULL,
+        sov REAL NOT NULL, -- % of the import's total visibility
+        PRIMARY KEY (import_id, domain),
+        FOREIGN KEY (import_id) REFERENCES imports (id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+    """)
+    _store_import_totals(cursor)
+
+def _migrate_ai_job_heartbeat(conn):
+    """Schema version 5: liveness of running AI jobs (only stale ones are requeued)"""
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA table_info(ai_jobs)")
+    if "heartbeat_at" not in [row[1] for row in cursor.fetchall()]:
+        # unix epoch seconds, refreshed by the worker while it runs the job
+        cursor.execute("ALTER TABLE ai_jobs ADD COLUMN heartbeat_at REAL")
+
+def _migrate_import_data_version(conn):
+    """Schema version 6: per-import content version, bumped on every (re-)upload (history cube sync)"""
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA table_info(imports)")
+    if "data_version" not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE imports ADD COLUMN data_version INTEGER NOT NULL DEFAULT 1")
+
+# Ordered schema migrations: (version, function). A schema change (table, column,
+# index) is a new function appended here with the next version number; never edit
+# one that has shipped. init_db runs the ones above PRAGMA user_version.
+MIGRATIONS = [
+    (1, _migrate_baseline),
+    (2, _migrate_render_timings),
+    (3, _migrate_report_sections),
+    (4, _migrate_import_domain_totals),
+    (5, _migrate_ai_job_heartbeat),
+    (6, _migrate_import_data_version),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+@serialized_write
+def init_db():
+    """Brings the database schema up to SCHEMA_VERSION (no DDL if it already is)"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    current = cursor.execute("PRAGMA user_version").fetchone()[0]
+    if current > SCHEMA_VERSION:
+        print(f"Warning: database schema version {current} is newer than this code ({SCHEMA_VERSION}).")
+    for version, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        migrate(conn)
+        cursor.execute(f"PRAGMA user_version = {int(version)}")
+        conn.commit()
+        print(f"Database schema migrated to version {version}")
     conn.close()
 
+_initialized_paths = set()
+_init_lock = threading.Lock()
+
+def ensure_db():
+    """Runs init_db once per process and database file (Streamlit reruns skip it)"""
+    path = os.path.abspath(DB_PATH)
+    with _init_lock:
+        if path not in _initialized_paths:
+            init_db()
+            _initialized_paths.add(path)
+
+def _rebuild_keyword_metrics(conn, old_cols):
+    """
+    Recreates keyword_metrics with the current schema (keyword_id + cascading FK),
+    keeping only rows whose import still exists.
+    """
+    cursor = conn.cursor()
+    conn.create_function("normalize_keyword", 1, intent_rules.normalize_keyword)
+    cursor.execute("DROP INDEX IF EXISTS idx_metrics_import")
+    cursor.execute("DROP INDEX IF EXISTS idx_metrics_keyword")
+    cursor.execute("ALTER TABLE keyword_metrics RENAME TO keyword_metrics_old")
+    cursor.execute(KEYWORD_METRICS_DDL.format(table="keyword_metrics"))
+
+    if "keyword_id" in old_cols:
+        cursor.execute("""
+            INSERT INTO keyword_metrics (id, import_id, keyword_id, volume, difficulty, intent, cpc, data_json)
+            SELECT id, import_id, keyword_id, volume, difficulty, intent, cpc, data_json
+            FROM keyword_metrics_old
+            WHERE import_id IN (SELECT id FROM imports)
+        """)
+    else:
+        # Legacy layout: keyword text on every row -> intern into the dictionary
+        cursor.execute("""
+            INSERT OR IGNORE INTO keywords (project_id, keyword, keyword_norm)
+            SELECT DISTINCT i.project_id, km.keyword, normalize_keyword(km.keyword)
+            FROM keyword_metrics_old km
+            JOIN imports i ON km.import_id = i.id
+        """)
+        cursor.execute("""
+            INSERT INTO keyword_metrics (id, import_id, keyword_id, volume, difficulty, intent, cpc, data_json)
+            SELECT km.id, km.import_id, k.id, km.volume, km.difficulty, km.intent, km.cpc, km.data_json
+            FROM keyword_metrics_old km
+            JOIN imports i ON km.import_id = i.id
+            JOIN keywords k ON k.project_id = i.project_id AND k.keyword = km.keyword
+        """)
+    kept = cursor.rowcount
+    dropped = cursor.execute("SELECT COUNT(*) FROM keyword_metrics_old").fetchone()[0] - kept
+    cursor.execute("DROP TABLE keyword_metrics_old")
+    print(f"keyword_metrics rebuilt ({kept} rows kept, {dropped} orphaned rows removed)")
+
+def _init_keyword_search(cursor):
+    """
+    Trigram FTS5 index over keywords.keyword_norm (substring / prefix search), kept in
+    sync with the keywords table by triggers. Skipped if SQLite lacks FTS5/trigram:
+    search_keywords then falls back to LIKE.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'keywords_fts'")
+    exists = cursor.fetchone() is not None
+    try:
+        cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS keywords_fts USING fts5(
+            keyword_norm, content='keywords', content_rowid='id', tokenize='trigram'
+        )
+        """)
+    except sqlite3.OperationalError as e:
+        print(f"Warning: keyword search index unavailable ({e}); using LIKE search.")
+        return
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS keywords_fts_ai AFTER INSERT ON keywords BEGIN
+        INSERT INTO keywords_fts (rowid, keyword_norm) VALUES (new.id, new.keyword_norm);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS keywords_fts_ad AFTER DELETE ON keywords BEGIN
+        INSERT INTO keywords_fts (keywords_fts, rowid, keyword_norm) VALUES ('delete', old.id, old.keyword_norm);
+    END
+    """)
+    cursor.execute("""
+    CREATE TRIGGER IF NOT EXISTS keywords_fts_au AFTER UPDATE ON keywords BEGIN
+        INSERT INTO keywords_fts (keywords_fts, rowid, keyword_norm) VALUES ('delete', old.id, old.keyword_norm);
+        INSERT INTO keywords_fts (rowid, keyword_norm) VALUES (new.id, new.keyword_norm);
+    END
+    """)
+    if not exists:
+        # Index the keywords already stored
+        cursor.execute("INSERT INTO keywords_fts (keywords_fts) VALUES ('rebuild')")
+
+def _intern_keywords(cursor, project_id, keywords):
+    """Adds missing keywords to the project dictionary. Returns {keyword: keyword_id}"""
+    unique_kws = set(keywords)
+    cursor.executemany(
+        "INSERT OR IGNORE INTO keywords (project_id, keyword, keyword_norm) VALUES (?, ?, ?)",
+        [(project_id, kw, intent_rules.normalize_keyword(kw)) for kw in unique_kws]
+    )
+    cursor.execute("SELECT id, keyword FROM keywords WHERE project_id = ?", (project_id,))
+    return {r['keyword']: r['id'] for r in cursor.fetchall() if r['keyword'] in unique_kws}
+
+@serialized_write
 def save_project(name, main_domain):
     conn = get_connection()
     try:
         cursor = conn.cursor()
         cursor.execute("INSERT INTO projects (name, main_domain) VALUES (?, ?)", (name, main_domain))
         conn.commit()
+        _bump_metadata_generation()
         return cursor.lastrowid
     except sqlite3.IntegrityError:
         cursor.execute("SELECT id FROM projects WHERE name = ?", (name,))
@@ -91,18 +493,23 @@ def save_project(name, main_domain):
     finally:
         conn.close()
 
+@serialized_write
 def update_project_domain(project_id, main_domain):
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("UPDATE projects SET main_domain = ? WHERE id = ?", (main_domain, project_id))
+    _invalidate_snapshots(cursor, project_id)
     conn.commit()
+    _bump_metadata_generation()
     conn.close()
 
 def get_projects():
-    conn = get_connection()
-    df = pd.read_sql_query("SELECT * FROM projects", conn)
-    conn.close()
-    return df
+    def load():
+        conn = get_connection()
+        df = pd.read_sql_query("SELECT * FROM projects", conn)
+        conn.close()
+        return df
+    return _memoized(('projects',), load)
 
 def get_global_report(project_id):
     conn = get_connection()
@@ -112,13 +519,48 @@ def get_global_report(project_id):
     conn.close()
     return row[0] if row else None
 
+@serialized_write
 def update_global_report(project_id, text):
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("UPDATE projects SET global_report_text = ? WHERE id = ?", (text, project_id))
     conn.commit()
+    _bump_metadata_generation()
     conn.close()
 
+# Same aggregates as get_domain_month_totals, stored per import when it is saved
+_IMPORT_TOTALS_SQL = """
+    INSERT INTO import_domain_totals (import_id, domain, visibility, clics, media_value, ranked, top3, top10, sov)
+    SELECT import_id, domain,
+           SUM(visibility), SUM(clics), SUM(media_value),
+           SUM(CASE WHEN position > 0 THEN 1 ELSE 0 END),
+           SUM(CASE WHEN position BETWEEN 1 AND 3 THEN 1 ELSE 0 END),
+           SUM(CASE WHEN position BETWEEN 1 AND 10 THEN 1 ELSE 0 END),
+           CASE WHEN SUM(SUM(visibility)) OVER (PARTITION BY import_id) > 0
+                THEN SUM(visibility) * 100.0 / SUM(SUM(visibility)) OVER (PARTITION BY import_id)
+                ELSE 0 END
+    FROM (
+        SELECT km.import_id, je.key AS domain,
+               CAST(json_extract(je.value, '$.pos') AS REAL) AS position,
+               COALESCE(json_extract(je.value, '$.vis'), 0) AS visibility,
+               COALESCE(json_extract(je.value, '$.clics'), 0) AS clics,
+               COALESCE(json_extract(je.value, '$.media_value'), 0) AS media_value
+        FROM keyword_metrics km, json_each(km.data_json) je
+        {where}
+    )
+    GROUP BY import_id, domain
+"""
+
+def _store_import_totals(cursor, import_id=None):
+    """(Re)computes import_domain_totals for one import, or for every import"""
+    if import_id is None:
+        cursor.execute("DELETE FROM import_domain_totals")
+        cursor.execute(_IMPORT_TOTALS_SQL.format(where=""))
+    else:
+        cursor.execute("DELETE FROM import_domain_totals WHERE import_id = ?", (import_id,))
+        cursor.execute(_IMPORT_TOTALS_SQL.format(where="WHERE km.import_id = ?"), (import_id,))
+
+@serialized_write
 def save_import_data(project_id, month, filename, df, domain_map):
     """
     Saves a monthly import and all its associated keyword metrics.
@@ -130,63 +572,84 @@ def save_import_data(project_id, month, filename, df, domain_map):
         print("No keywords to save. Skipping import.")
         return None
 
+    # Serialize rows before opening the write transaction so the write lock is
+    # held only for the SQL statements, not for the per-row Python work
+    rows_payload = []
+    for _, row in df.iterrows():
+        # Extract domain-specific data into a JSON
+        domain_data = {}
+        for domain, cols in domain_map.items():
+            domain_data[domain] = {
+                'pos': row[cols['position']] if pd.notnull(row.get(cols.get('position'))) else None,
+                'vis': row[cols['visibility']] if pd.notnull(row.get(cols.get('visibility'))) else 0,
+                'clics': row.get(f'clics_{domain}', 0),
+                'media_value': row.get(f'media_value_{domain}', 0)
+            }
+        
+        rows_payload.append((
+            str(row['keyword']),
+            int(row['volume']) if pd.notnull(row['volume']) else 0,
+            int(row['difficulty']) if pd.notnull(row['difficulty']) else 0,
+            str(row.get('intent', 'N/D')),
+            float(row['cpc']) if pd.notnull(row['cpc']) else 0.0,
+            json.dumps(domain_data)
+        ))
+
     conn = get_connection()
     cursor = conn.cursor()
     
     try:
-        # 1. Create Import record (Upsert logic using INDEX)
-        cursor.execute("INSERT OR REPLACE INTO imports (project_id, month, filename) VALUES (?, ?, ?)", 
-                       (project_id, month, filename))
+        # 1. Create Import record (Upsert logic using INDEX).
+        # ON CONFLICT keeps the existing id (and shared links) instead of REPLACE's
+        # delete + insert, which used to leave metrics under the old id
+        cursor.execute("""
+            INSERT INTO imports (project_id, month, filename) VALUES (?, ?, ?)
+            ON CONFLICT(project_id, month) DO UPDATE SET
+                filename = excluded.filename,
+                report_text = NULL,
+                created_at = CURRENT_TIMESTAMP,
+                data_version = data_version + 1
+        """, (project_id, month, filename))
         
-        # Get the actual ID (SQLite REPLACE might change it)
+        # Get the actual ID
         cursor.execute("SELECT id FROM imports WHERE project_id = ? AND month = ?", (project_id, month))
         import_id = cursor.fetchone()[0]
         
-        # 2. Clear old metrics for this import
+        # 2. Clear old metrics for this import (and the snapshots that depend on it)
         cursor.execute("DELETE FROM keyword_metrics WHERE import_id = ?", (import_id,))
+        _invalidate_month_snapshots(cursor, project_id, month, import_id)
         
-        # 3. Batch insert metrics
-        metrics_list = []
-        for _, row in df.iterrows():
-            # Extract domain-specific data into a JSON
-            domain_data = {}
-            for domain, cols in domain_map.items():
-                domain_data[domain] = {
-                    'pos': row[cols['position']] if pd.notnull(row.get(cols.get('position'))) else None,
-                    'vis': row[cols['visibility']] if pd.notnull(row.get(cols.get('visibility'))) else 0,
-                    'clics': row.get(f'clics_{domain}', 0),
-                    'media_value': row.get(f'media_value_{domain}', 0)
-                }
-            
-            metrics_list.append((
-                import_id,
-                str(row['keyword']),
-                int(row['volume']) if pd.notnull(row['volume']) else 0,
-                int(row['difficulty']) if pd.notnull(row['difficulty']) else 0,
-                str(row.get('intent', 'N/D')),
-                float(row['cpc']) if pd.notnull(row['cpc']) else 0.0,
-                json.dumps(domain_data)
-            ))
-        
+        # 3. Resolve keyword ids from the project dictionary
+        keyword_ids = _intern_keywords(cursor, project_id, [r[0] for r in rows_payload])
+
+        # 4. Batch insert metrics
         cursor.executemany("""
-            INSERT INTO keyword_metrics (import_id, keyword, volume, difficulty, intent, cpc, data_json)
+            INSERT INTO keyword_metrics (import_id, keyword_id, volume, difficulty, intent, cpc, data_json)
             VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, metrics_list)
+        """, [(import_id, keyword_ids[r[0]]) + r[1:] for r in rows_payload])
+
+        # 5. Per-domain totals of the month (portfolio view)
+        _store_import_totals(cursor, import_id)
         
         conn.commit()
+        _bump_metadata_generation()
         return import_id
     except Exception as e:
-        print(f"Error saving data: {e}")
         conn.rollback()
+        if _is_locked_error(e):
+            raise  # let serialized_write retry the whole import
+        print(f"Error saving data: {e}")
         return None
     finally:
         conn.close()
 
+@serialized_write
 def update_report_text(import_id, text):
     conn = get_connection()
     cursor = conn.cursor()
     cursor.execute("UPDATE imports SET report_text = ? WHERE id = ?", (text, import_id))
     conn.commit()
+    _bump_metadata_generation()
     conn.close()
 
 def load_import_data(import_id):
@@ -194,7 +657,12 @@ def load_import_data(import_id):
     conn = get_connection()
     cursor = conn.cursor()
     
-    cursor.execute("SELECT * FROM keyword_metrics WHERE import_id = ?", (import_id,))
+    cursor.execute("""
+        SELECT km.*, k.keyword, k.keyword_norm
+        FROM keyword_metrics km
+        JOIN keywords k ON k.id = km.keyword_id
+        WHERE km.import_id = ?
+    """, (import_id,))
     rows = cursor.fetchall()
     conn.close()
     
@@ -207,6 +675,8 @@ def load_import_data(import_id):
     for r in rows:
         item = {
             'keyword': r['keyword'],
+            'keyword_id': r['keyword_id'],
+            'keyword_norm': r['keyword_norm'],
             'volume': r['volume'],
             'difficulty': r['difficulty'],
             'intent': r['intent'],
@@ -233,14 +703,437 @@ def load_import_data(import_id):
     
     return df, domain_map
 
+def get_import(import_id):
+    """Returns an import with its project's main domain as a dict, or None"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT i.id, i.project_id, i.month, i.filename, i.report_text, p.name AS project_name, p.main_domain
+        FROM imports i
+        JOIN projects p ON p.id = i.project_id
+        WHERE i.id = ?
+    """, (import_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
 def get_project_imports(project_id):
+    def load():
+        conn = get_connection()
+        df = pd.read_sql_query("SELECT * FROM imports WHERE project_id = ? ORDER BY month DESC", conn, params=(project_id,))
+        conn.close()
+        return df
+    return _memoized(('imports', int(project_id)), load)
+
+EXPORT_COLUMNS = [
+    'month', 'keyword', 'volume', 'difficulty', 'intent', 'cpc',
+    'domain', 'position', 'visibility', 'clics', 'media_value'
+]
+
+def iter_project_metrics(project_id, chunk_size=5000):
+    """
+    Yields the keyword×domain metrics of every import of a project as long-format
+    DataFrames (EXPORT_COLUMNS), reading chunk_size keyword rows at a time so
+    memory stays bounded regardless of project size.
+    """
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT i.month, k.keyword, km.volume, km.difficulty, km.intent, km.cpc, km.data_json
+            FROM keyword_metrics km
+            JOIN imports i ON km.import_id = i.id
+            JOIN keywords k ON k.id = km.keyword_id
+            WHERE i.project_id = ?
+            ORDER BY i.month, km.id
+        """, (project_id,))
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            records = []
+            for r in rows:
+                for domain, vals in json.loads(r['data_json']).items():
+                    records.append((
+                        r['month'], r['keyword'], r['volume'], r['difficulty'], r['intent'], r['cpc'],
+                        domain, vals.get('pos'), vals.get('vis'), vals.get('clics', 0), vals.get('media_value', 0)
+                    ))
+            yield pd.DataFrame.from_records(records, columns=EXPORT_COLUMNS)
+    finally:
+        conn.close()
+
+def get_import_domain_metrics(import_id):
+    """Long-format metrics of one import: keyword_id, domain, position, clics, media_value"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT keyword_id, data_json FROM keyword_metrics WHERE import_id = ?", (import_id,))
+    records = []
+    for r in cursor.fetchall():
+        for domain, vals in json.loads(r['data_json']).items():
+            records.append((r['keyword_id'], domain, vals.get('pos'), vals.get('clics', 0), vals.get('media_value', 0)))
+    conn.close()
+    return pd.DataFrame.from_records(records, columns=['keyword_id', 'domain', 'position', 'clics', 'media_value'])
+
+# --- CROSS-MONTH ANALYTICS ---
+
+# Per keyword×domain rows of every import of a project, unpacked from data_json
+# inside the engine (no Python decoding). Columns: import_id, month, keyword_id,
+# domain, position, visibility, clics, media_value
+_DOMAIN_ROWS_SQL = {
+    'sqlite': """
+        SELECT km.import_id, i.month, km.keyword_id, je.key AS domain,
+               CAST(json_extract(je.value, '$.pos') AS REAL) AS position,
+               COALESCE(json_extract(je.value, '$.vis'), 0) AS visibility,
+               COALESCE(json_extract(je.value, '$.clics'), 0) AS clics,
+               COALESCE(json_extract(je.value, '$.media_value'), 0) AS media_value
+        FROM keyword_metrics km
+        JOIN imports i ON i.id = km.import_id,
+             json_each(km.data_json) je
+        WHERE i.project_id = ?
+    """,
+    'duckdb': """
+        SELECT km.import_id, i.month, km.keyword_id, u.domain,
+               TRY_CAST(km.data_json::JSON -> u.domain ->> 'pos' AS DOUBLE) AS position,
+               COALESCE(TRY_CAST(km.data_json::JSON -> u.domain ->> 'vis' AS DOUBLE), 0) AS visibility,
+               COALESCE(TRY_CAST(km.data_json::JSON -> u.domain ->> 'clics' AS DOUBLE), 0) AS clics,
+               COALESCE(TRY_CAST(km.data_json::JSON -> u.domain ->> 'media_value' AS DOUBLE), 0) AS media_value
+        FROM seo.keyword_metrics km
+        JOIN seo.imports i ON i.id = km.import_id,
+             unnest(json_keys(km.data_json)) AS u(domain)
+        WHERE i.project_id = ?
+    """
+}
+
+_duckdb_failed = False
+
+def _duckdb_connection():
+    """In-memory DuckDB with the SQLite database attached read-only as 'seo', or None if unavailable"""
+    global _duckdb_failed
+    if _duckdb_failed or ANALYTICS_ENGINE == "sqlite":
+        return None
+    try:
+        import duckdb
+    except ImportError:
+        if ANALYTICS_ENGINE == "duckdb":
+            raise
+        _duckdb_failed = True
+        return None
+    try:
+        conn = duckdb.connect()
+        conn.execute("LOAD sqlite")
+        # ATTACH takes no bound parameters: the path goes in as an escaped literal
+        path = os.path.abspath(DB_PATH).replace("'", "''")
+        conn.execute(f"ATTACH '{path}' AS seo (TYPE SQLITE, READ_ONLY)")
+        return conn
+    except Exception as e:
+        if ANALYTICS_ENGINE == "duckdb":
+            raise
+        # No sqlite extension: remember and use SQLite from now on
+        _duckdb_failed = True
+        print(f"DuckDB analytics unavailable, using SQLite: {e}")
+        return None
+
+def query_project_analytics(project_id, sql, params=()):
+    """
+    Runs an analytical query over the project's per keyword×domain rows, available
+    to `sql` as the relation `domain_rows`; other tables are referenced as
+    {schema}keywords, {schema}imports... Extra `params` bind the `?` in `sql`.
+    Returns a DataFrame.
+    """
+    duck = _duckdb_connection()
+    engine = 'sqlite' if duck is None else 'duckdb'
+    full_sql = f"WITH domain_rows AS ({_DOMAIN_ROWS_SQL[engine]}) " + sql.format(schema='seo.' if duck is not None else '')
+    all_params = [int(project_id)] + list(params)
+    if duck is not None:
+        try:
+            return duck.execute(full_sql, all_params).df()
+        finally:
+            duck.close()
     conn = get_connection()
-    df = pd.read_sql_query("SELECT * FROM imports WHERE project_id = ? ORDER BY month DESC", conn, params=(project_id,))
+    try:
+        return pd.read_sql_query(full_sql, conn, params=all_params)
+    finally:
+        conn.close()
+
+def get_domain_month_totals(project_id):
+    """
+    Per month and domain: summed visibility, clics and media value, ranked keywords,
+    Top3/Top10 counts and SoV (visibility share of the month, %), ordered by month.
+    """
+    return query_project_analytics(project_id, """
+        SELECT import_id, month, domain,
+               SUM(visibility) AS visibility,
+               SUM(clics) AS clics,
+               SUM(media_value) AS media_value,
+               SUM(CASE WHEN position > 0 THEN 1 ELSE 0 END) AS ranked,
+               SUM(CASE WHEN position BETWEEN 1 AND 3 THEN 1 ELSE 0 END) AS top3,
+               SUM(CASE WHEN position BETWEEN 1 AND 10 THEN 1 ELSE 0 END) AS top10,
+               CASE WHEN SUM(SUM(visibility)) OVER (PARTITION BY import_id) > 0
+                    THEN SUM(visibility) * 100.0 / SUM(SUM(visibility)) OVER (PARTITION BY import_id)
+                    ELSE 0 END AS sov
+        FROM domain_rows
+        GROUP BY import_id, month, domain
+        ORDER BY month, sov DESC
+    """)
+
+def get_portfolio_totals(months=2):
+    """
+    One query for every project: the stored per-domain totals of its latest `months`
+    imports (month_rank 1 = latest). Projects without imports have one row with NULL
+    import/domain columns.
+    """
+    conn = get_connection()
+    df = pd.read_sql_query("""
+        WITH ranked AS (
+            SELECT id AS import_id, project_id, month,
+                   ROW_NUMBER() OVER (PARTITION BY project_id ORDER BY month DESC) AS month_rank
+            FROM imports
+        )
+        SELECT p.id AS project_id, p.name, p.main_domain,
+               r.import_id, r.month, r.month_rank,
+               t.domain, t.visibility, t.clics, t.media_value, t.top3, t.top10, t.sov
+        FROM projects p
+        LEFT JOIN ranked r ON r.project_id = p.id AND r.month_rank <= ?
+        LEFT JOIN import_domain_totals t ON t.import_id = r.import_id
+        ORDER BY p.name, r.month_rank, t.sov DESC
+    """, conn, params=(int(months),))
     conn.close()
     return df
 
+def get_position_volatility(project_id, domain, min_months=2):
+    """
+    Ranking volatility of each keyword for one domain across months: months ranked,
+    average/best/worst position and standard deviation, most volatile first.
+    """
+    df = query_project_analytics(project_id, """
+        SELECT r.keyword_id, k.keyword,
+               COUNT(*) AS months,
+               AVG(r.position) AS avg_position,
+               MIN(r.position) AS best_position,
+               MAX(r.position) AS worst_position,
+               AVG(r.position * r.position) - AVG(r.position) * AVG(r.position) AS position_var
+        FROM domain_rows r
+        JOIN {schema}keywords k ON k.id = r.keyword_id
+        WHERE r.domain = ? AND r.position > 0
+        GROUP BY r.keyword_id, k.keyword
+        HAVING COUNT(*) >= ?
+    """, (domain, int(min_months)))
+    df['position_std'] = df.pop('position_var').clip(lower=0) ** 0.5
+    return df.sort_values('position_std', ascending=False).reset_index(drop=True)
+
+PANEL_METRICS = ('position', 'visibility', 'clics', 'media_value')
+
+def get_keyword_panel(project_id, domains=None, keyword_ids=None, import_ids=None):
+    """
+    Keyword×month panel of a project, built from one query.
+    Returns a dict with index arrays 'keyword_ids', 'keywords', 'months', 'import_ids',
+    the 'domains' list, a boolean 'present' matrix (keyword×month: keyword in that
+    month's CSV) and one float array per PANEL_METRICS metric shaped
+    domain×keyword×month (NaN where the domain has no data).
+    domains / keyword_ids / import_ids optionally restrict the panel.
+    """
+    conditions, params = [], []
+    if domains is not None:
+        domains = list(domains)
+        conditions.append(f"r.domain IN ({','.join('?' * len(domains))})")
+        params += domains
+    if keyword_ids is not None:
+        keyword_ids = [int(k) for k in keyword_ids]
+        conditions.append(f"r.keyword_id IN ({','.join('?' * len(keyword_ids))})")
+        params += keyword_ids
+    if import_ids is not None:
+        import_ids = [int(i) for i in import_ids]
+        conditions.append(f"r.import_id IN ({','.join('?' * len(import_ids))})")
+        params += import_ids
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    rows = query_project_analytics(project_id, f"""
+        SELECT r.import_id, r.month, r.keyword_id, k.keyword, r.domain,
+               r.position, r.visibility, r.clics, r.media_value
+        FROM domain_rows r
+        JOIN {{schema}}keywords k ON k.id = r.keyword_id
+        {where}
+    """, params)
+
+    kw_codes, kw_ids = pd.factorize(rows['keyword_id'], sort=True)
+    month_codes, months = pd.factorize(rows['month'], sort=True)
+    domain_codes, domain_names = pd.factorize(rows['domain'], sort=True)
+    shape = (len(domain_names), len(kw_ids), len(months))
+
+    panel = {
+        'keyword_ids': np.asarray(kw_ids, dtype=np.int64),
+        'keywords': rows.drop_duplicates('keyword_id').set_index('keyword_id')['keyword'].reindex(kw_ids).to_numpy(),
+        'months': np.asarray(months, dtype=object),
+        'import_ids': rows.drop_duplicates('month').set_index('month')['import_id'].reindex(months).to_numpy(dtype=np.int64),
+        'domains': list(domain_names),
+        'present': np.zeros(shape[1:], dtype=bool)
+    }
+    panel['present'][kw_codes, month_codes] = True
+    for metric in PANEL_METRICS:
+        matrix = np.full(shape, np.nan)
+        matrix[domain_codes, kw_codes, month_codes] = rows[metric].to_numpy(dtype=float)
+        panel[metric] = matrix
+    return panel
+
+def get_keyword_names(keyword_ids):
+    """Returns {keyword_id: keyword} for the given keyword ids"""
+    keyword_ids = [int(k) for k in keyword_ids]
+    if not keyword_ids:
+        return {}
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT id, keyword FROM keywords WHERE id IN ({','.join('?' * len(keyword_ids))})", keyword_ids)
+    rows = cursor.fetchall()
+    conn.close()
+    return {r['id']: r['keyword'] for r in rows}
+
+# --- KEYWORD SEARCH ---
+
+KEYWORD_SEARCH_LIMIT = 50
+
+def search_keywords(project_id, query, import_id=None, limit=KEYWORD_SEARCH_LIMIT):
+    """
+    Keywords of a project matching `query` as prefix or substring, accent/case
+    insensitive (intent_rules.normalize_keyword): prefix matches first (alphabetical),
+    then keywords containing it. import_id restricts to the keywords of one month;
+    an empty query lists the first keywords alphabetically. Returns a list of keywords.
+    """
+    norm = intent_rules.normalize_keyword(query or "")
+    params = {'project_id': int(project_id), 'limit': int(limit), 'norm': norm, 'norm_end': norm + '\U0010ffff'}
+    month_filter = ""
+    if import_id is not None:
+        month_filter = "AND EXISTS (SELECT 1 FROM keyword_metrics km WHERE km.keyword_id = k.id AND km.import_id = :import_id)"
+        params['import_id'] = int(import_id)
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    # 1. Prefix matches: range scan on idx_keywords_project_norm
+    cursor.execute(f"""
+        SELECT k.keyword FROM keywords k
+        WHERE k.project_id = :project_id AND k.keyword_norm >= :norm AND k.keyword_norm < :norm_end {month_filter}
+        ORDER BY k.keyword_norm
+        LIMIT :limit
+    """, params)
+    results = [r['keyword'] for r in cursor.fetchall()]
+
+    # 2. Substring matches: trigram index (needs at least 3 characters), else LIKE
+    if norm and len(results) < limit:
+        params['limit'] = limit - len(results)
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'keywords_fts'")
+        if len(norm) >= 3 and cursor.fetchone() is not None:
+            params['match'] = '"' + norm.replace('"', '""') + '"'
+            # CROSS JOIN keeps the FTS index as the outer loop
+            source = "keywords_fts f CROSS JOIN keywords k ON k.id = f.rowid WHERE keywords_fts MATCH :match"
+        else:
+            params['like'] = '%' + norm.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            source = "keywords k WHERE k.keyword_norm LIKE :like ESCAPE '\\'"
+        cursor.execute(f"""
+            SELECT k.keyword FROM {source}
+            AND k.project_id = :project_id
+            AND NOT (k.keyword_norm >= :norm AND k.keyword_norm < :norm_end) {month_filter}
+            LIMIT :limit
+        """, params)
+        results += [r['keyword'] for r in cursor.fetchall()]
+    conn.close()
+    return results
+
+# --- MONTH-OVER-MONTH DIFFS ---
+
+@serialized_write
+def save_import_diffs(import_id, prev_import_id, diff_rows):
+    """
+    Replaces the stored diff of an import.
+    diff_rows: iterable of (domain, keyword_id, position, prev_position, position_delta, clics_delta, value_delta)
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        # Deleting the header cascades to its keyword_diffs rows
+        cursor.execute("DELETE FROM import_diffs WHERE import_id = ?", (import_id,))
+        cursor.execute("INSERT INTO import_diffs (import_id, prev_import_id) VALUES (?, ?)", (import_id, prev_import_id))
+        cursor.executemany("""
+            INSERT INTO keyword_diffs
+                (import_id, domain, keyword_id, position, prev_position, position_delta, clics_delta, value_delta)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, ((import_id,) + tuple(r) for r in diff_rows))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def get_import_diff_headers(project_id):
+    """Returns {import_id: prev_import_id} for every import of the project with a stored diff"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT d.import_id, d.prev_import_id
+        FROM import_diffs d
+        JOIN imports i ON i.id = d.import_id
+        WHERE i.project_id = ?
+    """, (project_id,))
+    rows = cursor.fetchall()
+    conn.close()
+    return {r['import_id']: r['prev_import_id'] for r in rows}
+
+_CHANGE_TYPE_SQL = """
+    CASE
+        WHEN d.prev_position <= 10 AND d.position > 10 THEN 'lost_top10'
+        WHEN d.position_delta >= :min_drop THEN 'dropped'
+        WHEN d.position <= 3 AND (d.prev_position IS NULL OR d.prev_position > 3) THEN 'gained_top3'
+    END
+"""
+
+def get_keyword_changes(import_id, domain, min_drop=2, lost_top10=True, gained_top3=False, limit=None):
+    """
+    Keywords whose ranking changed significantly vs the previous month for one domain.
+    Filters: dropped >= min_drop positions, lost Top10, gained Top3 (each optional).
+    Returns a DataFrame with keyword, position, prev_position, deltas and change_type.
+    """
+    conditions = []
+    if min_drop is not None:
+        conditions.append("d.position_delta >= :min_drop")
+    if lost_top10:
+        conditions.append("(d.prev_position <= 10 AND d.position > 10)")
+    if gained_top3:
+        conditions.append("(d.position <= 3 AND (d.prev_position IS NULL OR d.prev_position > 3))")
+    if not conditions:
+        return pd.DataFrame()
+
+    query = f"""
+        SELECT k.keyword, d.position, d.prev_position, d.position_delta, d.clics_delta, d.value_delta,
+               {_CHANGE_TYPE_SQL} AS change_type
+        FROM keyword_diffs d
+        JOIN keywords k ON k.id = d.keyword_id
+        WHERE d.import_id = :import_id AND d.domain = :domain AND ({' OR '.join(conditions)})
+        ORDER BY d.value_delta ASC, d.position_delta DESC
+    """
+    params = {'import_id': import_id, 'domain': domain, 'min_drop': min_drop if min_drop is not None else 10**6}
+    if limit:
+        query += " LIMIT :limit"
+        params['limit'] = int(limit)
+    conn = get_connection()
+    try:
+        return pd.read_sql_query(query, conn, params=params)
+    finally:
+        conn.close()
+
+def count_risk_keywords(import_id, domain, min_drop=2):
+    """Number of keywords that dropped >= min_drop positions or left the Top10 (P0.1 risk KPI)"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT COUNT(*) FROM keyword_diffs d
+        WHERE d.import_id = ? AND d.domain = ?
+          AND (d.position_delta >= ? OR (d.prev_position <= 10 AND d.position > 10))
+    """, (import_id, domain, min_drop))
+    count = cursor.fetchone()[0]
+    conn.close()
+    return count
+
 # --- INTENT PERSISTENCE FUNCTIONS (Phase 4) ---
 
+@serialized_write
 def upsert_keyword_intent(keyword_norm, keyword_original, intent_validated, notes=None):
     """Guarda o actualiza la intención validada de una keyword"""
     conn = get_connection()
@@ -253,17 +1146,25 @@ def upsert_keyword_intent(keyword_norm, keyword_original, intent_validated, note
             notes = excluded.notes,
             updated_at = CURRENT_TIMESTAMP
     """, (keyword_norm, keyword_original, intent_validated, notes))
+    project_ids = _invalidate_keyword_snapshots(cursor, keyword_norm)
     conn.commit()
     conn.close()
+    return project_ids
 
-def get_validated_intents():
-    """Retorna un dict {keyword_norm: intent_validated}"""
+def get_validated_intents_for_import(import_id):
+    """Retorna un dict {keyword_id: intent_validated} para las keywords de un import"""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT keyword_norm, intent_validated FROM keyword_intent")
+    cursor.execute("""
+        SELECT km.keyword_id, ki.intent_validated
+        FROM keyword_metrics km
+        JOIN keywords k ON k.id = km.keyword_id
+        JOIN keyword_intent ki ON ki.keyword_norm = k.keyword_norm
+        WHERE km.import_id = ?
+    """, (import_id,))
     rows = cursor.fetchall()
     conn.close()
-    return {r['keyword_norm']: r['intent_validated'] for r in rows}
+    return {r['keyword_id']: r['intent_validated'] for r in rows}
 
 def get_intent_validation_stats():
     """Retorna estadísticas de validación"""
@@ -288,9 +1189,10 @@ def get_keyword_history(project_id, keyword):
         km.intent,
         km.cpc,
         km.data_json
-    FROM keyword_metrics km
+    FROM keywords k
+    JOIN keyword_metrics km ON km.keyword_id = k.id
     JOIN imports i ON km.import_id = i.id
-    WHERE i.project_id = ? AND km.keyword = ?
+    WHERE k.project_id = ? AND k.keyword = ?
     ORDER BY i.month ASC
     """
     try:
@@ -302,6 +1204,432 @@ def get_keyword_history(project_id, keyword):
     finally:
         conn.close()
 
+# --- SHARED-LINK SNAPSHOTS ---
+
+@serialized_write
+def save_import_snapshot(import_id, project_id, version, payload):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO import_snapshots (import_id, project_id, version, payload, built_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(import_id) DO UPDATE SET
+            project_id = excluded.project_id,
+            version = excluded.version,
+            payload = excluded.payload,
+            built_at = CURRENT_TIMESTAMP
+    """, (import_id, project_id, version, sqlite3.Binary(payload)))
+    conn.commit()
+    conn.close()
+
+def get_import_snapshot(import_id):
+    """Returns {'version', 'payload', 'built_at'} for an import snapshot, or None"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT version, payload, built_at FROM import_snapshots WHERE import_id = ?", (import_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+@serialized_write
+def save_project_snapshot(project_id, version, payload):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO project_snapshots (project_id, version, payload, built_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(project_id) DO UPDATE SET
+            version = excluded.version,
+            payload = excluded.payload,
+            built_at = CURRENT_TIMESTAMP
+    """, (project_id, version, sqlite3.Binary(payload)))
+    conn.commit()
+    conn.close()
+
+def get_project_snapshot(project_id):
+    """Returns {'version', 'payload', 'built_at'} for a project's global snapshot, or None"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT version, payload, built_at FROM project_snapshots WHERE project_id = ?", (project_id,))
+    row = cursor.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+@serialized_write
+def save_report_section(import_id, project_id, section, version, payload):
+    conn = get_connection()
+    conn.execute("""
+        INSERT INTO report_sections (import_id, section, project_id, version, payload, built_at)
+        VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(import_id, section) DO UPDATE SET
+            project_id = excluded.project_id,
+            version = excluded.version,
+            payload = excluded.payload,
+            built_at = CURRENT_TIMESTAMP
+    """, (import_id, section, project_id, version, sqlite3.Binary(payload)))
+    conn.commit()
+    conn.close()
+
+def get_report_section(import_id, section):
+    """Returns {'version', 'payload', 'built_at'} for a stored report section, or None"""
+    conn = get_connection()
+    row = conn.execute(
+        "SELECT version, payload, built_at FROM report_sections WHERE import_id = ? AND section = ?",
+        (import_id, section)
+    ).fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+def get_imports_missing_snapshot(project_id, version):
+    """Ids of the project's imports without a snapshot of this version, oldest month first"""
+    conn = get_connection()
+    rows = conn.execute("""
+        SELECT i.id FROM imports i
+        LEFT JOIN import_snapshots s ON s.import_id = i.id AND s.version = ?
+        WHERE i.project_id = ? AND s.import_id IS NULL
+        ORDER BY i.month
+    """, (version, project_id)).fetchall()
+    conn.close()
+    return [r['id'] for r in rows]
+
+def get_imports_missing_section(project_id, section, version):
+    """Ids of the project's imports without a stored `section` of this version, oldest month first"""
+    conn = get_connection()
+    rows = conn.execute("""
+        SELECT i.id FROM imports i
+        LEFT JOIN report_sections r ON r.import_id = i.id AND r.section = ? AND r.version = ?
+        WHERE i.project_id = ? AND r.import_id IS NULL
+        ORDER BY i.month
+    """, (section, version, project_id)).fetchall()
+    conn.close()
+    return [r['id'] for r in rows]
+
+def _invalidate_snapshots(cursor, project_id):
+    """Drops every stored report of a project (e.g. its main domain changed)"""
+    cursor.execute("DELETE FROM import_snapshots WHERE project_id = ?", (project_id,))
+    cursor.execute("DELETE FROM project_snapshots WHERE project_id = ?", (project_id,))
+    cursor.execute("DELETE FROM report_sections WHERE project_id = ?", (project_id,))
+
+def _invalidate_month_snapshots(cursor, project_id, month, import_id=None):
+    """
+    Drops the stored reports that depend on the data of `month` (uploaded or deleted):
+    the import's own snapshot and MoM diff, the snapshot and diff of the next month
+    (they compare against this one), the report sections of this and later months
+    (the Top 15 history reads every month up to the report's) and the global snapshot.
+    A re-upload keeps the import id, so the diffs must be dropped here:
+    diff_engine.refresh_project_diffs recomputes the missing ones.
+    """
+    cursor.execute(
+        "SELECT id FROM imports WHERE project_id = ? AND month > ? ORDER BY month LIMIT 1",
+        (project_id, month)
+    )
+    next_import = cursor.fetchone()
+    stale = [i for i in (import_id, next_import[0] if next_import else None) if i is not None]
+    if stale:
+        placeholders = ','.join('?' * len(stale))
+        cursor.execute(f"DELETE FROM import_snapshots WHERE import_id IN ({placeholders})", stale)
+        # Deleting the diff headers cascades to their keyword_diffs rows
+        cursor.execute(f"DELETE FROM import_diffs WHERE import_id IN ({placeholders})", stale)
+    cursor.execute("""
+        DELETE FROM report_sections
+        WHERE import_id IN (SELECT id FROM imports WHERE project_id = ? AND month >= ?)
+    """, (project_id, month))
+    cursor.execute("DELETE FROM project_snapshots WHERE project_id = ?", (project_id,))
+
+def _invalidate_keyword_snapshots(cursor, keyword_norm):
+    """
+    Drops the monthly snapshots of the imports containing the keyword (their intent
+    column changed). Returns the ids of the affected projects.
+    """
+    cursor.execute("""
+        SELECT DISTINCT km.import_id, k.project_id
+        FROM keywords k
+        JOIN keyword_metrics km ON km.keyword_id = k.id
+        WHERE k.keyword_norm = ?
+    """, (keyword_norm,))
+    rows = cursor.fetchall()
+    cursor.executemany("DELETE FROM import_snapshots WHERE import_id = ?", [(r['import_id'],) for r in rows])
+    return sorted({r['project_id'] for r in rows})
+
+# --- AI JOB QUEUE ---
+
+@serialized_write
+def enqueue_ai_job(kind, project_id, import_id, prompt, model_name, cache_key=None):
+    """
+    Queues an AI report request for the background worker.
+    If the same report is already queued or running, that job id is returned instead.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT id FROM ai_jobs
+            WHERE kind = ? AND project_id = ? AND import_id IS ? AND status IN ('queued', 'running')
+            ORDER BY id DESC LIMIT 1
+        """, (kind, project_id, import_id))
+        row = cursor.fetchone()
+        if row:
+            return row['id']
+        cursor.execute("""
+            INSERT INTO ai_jobs (kind, project_id, import_id, model_name, prompt, cache_key)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (kind, project_id, import_id, model_name, prompt, cache_key))
+        conn.commit()
+        return cursor.lastrowid
+    finally:
+        conn.close()
+
+@serialized_write
+def claim_next_ai_job():
+    """Atomically moves the oldest queued job to 'running'. Returns it as a dict, or None if the queue is empty"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("SELECT * FROM ai_jobs WHERE status = 'queued' ORDER BY id LIMIT 1")
+        row = cursor.fetchone()
+        if row is None:
+            conn.commit()
+            return None
+        cursor.execute("""
+            UPDATE ai_jobs SET status = 'running', started_at = CURRENT_TIMESTAMP, attempts = attempts + 1,
+                partial_text = NULL, heartbeat_at = ?
+            WHERE id = ?
+        """, (time.time(), row['id']))
+        conn.commit()
+        job = dict(row)
+        job['status'] = 'running'
+        return job
+    finally:
+        conn.close()
+
+@serialized_write
+def finish_ai_job(job_id, status='done', error=None):
+    """Marks a job as 'done' or 'failed' (with its error message)"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE ai_jobs SET status = ?, error = ?, partial_text = NULL, finished_at = CURRENT_TIMESTAMP WHERE id = ?
+    """, (status, error, job_id))
+    conn.commit()
+    conn.close()
+
+@serialized_write
+def update_ai_job_partial(job_id, partial_text):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE ai_jobs SET partial_text = ?, heartbeat_at = ? WHERE id = ?", (partial_text, time.time(), job_id))
+    conn.commit()
+    conn.close()
+
+@serialized_write
+def touch_ai_job(job_id):
+    """Refreshes the heartbeat of a running job (the worker holding it is alive)"""
+    conn = get_connection()
+    conn.execute("UPDATE ai_jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running'", (time.time(), job_id))
+    conn.commit()
+    conn.close()
+
+@serialized_write
+def requeue_stale_ai_jobs(timeout_seconds):
+    """
+    Puts back in the queue the 'running' jobs whose heartbeat is older than
+    timeout_seconds: their worker died (process killed or restarted). Jobs still
+    being worked on by another process keep beating and are left alone.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE ai_jobs SET status = 'queued', started_at = NULL, partial_text = NULL, heartbeat_at = NULL
+        WHERE status = 'running' AND COALESCE(heartbeat_at, 0) < ?
+    """, (time.time() - timeout_seconds,))
+    conn.commit()
+    count = cursor.rowcount
+    conn.close()
+    return count
+
+def get_latest_ai_job(kind, project_id, import_id=None):
+    """Returns the most recent job for a monthly (import) or global (project) report as a dict, or None"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, kind, project_id, import_id, model_name, status, error, partial_text,
+               created_at, started_at, finished_at
+        FROM ai_jobs
+        WHERE kind = ? AND project_id = ? AND import_id IS ?
+        ORDER BY id DESC LIMIT 1
+    """, (kind, project_id, import_id))
+    row = cursor.fetchone()
+    conn.close()
+    return dict(row) if row else None
+
+# --- AI RESPONSE CACHE ---
+
+def get_cached_ai_response(cache_key):
+    """Returns the cached response text for this key, or None if missing or expired"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT response_text FROM ai_cache WHERE cache_key = ? AND expires_at > ?",
+        (cache_key, time.time())
+    )
+    row = cursor.fetchone()
+    conn.close()
+    return row['response_text'] if row else None
+
+@serialized_write
+def put_cached_ai_response(cache_key, model_name, response_text, ttl_seconds):
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO ai_cache (cache_key, model_name, response_text, created_at, expires_at)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP, ?)
+        ON CONFLICT(cache_key) DO UPDATE SET
+            response_text = excluded.response_text,
+            created_at = CURRENT_TIMESTAMP,
+            expires_at = excluded.expires_at
+    """, (cache_key, model_name, response_text, time.time() + ttl_seconds))
+    conn.commit()
+    conn.close()
+
+@serialized_write
+def save_render_timings(rows):
+    """rows: iterable of (recorded_at, release, view, section, seconds)"""
+    conn = get_connection()
+    conn.executemany(
+        "INSERT INTO render_timings (recorded_at, release, view, section, seconds) VALUES (?, ?, ?, ?, ?)",
+        rows
+    )
+    conn.commit()
+    conn.close()
+
+def get_render_timings(since):
+    """Render latency samples recorded after `since` (unix epoch seconds), oldest first"""
+    conn = get_connection()
+    df = pd.read_sql_query(
+        "SELECT recorded_at, release, view, section, seconds FROM render_timings WHERE recorded_at >= ? ORDER BY recorded_at",
+        conn, params=(since,)
+    )
+    conn.close()
+    return df
+
+@serialized_write
+def purge_render_timings(older_than):
+    """Deletes samples recorded before `older_than` (unix epoch seconds). Returns the number of rows removed"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM render_timings WHERE recorded_at < ?", (older_than,))
+    conn.commit()
+    count = cursor.rowcount
+    conn.close()
+    return count
+
+@serialized_write
+def purge_expired_ai_cache():
+    """Deletes expired cache entries. Returns the number of rows removed"""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM ai_cache WHERE expires_at <= ?", (time.time(),))
+    conn.commit()
+    count = cursor.rowcount
+    conn.close()
+    return count
+
+@serialized_write
+def delete_import(import_id):
+    """Deletes a monthly import; its keyword_metrics go with it via ON DELETE CASCADE"""
+    conn = get_connection()
+    try:
+        row = conn.execute("SELECT project_id, month FROM imports WHERE id = ?", (import_id,)).fetchone()
+        if row:
+            _invalidate_month_snapshots(conn.cursor(), row['project_id'], row['month'])
+        conn.execute("DELETE FROM imports WHERE id = ?", (import_id,))
+        conn.commit()
+        _bump_metadata_generation()
+        return True
+    except Exception as e:
+        conn.rollback()
+        if _is_locked_error(e):
+            raise
+        print(f"Error deleting import: {e}")
+        return False
+    finally:
+        conn.close()
+
+@serialized_write
+def purge_orphan_metrics():
+    """Removes keyword_metrics rows whose import no longer exists. Returns the number of rows deleted"""
+    conn = get_connection()
+    try:
+        cursor = conn.execute("DELETE FROM keyword_metrics WHERE import_id NOT IN (SELECT id FROM imports)")
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+@serialized_write
+def purge_unused_keywords():
+    """Removes dictionary keywords no longer referenced by any import. Returns the number of rows deleted"""
+    conn = get_connection()
+    try:
+        cursor = conn.execute("""
+            DELETE FROM keywords
+            WHERE NOT EXISTS (SELECT 1 FROM keyword_metrics km WHERE km.keyword_id = keywords.id)
+        """)
+        conn.commit()
+        return cursor.rowcount
+    finally:
+        conn.close()
+
+def _db_size_bytes(conn):
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    return page_size * page_count
+
+@serialized_write
+def compact_database():
+    """
+    Sweeps orphaned metrics and returns free pages to the filesystem.
+    The first run on a legacy file does a full VACUUM to switch it to
+    incremental auto-vacuum; later runs only need PRAGMA incremental_vacuum.
+    Returns: dict with before/after sizes (bytes), orphans removed and the mode used
+    """
+    orphans_removed = purge_orphan_metrics()
+    purge_unused_keywords()
+    purge_expired_ai_cache()
+
+    conn = get_connection()
+    try:
+        before_bytes = _db_size_bytes(conn)
+        freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+
+        if auto_vacuum != 2:  # 2 = INCREMENTAL
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+            mode = "vacuum"
+        else:
+            # executescript steps the pragma to completion; execute() frees a single page
+            conn.executescript("PRAGMA incremental_vacuum;")
+            mode = "incremental"
+        conn.commit()
+
+        after_bytes = _db_size_bytes(conn)
+    finally:
+        conn.close()
+
+    report = {
+        'before_bytes': before_bytes,
+        'after_bytes': after_bytes,
+        'freed_bytes': before_bytes - after_bytes,
+        'free_pages_before': freelist,
+        'orphans_removed': orphans_removed,
+        'mode': mode
+    }
+    print(f"Compaction ({mode}): {before_bytes} -> {after_bytes} bytes, {orphans_removed} orphaned metrics removed")
+    return report
+
+@serialized_write
 def delete_project(project_id):
     """
     Deletes a project and all associated data (imports, metrics).
@@ -322,14 +1650,17 @@ def delete_project(project_id):
             # 3. Delete imports
             cursor.execute("DELETE FROM imports WHERE project_id = ?", (project_id,))
             
-        # 4. Delete the project
+        # 4. Delete the project (its keyword dictionary goes with it via ON DELETE CASCADE)
         cursor.execute("DELETE FROM projects WHERE id = ?", (project_id,))
         
         conn.commit()
+        _bump_metadata_generation()
         return True
     except Exception as e:
-        print(f"Error deleting project: {e}")
         conn.rollback()
+        if _is_locked_error(e):
+            raise
+        print(f"Error deleting project: {e}")
         return False
     finally:
         conn.close()
@@ -0,0 +1,66 @@
+import pandas as pd
+
+import database
+
+
+def compute_import_diff(import_id, prev_import_id):
+    """
+    Computes per keyword×domain position, click and value deltas of an import
+    against the previous month and stores them (database.save_import_diffs).
+    Keywords new this month get prev_position NULL and their full clicks/value as delta.
+    """
+    if prev_import_id is None:
+        database.save_import_diffs(import_id, None, [])
+        return 0
+
+    # A CSV may repeat a keyword row: keep its first occurrence so the merge yields
+    # one row per keyword×domain (the keyword_diffs primary key)
+    cur = database.get_import_domain_metrics(import_id).drop_duplicates(['keyword_id', 'domain'])
+    prev = database.get_import_domain_metrics(prev_import_id).drop_duplicates(['keyword_id', 'domain']).rename(columns={
+        'position': 'prev_position', 'clics': 'prev_clics', 'media_value': 'prev_media_value'
+    })
+    merged = cur.merge(prev, on=['keyword_id', 'domain'], how='left')
+
+    position = pd.to_numeric(merged['position'], errors='coerce')
+    prev_position = pd.to_numeric(merged['prev_position'], errors='coerce')
+    position_delta = position - prev_position
+    clics_delta = merged['clics'].fillna(0) - merged['prev_clics'].fillna(0)
+    value_delta = merged['media_value'].fillna(0) - merged['prev_media_value'].fillna(0)
+
+    def nullable_int(series):
+        return [None if pd.isna(v) else int(v) for v in series]
+
+    rows = zip(
+        merged['domain'],
+        merged['keyword_id'].astype(int).tolist(),
+        nullable_int(position),
+        nullable_int(prev_position),
+        nullable_int(position_delta),
+        clics_delta.astype(float).round(4).tolist(),
+        value_delta.astype(float).round(4).tolist()
+    )
+    database.save_import_diffs(import_id, prev_import_id, rows)
+    return len(merged)
+
+
+def refresh_project_diffs(project_id):
+    """
+    Brings the stored diffs of a project up to date: (re)computes every import whose
+    diff is missing (new or re-uploaded month, or the one after it) or was computed
+    against a different previous month (after an upload in the middle of the history
+    or a delete). Returns the import ids recomputed.
+    """
+    imports = database.get_project_imports(project_id)
+    if imports.empty:
+        return []
+    headers = database.get_import_diff_headers(project_id)
+
+    recomputed = []
+    ordered_ids = [int(i) for i in imports.sort_values('month')['id']]
+    prev_id = None
+    for import_id in ordered_ids:
+        if import_id not in headers or headers[import_id] != prev_id:
+            compute_import_diff(import_id, prev_id)
+            recomputed.append(import_id)
+        prev_id = import_id
+    return recomputed
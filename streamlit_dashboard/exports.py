@@ -0,0 +1,102 @@
+"""
+Streaming project exports: every import's keyword×domain metrics as CSV or Parquet,
+built chunk by chunk from SQLite so multi-year datasets never sit in memory at once.
+
+CLI:
+    python exports.py --project-id 3 --format parquet --out cliente.parquet
+"""
+import argparse
+import gzip
+import io
+from contextlib import nullcontext
+
+import pandas as pd
+
+import database
+
+EXPORT_CHUNK_ROWS = 5000
+
+# Parquet type of each database.EXPORT_COLUMNS column. Every chunk is built with
+# this schema: inferring it per chunk types an all-null column as `null`
+PARQUET_TYPES = {
+    'month': 'string', 'keyword': 'string', 'volume': 'int64', 'difficulty': 'int64',
+    'intent': 'string', 'cpc': 'float64', 'domain': 'string', 'position': 'float64',
+    'visibility': 'float64', 'clics': 'float64', 'media_value': 'float64'
+}
+
+
+def iter_project_csv(project_id, chunk_size=EXPORT_CHUNK_ROWS):
+    """Generator of UTF-8 CSV byte chunks (header in the first chunk only)"""
+    header = True
+    for chunk in database.iter_project_metrics(project_id, chunk_size):
+        yield chunk.to_csv(index=False, header=header).encode('utf-8')
+        header = False
+    if header:
+        # Project without data: still a valid CSV with just the header
+        yield (",".join(database.EXPORT_COLUMNS) + "\n").encode('utf-8')
+
+
+def write_project_csv(project_id, dest, compress=None):
+    """
+    Streams the project CSV to a path or binary file object (gzip if compress=True
+    or the path ends in .gz). Returns dest
+    """
+    if compress is None:
+        compress = isinstance(dest, str) and dest.endswith(".gz")
+    if compress:
+        target = gzip.open(dest, "wb")
+    else:
+        target = open(dest, "wb") if isinstance(dest, str) else nullcontext(dest)
+    with target as f:
+        for data in iter_project_csv(project_id):
+            f.write(data)
+    return dest
+
+
+def _parquet_chunk(pa, schema, chunk):
+    """Arrow table of one export chunk with the fixed export schema"""
+    chunk = chunk.copy()
+    for col, type_name in PARQUET_TYPES.items():
+        if type_name == 'int64':
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce').astype('Int64')
+        elif type_name == 'float64':
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce').astype('float64')
+    return pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+
+
+def write_project_parquet(project_id, dest, chunk_size=EXPORT_CHUNK_ROWS):
+    """Streams the project to a Parquet path or binary file object, one row group per chunk. Requires pyarrow"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("La exportación Parquet requiere 'pyarrow' (pip install pyarrow).")
+
+    schema = pa.schema([(col, getattr(pa, PARQUET_TYPES[col])()) for col in database.EXPORT_COLUMNS])
+    with pq.ParquetWriter(dest, schema) as writer:
+        for chunk in database.iter_project_metrics(project_id, chunk_size):
+            writer.write_table(_parquet_chunk(pa, schema, chunk))
+    return dest
+
+
+def export_project_bytes(project_id, fmt="csv"):
+    """Builds the export in memory (gzipped CSV or Parquet) for a download, with no file left on disk"""
+    buffer = io.BytesIO()
+    if fmt == "parquet":
+        write_project_parquet(project_id, buffer)
+    else:
+        write_project_csv(project_id, buffer, compress=True)
+    return buffer.getvalue()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--project-id", type=int, required=True)
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--out", required=True, help="Destination file (.csv, .csv.gz or .parquet)")
+    args = parser.parse_args()
+    if args.format == "parquet":
+        write_project_parquet(args.project_id, args.out)
+    else:
+        write_project_csv(args.project_id, args.out)
+    print(f"Exported project {args.project_id} to {args.out}")
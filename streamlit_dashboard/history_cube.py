@@ -0,0 +1,227 @@
+"""
+On-disk history cube per project: months × keywords × domains for every
+database.PANEL_METRICS metric, stored as memory-mapped NumPy arrays so that
+time-series reads are array slices, not SQLite queries + JSON decoding.
+
+Layout (next to the SQLite file):
+    history_cubes/project_<id>.lock                     writer lock (one sync at a time, across processes)
+    history_cubes/project_<id>/meta.json                keyword/domain axes + month files
+    history_cubes/project_<id>/g<gen>-<import>-v<version>.npy  float32 metric×keyword×domain
+
+Only sync_cube writes (called after uploads/deletes by report_engine); reads never
+do. Month files are immutable: a re-upload (new imports.data_version) or a rebuild
+(new generation) writes a new file. New files are staged in a temp dir and moved
+into place with os.replace, and meta.json is replaced last, so a reader sees
+either the previous cube or the new one, never a half-written file. Reads that
+find the cube missing or behind the database raise StaleCube (callers fall back
+to SQLite).
+
+The keyword and domain axes are append-only: a new month extends them; older
+month files keep their (shorter) shape and read as NaN beyond it.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+import database
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the in-process lock applies
+    fcntl = None
+
+CUBE_VERSION = 2
+CUBE_DIR_NAME = "history_cubes"
+
+_cube_lock = threading.Lock()
+
+
+class StaleCube(Exception):
+    """The cube does not (yet) hold the requested months at their current data_version"""
+
+
+def _cubes_root():
+    return os.path.join(os.path.dirname(os.path.abspath(database.DB_PATH)), CUBE_DIR_NAME)
+
+
+def cube_dir(project_id):
+    return os.path.join(_cubes_root(), f"project_{int(project_id)}")
+
+
+@contextmanager
+def _writer_lock(project_id):
+    """Exclusive per-project lock shared by threads and processes (flock on a lock file)"""
+    os.makedirs(_cubes_root(), exist_ok=True)
+    with _cube_lock:
+        with open(os.path.join(_cubes_root(), f"project_{int(project_id)}.lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _empty_meta(generation=0):
+    return {'version': CUBE_VERSION, 'generation': generation, 'keyword_ids': [], 'domains': [], 'months': {}}
+
+
+def _read_meta(project_id):
+    """Current cube metadata, or None if the cube does not exist (or has another format)"""
+    path = os.path.join(cube_dir(project_id), "meta.json")
+    try:
+        with open(path, encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get('version') == CUBE_VERSION else None
+
+
+def _month_block(project_id, meta, import_id):
+    """Reads one import into a metric×keyword×domain block, extending the axes with its new keywords/domains"""
+    rows = database.query_project_analytics(project_id, """
+        SELECT keyword_id, domain, position, visibility, clics, media_value
+        FROM domain_rows WHERE import_id = ?
+    """, (import_id,))
+
+    kw_index = {k: i for i, k in enumerate(meta['keyword_ids'])}
+    for k in sorted(set(rows['keyword_id'].astype(int)) - kw_index.keys()):
+        kw_index[k] = len(meta['keyword_ids'])
+        meta['keyword_ids'].append(k)
+    dom_index = {d: i for i, d in enumerate(meta['domains'])}
+    for d in sorted(set(rows['domain']) - dom_index.keys()):
+        dom_index[d] = len(meta['domains'])
+        meta['domains'].append(d)
+
+    block = np.full((len(database.PANEL_METRICS), len(meta['keyword_ids']), len(meta['domains'])), np.nan, dtype=np.float32)
+    kw_rows = rows['keyword_id'].astype(int).map(kw_index).to_numpy()
+    dom_cols = rows['domain'].map(dom_index).to_numpy()
+    for m, metric in enumerate(database.PANEL_METRICS):
+        block[m, kw_rows, dom_cols] = rows[metric].to_numpy(dtype=np.float32)
+    return block
+
+
+def sync_cube(project_id, rebuild=False):
+    """
+    Brings the cube of a project in line with its imports: writes the months that
+    are new or were re-uploaded (data_version changed) and drops deleted ones;
+    rebuild=True rewrites every month from scratch (new generation). Writers only:
+    called after uploads and deletes. Returns the cube metadata.
+    """
+    imports = database.get_project_imports(project_id)
+    current = {str(int(imp['id'])): imp for _, imp in imports.iterrows()}
+    path = cube_dir(project_id)
+
+    with _writer_lock(project_id):
+        old_meta = _read_meta(project_id)
+        if old_meta is None or rebuild:
+            meta = _empty_meta(old_meta['generation'] + 1 if old_meta else 0)
+        else:
+            meta = json.loads(json.dumps(old_meta))
+        deleted = set(meta['months']) - current.keys()
+        for import_id in deleted:
+            del meta['months'][import_id]
+
+        pending = [
+            (import_id, imp) for import_id, imp in sorted(current.items(), key=lambda item: item[1]['month'])
+            if meta['months'].get(import_id, {}).get('data_version') != int(imp['data_version'])
+        ]
+        if not pending and not deleted and old_meta is not None and not rebuild:
+            return old_meta
+
+        os.makedirs(path, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=path)
+        try:
+            for import_id, imp in pending:
+                block = _month_block(project_id, meta, int(import_id))
+                file_name = f"g{meta['generation']}-{import_id}-v{int(imp['data_version'])}.npy"
+                with open(os.path.join(staging, file_name), "wb") as f:
+                    np.save(f, block)
+                meta['months'][import_id] = {
+                    'month': imp['month'], 'data_version': int(imp['data_version']), 'file': file_name
+                }
+            with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            # Month files first, meta.json last: readers switch to the new cube atomically
+            for file_name in sorted(os.listdir(staging), key=lambda name: name == "meta.json"):
+                os.replace(os.path.join(staging, file_name), os.path.join(path, file_name))
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        # Files the new meta no longer references (readers holding them mapped keep
+        # their copy) and staging dirs left by an interrupted sync
+        live = {info['file'] for info in meta['months'].values()}
+        for file_name in os.listdir(path):
+            file_path = os.path.join(path, file_name)
+            if file_name.startswith(".staging-"):
+                shutil.rmtree(file_path, ignore_errors=True)
+            elif file_name.endswith(".npy") and file_name not in live:
+                try:
+                    os.remove(file_path)
+                except OSError as e:
+                    print(f"Could not remove obsolete cube file {file_name}: {e}")
+    return meta
+
+
+def delete_cube(project_id):
+    with _writer_lock(project_id):
+        shutil.rmtree(cube_dir(project_id), ignore_errors=True)
+
+
+def load_panel(project_id, keyword_ids=None, domains=None, import_ids=None):
+    """
+    Keyword×month panel read from the cube, in the same format as
+    database.get_keyword_panel (without the 'keywords' text array): metric arrays
+    shaped domain×keyword×month. keyword_ids / domains / import_ids restrict it.
+    Read-only: raises StaleCube if the cube lacks a requested month or holds an
+    older data_version of it.
+    """
+    meta = _read_meta(project_id)
+    if meta is None:
+        raise StaleCube(f"no history cube for project {project_id}")
+    imports = database.get_project_imports(project_id)
+    versions = {str(int(imp['id'])): int(imp['data_version']) for _, imp in imports.iterrows()}
+    wanted_imports = set(versions) if import_ids is None else {str(int(i)) for i in import_ids} & versions.keys()
+    for import_id in wanted_imports:
+        if meta['months'].get(import_id, {}).get('data_version') != versions[import_id]:
+            raise StaleCube(f"history cube of project {project_id} is behind import {import_id}")
+    months = sorted(
+        ((import_id, info) for import_id, info in meta['months'].items() if import_id in wanted_imports),
+        key=lambda item: item[1]['month']
+    )
+
+    all_keyword_ids = np.asarray(meta['keyword_ids'], dtype=np.int64)
+    kw_order = np.argsort(all_keyword_ids, kind="stable")
+    if keyword_ids is not None:
+        wanted = np.isin(all_keyword_ids[kw_order], np.asarray([int(k) for k in keyword_ids], dtype=np.int64))
+        kw_order = kw_order[wanted]
+    dom_order = np.arange(len(meta['domains']))
+    if domains is not None:
+        dom_order = np.array([i for i, d in enumerate(meta['domains']) if d in set(domains)], dtype=np.int64)
+
+    shape = (len(dom_order), len(kw_order), len(months))
+    arrays = {metric: np.full(shape, np.nan) for metric in database.PANEL_METRICS}
+    for t, (_, info) in enumerate(months):
+        block = np.load(os.path.join(cube_dir(project_id), info['file']), mmap_mode="r")
+        # Axes that grew after this month was written read as NaN
+        kw_ok = kw_order < block.shape[1]
+        dom_ok = dom_order < block.shape[2]
+        sub = block[:, kw_order[kw_ok]][:, :, dom_order[dom_ok]]
+        for m, metric in enumerate(database.PANEL_METRICS):
+            arrays[metric][np.ix_(dom_ok, kw_ok, [t])] = sub[m].T[:, :, None]
+
+    panel = {
+        'keyword_ids': all_keyword_ids[kw_order],
+        'months': np.array([info['month'] for _, info in months], dtype=object),
+        'import_ids': np.array([int(i) for i, _ in months], dtype=np.int64),
+        'domains': [meta['domains'][i] for i in dom_order],
+        'present': ~np.isnan(arrays['visibility']).all(axis=0) if len(dom_order) else np.zeros(shape[1:], dtype=bool)
+    }
+    panel.update(arrays)
+    return panel
@@ -0,0 +1,106 @@
+"""
+Load test for the SQLite concurrency model: N reader threads (the shared-link /
+dashboard read path) run against one writer saving large monthly imports.
+
+Usage:
+    python load_test.py --readers 8 --keywords 20000 --writes 3
+
+Reports reader latency percentiles while the writer is active and the number of
+'database is locked' errors (expected: 0).
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import database
+
+DOMAINS = ["midominio.com", "competidor-a.com", "competidor-b.com", "competidor-c.com"]
+
+
+def make_import_df(n_keywords, seed):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'keyword': [f"keyword de prueba {i}" for i in range(n_keywords)],
+        'volume': rng.integers(10, 10000, n_keywords),
+        'difficulty': rng.integers(0, 100, n_keywords),
+        'cpc': rng.random(n_keywords) * 3,
+        'intent': "N/D"
+    })
+    domain_map = {}
+    for d in DOMAINS:
+        pos_col, vis_col = f"Posición [{d}]", f"Visibilidad [{d}]"
+        df[pos_col] = rng.integers(1, 102, n_keywords)
+        df[vis_col] = rng.random(n_keywords) * 100
+        df[f"clics_{d}"] = df['volume'] * 0.01
+        df[f"media_value_{d}"] = df[f"clics_{d}"] * df['cpc']
+        domain_map[d] = {'position': pos_col, 'visibility': vis_col}
+    return df, domain_map
+
+
+def run(n_readers, n_keywords, n_writes):
+    database.DB_PATH = os.path.join(tempfile.mkdtemp(), "load_test.db")
+    database.init_db()
+    project_id = database.save_project("Load Test", DOMAINS[0])
+
+    # Seed one month so readers have data from the start
+    df, domain_map = make_import_df(n_keywords, seed=0)
+    seed_import_id = database.save_import_data(project_id, "2024-01", "seed.csv", df, domain_map)
+
+    writer_done = threading.Event()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def writer():
+        for i in range(n_writes):
+            w_df, w_map = make_import_df(n_keywords, seed=i + 1)
+            start = time.perf_counter()
+            import_id = database.save_import_data(project_id, f"2024-{i + 2:02d}", f"month_{i}.csv", w_df, w_map)
+            print(f"  writer: import {import_id} ({n_keywords} keywords) in {time.perf_counter() - start:.2f}s")
+        writer_done.set()
+
+    def reader():
+        while not writer_done.is_set():
+            start = time.perf_counter()
+            try:
+                if random.random() < 0.5:
+                    database.load_import_data(seed_import_id)
+                else:
+                    database.get_project_imports(project_id)
+                    database.get_keyword_history(project_id, f"keyword de prueba {random.randrange(n_keywords)}")
+            except sqlite3.OperationalError as e:
+                with lock:
+                    errors.append(str(e))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=reader) for _ in range(n_readers)]
+    threads.append(threading.Thread(target=writer))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    lat_ms = np.array(latencies) * 1000
+    print(f"Readers: {n_readers} | reads: {len(lat_ms)} | locked errors: {len(errors)}")
+    if len(lat_ms):
+        print(f"Read latency ms  p50={np.percentile(lat_ms, 50):.1f}  p95={np.percentile(lat_ms, 95):.1f}  max={lat_ms.max():.1f}")
+    return len(errors) == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--keywords", type=int, default=20000)
+    parser.add_argument("--writes", type=int, default=3)
+    args = parser.parse_args()
+    ok = run(args.readers, args.keywords, args.writes)
+    raise SystemExit(0 if ok else 1)
@@ -0,0 +1,52 @@
+"""
+On-demand deep profiling of one dashboard rerun with cProfile (deterministic).
+The report is a standard .pstats file: open it with `python -m pstats`,
+snakeviz, or convert it to a flame graph (e.g. flameprof, gprof2dot).
+Only the Streamlit script thread is profiled; work on the SQLite writer thread
+and the AI worker shows up as the time spent waiting for them.
+"""
+import cProfile
+import marshal
+import pstats
+import time
+
+import pandas as pd
+
+TOP_FUNCTIONS = 30
+
+
+def start():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def stop(profiler, label):
+    """
+    Stops the profiler. Returns {'label', 'created_at', 'pstats' (bytes of a
+    .pstats file), 'top' (DataFrame of the slowest functions by cumulative time)}
+    """
+    profiler.disable()
+    profiler.create_stats()
+    return {
+        'label': label,
+        'created_at': time.strftime("%Y%m%d-%H%M%S"),
+        # Same format as Profile.dump_stats()
+        'pstats': marshal.dumps(profiler.stats),
+        'top': top_functions(profiler)
+    }
+
+
+def top_functions(profiler, n=TOP_FUNCTIONS):
+    stats = pstats.Stats(profiler)
+    rows = [
+        {
+            'function': f"{name} ({filename}:{line})",
+            'calls': nc,
+            'tottime': tt,
+            'cumtime': ct
+        }
+        for (filename, line, name), (cc, nc, tt, ct, callers) in stats.stats.items()
+    ]
+    df = pd.DataFrame(rows, columns=['function', 'calls', 'tottime', 'cumtime'])
+    return df.sort_values('cumtime', ascending=False).head(n).reset_index(drop=True)
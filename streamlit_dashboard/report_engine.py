@@ -0,0 +1,578 @@
+import pickle
+import zlib
+
+import numpy as np
+import pandas as pd
+
+import database
+import diff_engine
+import etl
+import history_cube
+import intent_rules
+import utils_metrics
+
+# P0.1: a keyword is "at risk" when it drops at least this many positions (or leaves the Top10)
+RISK_MIN_DROP = 2
+
+# Bump when the structure of compute_monthly_report() / compute_global_report()
+# or of a REPORT_SECTIONS value changes: older snapshots are rebuilt
+SNAPSHOT_VERSION = 6
+
+# Keywords in the "Top N evolution vs competition" block of the monthly view
+TOP_KEYWORDS_N = 15
+TOP_METRIC_KEYS = {'clicks': 'clics', 'visibility': 'visibility', 'position': 'position'}
+TOP_METRIC_LABELS = {'clicks': "Clics estimados", 'visibility': "Visibilidad", 'position': "Posición"}
+
+# Most volatile keywords of the main domain shown in the global view
+VOLATILITY_TOP_N = 20
+
+
+def normalize_domain(domain):
+    if not domain:
+        return ""
+    d = str(domain).strip().lower()
+    d = d.replace("https://", "").replace("http://", "")
+    if d.startswith("www."):
+        d = d[4:]
+    return d
+
+def resolve_main_domain(main_domain, domain_map):
+    """
+    Intenta resolver el dominio principal contra los dominios detectados en el CSV.
+    Devuelve (resolved_domain, note) donde note es un mensaje si hubo ajuste.
+    """
+    if not domain_map:
+        return main_domain, None
+
+    if main_domain in domain_map:
+        return main_domain, None
+
+    norm_main = normalize_domain(main_domain)
+    for d in domain_map.keys():
+        if normalize_domain(d) == norm_main:
+            return d, f"Dominio principal normalizado a '{d}'"
+
+    base = norm_main.split('.')[0] if norm_main else ""
+    if base:
+        candidates = [d for d in domain_map.keys() if normalize_domain(d).split('.')[0] == base]
+        if len(candidates) == 1:
+            return candidates[0], f"Dominio principal ajustado a '{candidates[0]}' por coincidencia de marca"
+
+    # Fallback conservador: usar primer dominio detectado
+    first_domain = list(domain_map.keys())[0]
+    return first_domain, f"Dominio principal ajustado a '{first_domain}' (no se encontró coincidencia exacta)"
+
+def select_top_keywords(panel, selected_domain, metric_type, top_n=TOP_KEYWORDS_N, month=-1):
+    """
+    Rows (keyword axis) of the panel's top_n keywords of `month` for the selected domain:
+    most clicks/visibility or best position, keywords without a value last.
+    """
+    d = panel['domains'].index(selected_domain)
+    candidates = np.flatnonzero(panel['present'][:, month])
+    values = panel[TOP_METRIC_KEYS[metric_type]][d, candidates, month]
+    sort_key = values if metric_type == "position" else -values
+    order = np.argsort(np.where(np.isnan(sort_key), np.inf, sort_key), kind="stable")
+    return candidates[order[:top_n]]
+
+def select_reference_competitors(panel, selected_domain, metric_type, kw_rows, month=-1):
+    """
+    Reference competitor per keyword row, vectorized over the domain axis: the other
+    domain with most clicks/visibility (argmax) or best position (argmin) in `month`.
+    Returns an object array of domains (None where no competitor has data).
+    """
+    values = panel[TOP_METRIC_KEYS[metric_type]][:, kw_rows, month].copy()
+    others = np.array([d != selected_domain for d in panel['domains']])
+    domains = np.array(panel['domains'] + [None], dtype=object)
+    if metric_type == "position":
+        values = np.where(np.isnan(values) | ~others[:, None], np.inf, values)
+        best = values.argmin(axis=0)
+        has_competitor = np.isfinite(values.min(axis=0)) if len(values) else np.zeros(len(kw_rows), dtype=bool)
+    else:
+        values = np.where(others[:, None], np.nan_to_num(values), -np.inf)
+        best = values.argmax(axis=0)
+        has_competitor = values.max(axis=0) > 0 if len(values) else np.zeros(len(kw_rows), dtype=bool)
+    return domains[np.where(has_competitor, best, -1)]
+
+def build_top_keywords_evolution(project_id, selected_domain, imports_list, top_n=TOP_KEYWORDS_N):
+    """
+    Top N keywords por clics estimados del último mes (leídas del cubo histórico).
+    Devuelve:
+      - summary_df: tabla rápida (último mes)
+      - evo_df: histórico long con columnas month, keyword, role, domain, position, metric
+      - last_month: string YYYY-MM
+      - reason: motivo si no hay datos suficientes
+      - metric_label: métrica utilizada para el Top N
+      - metric_type: clicks | visibility | position
+    """
+    if imports_list.empty:
+        return None, None, None, "No hay meses cargados", None, None
+
+    # One panel read for every month: the Top N comes from the latest month with
+    # data and its history from the same panel
+    panel = load_keyword_panel(project_id, import_ids=imports_list['id'])
+    months_with_data = np.flatnonzero(panel['present'].any(axis=0)) if len(panel['months']) else []
+    if len(months_with_data) == 0:
+        # imports_list is ordered newest first
+        return None, None, imports_list.iloc[-1]['month'], "No hay datos válidos en los meses cargados", None, None
+    t = int(months_with_data[-1])
+    last_month = panel['months'][t]
+
+    # Determine best available metric for Top N
+    metric_type = None
+    if selected_domain in panel['domains']:
+        d = panel['domains'].index(selected_domain)
+        if np.nansum(panel['clics'][d, :, t]) > 0:
+            metric_type = "clicks"
+        elif np.nansum(panel['visibility'][d, :, t]) > 0:
+            metric_type = "visibility"
+        elif (~np.isnan(panel['position'][d, :, t])).any():
+            metric_type = "position"
+    if metric_type is None:
+        return None, None, last_month, "No hay clics/visibilidad/posición disponibles para el dominio seleccionado", None, None
+    metric_label = TOP_METRIC_LABELS[metric_type]
+    metric_key = TOP_METRIC_KEYS[metric_type]
+
+    top_rows = select_top_keywords(panel, selected_domain, metric_type, top_n, month=t)
+    if len(top_rows) == 0:
+        return None, None, last_month, f"No hay suficientes keywords para el Top {top_n}", None, None
+
+    top_ids = panel['keyword_ids'][top_rows]
+    if 'keywords' in panel:
+        top_keywords = panel['keywords'][top_rows]
+    else:
+        names = database.get_keyword_names(top_ids)
+        top_keywords = np.array([names.get(int(k)) for k in top_ids], dtype=object)
+    competitors = select_reference_competitors(panel, selected_domain, metric_type, top_rows, month=t)
+    has_competitor = np.array([c is not None for c in competitors], dtype=bool)
+
+    # keyword×month series of each keyword's own domain and of its reference competitor
+    main_series = panel_domain_series(panel, [selected_domain] * len(top_rows), top_rows, [metric_key, 'position'])
+    comp_series = panel_domain_series(panel, competitors, top_rows, [metric_key, 'position'])
+    main_metric, main_pos = [s[:, t] for s in main_series]
+    comp_metric, comp_pos = [s[:, t] for s in comp_series]
+    if metric_type == "clicks":
+        main_metric = np.nan_to_num(main_metric)
+
+    summary_df = pd.DataFrame({
+        'Keyword': top_keywords,
+        f'{metric_label} (tu dominio)': main_metric,
+        'Competidor referencia': [c or "—" for c in competitors],
+        f'{metric_label} (competidor)': pd.Series(comp_metric).where(has_competitor, None)
+    })
+    # Append positions if metric is not position
+    if metric_type != "position":
+        summary_df['Posición (tu dominio)'] = main_pos
+        summary_df['Posición (competidor)'] = pd.Series(comp_pos).where(has_competitor, None)
+
+    evo_parts = []
+    for role, role_domains, (metrics, positions) in (
+        ('Tu dominio', [selected_domain] * len(top_rows), main_series),
+        ('Competencia', list(competitors), comp_series)
+    ):
+        if metric_type != "position":
+            metrics = np.nan_to_num(metrics)
+        has_domain = np.array([d is not None for d in role_domains], dtype=bool)[:, None]
+        k, m = np.nonzero(panel['present'][top_rows] & has_domain)
+        evo_parts.append(pd.DataFrame({
+            'month': panel['months'][m],
+            'keyword': top_keywords[k],
+            'role': role,
+            'domain': np.array(role_domains, dtype=object)[k],
+            'position': positions[k, m],
+            'metric': metrics[k, m]
+        }))
+    evo_df = pd.concat(evo_parts, ignore_index=True)
+    if evo_df.empty:
+        evo_df = None
+    return summary_df, evo_df, last_month, None, metric_label, metric_type
+
+def load_keyword_panel(project_id, keyword_ids=None, import_ids=None):
+    """History panel from the on-disk cube, or straight from SQLite if the cube is missing, behind or unreadable"""
+    try:
+        return history_cube.load_panel(project_id, keyword_ids=keyword_ids, import_ids=import_ids)
+    except (OSError, history_cube.StaleCube) as e:
+        print(f"History cube unavailable, reading from SQLite: {e}")
+        return database.get_keyword_panel(project_id, keyword_ids=keyword_ids, import_ids=import_ids)
+
+def panel_domain_series(panel, domains, kw_rows, metrics):
+    """
+    Slices a keyword panel (database.get_keyword_panel): for each keyword row kw_rows[i]
+    the keyword×month series of domains[i] (None or a domain missing from the panel give NaN).
+    Returns one keyword×month array per metric.
+    """
+    domain_index = {d: i for i, d in enumerate(panel['domains'])}
+    d_idx = np.array([domain_index.get(d, -1) for d in domains], dtype=np.int64)
+    valid = (d_idx >= 0)[:, None]
+    return [np.where(valid, panel[metric][d_idx.clip(min=0), kw_rows], np.nan) if len(panel['domains'])
+            else np.full((len(kw_rows), len(panel['months'])), np.nan)
+            for metric in metrics]
+
+def enrich_intents(df, validated_intents):
+    """
+    Adds intent / origin_intent columns.
+    Priority: 1. Validated ({keyword_id: intent}), 2. Suggested by intent_rules.
+    """
+    def enrich_row(row):
+        if row['keyword_id'] in validated_intents:
+            return validated_intents[row['keyword_id']], "Validada"
+        else:
+            suggestion = intent_rules.infer_intent(row['keyword'])
+            return suggestion['intent_suggested'], "Sugerida"
+
+    intent_results = df.apply(enrich_row, axis=1)
+    df['intent'] = [r[0] for r in intent_results]
+    df['origin_intent'] = [r[1] for r in intent_results]
+    return df
+
+
+def compute_monthly_report(import_id):
+    """
+    Runs the monthly pipeline for one import: load, SoV, HHI, opportunities,
+    intent enrichment and MoM deltas/risks. Returns a dict with the tables and
+    values the monthly view renders (report['empty'] is True when the import has
+    no keywords); parts only one tab needs are in REPORT_SECTIONS.
+    """
+    imp = database.get_import(import_id)
+    if imp is None:
+        return None
+
+    project_id = imp['project_id']
+    main_domain = imp['main_domain']
+    df, domain_map = database.load_import_data(import_id)
+    report = {
+        'import_id': import_id,
+        'project_id': project_id,
+        'main_domain': main_domain,
+        'analysis_month': imp['month'],
+        'empty': df.empty
+    }
+    if df.empty:
+        return report
+
+    selected_domain, domain_note = resolve_main_domain(main_domain, domain_map)
+
+    # Metrics Calculation
+    sov_df = etl.calculate_sov(df, domain_map, selected_domain)
+    sov_rows = sov_df[sov_df['domain'] == selected_domain]
+    main_sov = sov_rows['sov'].values[0] if not sov_rows.empty else 0
+    opportunities = etl.get_striking_distance(df, domain_map, selected_domain)
+
+    # --- PHASE 4: INTENT ENRICHMENT ---
+    # {keyword_id: intent} resolved in SQL through the keyword dictionary
+    enrich_intents(df, database.get_validated_intents_for_import(import_id))
+
+    # Also update opportunities DF (it's a subset/copy with the same index)
+    if not opportunities.empty:
+        opportunities['intent'] = df.loc[opportunities.index, 'intent']
+        opportunities['origin_intent'] = df.loc[opportunities.index, 'origin_intent']
+
+    pos_col = domain_map.get(selected_domain, {}).get('position')
+
+    # Advanced Metrics Totals
+    total_clics = df[f'clics_{selected_domain}'].sum() if f'clics_{selected_domain}' in df.columns else 0
+    total_media_value = df[f'media_value_{selected_domain}'].sum() if f'media_value_{selected_domain}' in df.columns else 0
+
+    # --- MoM TREND CALCULATION + P0.1/P0.4 ENHANCEMENTS ---
+    diff_engine.refresh_project_diffs(project_id)  # no-op when the stored diffs are current
+    prev_month_id = None
+    imports_list = database.get_project_imports(project_id)
+    n_meses = len(imports_list)  # P0.4: Track historical depth
+    current_idx = imports_list[imports_list['id'] == import_id].index[0]
+    if current_idx + 1 < len(imports_list):
+        prev_month_id = int(imports_list.iloc[current_idx + 1]['id'])
+
+    delta_sov = None
+    delta_clics = None
+    delta_top3 = None
+    delta_top10 = None
+    risks_count = 0  # P0.1: Keywords with significant drops
+
+    # Calculate current Top3 and Top10
+    top_3 = len(df[df[pos_col] <= 3]) if pos_col else 0
+    top_10 = len(df[df[pos_col] <= 10]) if pos_col else 0
+
+    if prev_month_id:
+        df_prev, domain_map_prev = database.load_import_data(prev_month_id)
+        if not df_prev.empty:
+            # Calculate previous SoV
+            sov_df_prev = etl.calculate_sov(df_prev, domain_map_prev, selected_domain)
+            prev_sov = sov_df_prev[sov_df_prev['domain'] == selected_domain]['sov'].values[0] if not sov_df_prev.empty else 0
+            delta_sov = main_sov - prev_sov
+
+            # Calculate previous Clics
+            prev_clics = df_prev[f'clics_{selected_domain}'].sum() if f'clics_{selected_domain}' in df_prev.columns else 0
+            delta_clics = total_clics - prev_clics
+
+            # Calculate previous Top3/Top10
+            prev_pos_col = domain_map_prev.get(selected_domain, {}).get('position')
+            if prev_pos_col:
+                prev_top3 = len(df_prev[df_prev[prev_pos_col] <= 3])
+                prev_top10 = len(df_prev[df_prev[prev_pos_col] <= 10])
+                delta_top3 = top_3 - prev_top3
+                delta_top10 = top_10 - prev_top10
+
+                # P0.1: Risks (keywords that dropped >=2 positions or left Top10),
+                # read from the stored MoM diff computed when the import was saved
+                risks_count = database.count_risk_keywords(import_id, selected_domain, min_drop=RISK_MIN_DROP)
+
+    report.update({
+        'df': df,
+        'domain_map': domain_map,
+        'selected_domain': selected_domain,
+        'domain_note': domain_note,
+        'sov_df': sov_df,
+        'main_sov': main_sov,
+        # (value, interpretation, color), None without competition data
+        'hhi': etl.calculate_hhi(sov_df) if not sov_df.empty and 'sov' in sov_df.columns else None,
+        'opportunities': opportunities,
+        'pos_col': pos_col,
+        'top_3': top_3,
+        'top_10': top_10,
+        'total_clics': total_clics,
+        'total_media_value': total_media_value,
+        'delta_sov': delta_sov,
+        'delta_clics': delta_clics,
+        'delta_top3': delta_top3,
+        'delta_top10': delta_top10,
+        'risks_count': risks_count,
+        'n_meses': n_meses,
+        'last_month': imports_list.iloc[0]['month'] if not imports_list.empty else "N/A"
+    })
+    return report
+
+
+def _top15_section(report):
+    imports_list = database.get_project_imports(report['project_id'])
+    # Months up to the report's: uploading a later month leaves the section valid
+    imports_list = imports_list[imports_list['month'] <= report['analysis_month']]
+    return build_top_keywords_evolution(report['project_id'], report['selected_domain'], imports_list)
+
+
+# Parts of the monthly report that only one tab renders: computed the first time
+# the tab is shown and stored per import, invalidated together with the snapshots
+REPORT_SECTIONS = {
+    'top15': _top15_section
+}
+
+
+def get_report_section(report, section, rebuild=False):
+    """Stored value of REPORT_SECTIONS[section] for the report's import, computed on first use (or rebuild=True)"""
+    import_id = int(report['import_id'])
+    row = None if rebuild else database.get_report_section(import_id, section)
+    if row is not None and row['version'] == SNAPSHOT_VERSION:
+        try:
+            return pickle.loads(zlib.decompress(row['payload']))
+        except Exception as e:
+            print(f"Unreadable report section {section} for import {import_id}: {e}")
+    value = REPORT_SECTIONS[section](report)
+    payload = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    database.save_report_section(import_id, int(report['project_id']), section, SNAPSHOT_VERSION, payload)
+    return value
+
+
+# ============================================
+# Read-only snapshots (shared links)
+# ============================================
+
+def monthly_ai_inputs(report):
+    """(summary_stats, opportunities_sample) strings sent to the monthly AI report"""
+    stats_str = (
+        f"Dom: {report['selected_domain']}, SoV: {report['main_sov']:.2f}%, Top 10: {report['top_10']}, "
+        f"Clics Est: {report['total_clics']:.0f}, Media Value: {report['total_media_value']:.0f}€"
+    )
+    return stats_str, report['opportunities'].head(10).to_string(index=False)
+
+
+def compute_global_report(project_id):
+    """
+    Runs the global (cross-month) pipeline of a project: resolves the main domain,
+    aggregates every month × domain (SoV, traffic, value) in one analytical query
+    and hardens the visibility series of every domain. Returns a dict with what the
+    global view renders (report['history'] is None when there is no data).
+    """
+    projects = database.get_projects()
+    project = projects[projects['id'] == int(project_id)]
+    if project.empty:
+        return None
+    main_domain = project.iloc[0]['main_domain']
+    imports_list = database.get_project_imports(project_id)
+
+    report = {
+        'project_id': int(project_id),
+        'main_domain': main_domain,
+        'resolved_domain': main_domain,
+        'domain_note': None,
+        'n_meses': len(imports_list),
+        'last_month': imports_list.iloc[0]['month'] if not imports_list.empty else None,
+        'domain_totals': None,
+        'sov_matrix': None,  # month × domain SoV, hardened (utils_metrics.harden_visibility_matrix)
+        'history': None,
+        'stats_summary': None,
+        'vis_stats': None,
+        'volatility': None  # most volatile rankings of the main domain (database.get_position_volatility)
+    }
+    if imports_list.empty:
+        return report
+
+    domain_totals = database.get_domain_month_totals(project_id)
+    last_import_id = int(imports_list.iloc[0]['id'])
+    last_domains = domain_totals[domain_totals['import_id'] == last_import_id]['domain']
+    resolved_domain, domain_note = resolve_main_domain(main_domain, {d: {} for d in last_domains})
+
+    history_data = []
+    for month, month_rows in domain_totals.groupby('month'):
+        main_rows = month_rows[month_rows['domain'] == resolved_domain]
+        history_data.append({
+            'Mes': month,
+            'SoV': main_rows['sov'].values[0] if not main_rows.empty else 0,
+            'Tráfico': main_rows['clics'].values[0] if not main_rows.empty else 0,
+            'Ahorro': main_rows['media_value'].values[0] if not main_rows.empty else 0
+        })
+
+    report.update({
+        'resolved_domain': resolved_domain,
+        'domain_note': domain_note,
+        'domain_totals': domain_totals,
+        'sov_matrix': utils_metrics.harden_visibility_matrix(
+            domain_totals.pivot(index='month', columns='domain', values='sov').sort_index()
+        )
+    })
+    if history_data:
+        h_df = pd.DataFrame(history_data).sort_values('Mes')
+        report['history'] = h_df
+        # The AI summary uses the raw series; the view shows the hardened one
+        report['stats_summary'] = h_df.to_string(index=False)
+        report['vis_stats'] = utils_metrics.get_visibility_stats(h_df['SoV'])
+    if len(imports_list) >= 2:
+        report['volatility'] = database.get_position_volatility(project_id, resolved_domain).head(VOLATILITY_TOP_N)
+    return report
+
+
+# Main-domain metrics of the portfolio view (import_domain_totals columns)
+PORTFOLIO_METRICS = ('sov', 'clics', 'media_value', 'top10')
+
+
+def compute_portfolio():
+    """
+    Latest month of every project, from the stored per-import totals (one query):
+    SoV, clics, media value and Top10 of the project's main domain, plus delta_<metric>
+    against the previous import (NaN for a project's first month).
+    Returns a DataFrame with one row per project.
+    """
+    totals = database.get_portfolio_totals(months=2)
+    projects = totals.drop_duplicates('project_id')[['project_id', 'name', 'main_domain']].set_index('project_id')
+
+    # Main domain resolved against the domains of the latest month (as in the global report)
+    latest = totals[totals['month_rank'] == 1]
+    latest_domains = latest.dropna(subset=['domain']).groupby('project_id', sort=False)['domain'].agg(list)
+    resolved = {
+        pid: resolve_main_domain(projects.at[pid, 'main_domain'], {d: {} for d in domains})[0]
+        for pid, domains in latest_domains.items()
+    }
+    main_rows = totals[totals['domain'] == totals['project_id'].map(resolved)]
+
+    current = main_rows[main_rows['month_rank'] == 1].set_index('project_id')
+    previous = main_rows[main_rows['month_rank'] == 2].set_index('project_id')
+    # Imports without the main domain count as 0, projects with a single month have no delta
+    has_prev = totals.loc[totals['month_rank'] == 2, 'project_id'].unique()
+
+    portfolio = projects.rename(columns={'main_domain': 'domain'})
+    portfolio['domain'] = pd.Series(resolved).reindex(portfolio.index).fillna(portfolio['domain'])
+    portfolio['month'] = latest.drop_duplicates('project_id').set_index('project_id')['month'].reindex(portfolio.index)
+    for metric in PORTFOLIO_METRICS:
+        cur = current[metric].reindex(portfolio.index)
+        prev = previous[metric].reindex(portfolio.index)
+        portfolio[metric] = cur.where(portfolio['month'].isna(), cur.fillna(0))
+        portfolio[f'delta_{metric}'] = (portfolio[metric] - prev.fillna(0)).where(portfolio.index.isin(has_prev))
+    return portfolio.reset_index().sort_values('name').reset_index(drop=True)
+
+
+def build_global_snapshot(project_id):
+    """Computes the global report once and stores it as the project's snapshot"""
+    report = compute_global_report(project_id)
+    if report is None:
+        return None
+    payload = zlib.compress(pickle.dumps(report, protocol=pickle.HIGHEST_PROTOCOL))
+    database.save_project_snapshot(int(project_id), SNAPSHOT_VERSION, payload)
+    return report
+
+
+def get_global_report_snapshot(project_id):
+    """Serves the stored global report, rebuilding it only if it was invalidated"""
+    row = database.get_project_snapshot(int(project_id))
+    if row is not None and row['version'] == SNAPSHOT_VERSION:
+        try:
+            return pickle.loads(zlib.decompress(row['payload']))
+        except Exception as e:
+            print(f"Unreadable global snapshot for project {project_id}: {e}")
+    return build_global_snapshot(project_id)
+
+
+def build_import_snapshot(import_id):
+    """Computes the monthly report once and stores it as the import's snapshot"""
+    report = compute_monthly_report(import_id)
+    if report is None:
+        return None
+    payload = zlib.compress(pickle.dumps(report, protocol=pickle.HIGHEST_PROTOCOL))
+    database.save_import_snapshot(import_id, report['project_id'], SNAPSHOT_VERSION, payload)
+    return report
+
+
+def load_import_snapshot(import_id):
+    """Returns the stored report for an import, or None if missing, outdated or unreadable"""
+    row = database.get_import_snapshot(import_id)
+    if row is None or row['version'] != SNAPSHOT_VERSION:
+        return None
+    try:
+        return pickle.loads(zlib.decompress(row['payload']))
+    except Exception as e:
+        print(f"Unreadable snapshot for import {import_id}: {e}")
+        return None
+
+
+def rebuild_stale_reports(project_id):
+    """
+    Rebuilds the stored reports of a project that a write invalidated (monthly
+    snapshots, REPORT_SECTIONS, global snapshot), so reads never run the pipeline.
+    Returns the number of monthly snapshots built.
+    """
+    built = 0
+    for import_id in database.get_imports_missing_snapshot(project_id, SNAPSHOT_VERSION):
+        build_import_snapshot(import_id)
+        built += 1
+    for section in REPORT_SECTIONS:
+        for import_id in database.get_imports_missing_section(project_id, section, SNAPSHOT_VERSION):
+            report = get_monthly_report_snapshot(import_id)
+            if report is not None and not report['empty']:
+                get_report_section(report, section, rebuild=True)
+    if database.get_project_snapshot(int(project_id)) is None:
+        build_global_snapshot(project_id)
+    return built
+
+
+def refresh_after_import_change(project_id):
+    """
+    Post-write hook for uploads and deletes: recomputes the MoM diffs that became
+    stale, extends (upload) or rebuilds (delete) the history cube and rebuilds the
+    stored reports that depended on the changed month. Returns the number of
+    monthly snapshots built.
+    """
+    diff_engine.refresh_project_diffs(project_id)
+    try:
+        history_cube.sync_cube(project_id)
+    except OSError as e:
+        print(f"Error updating history cube: {e}")
+    return rebuild_stale_reports(project_id)
+
+
+def get_monthly_report_snapshot(import_id):
+    """Snapshot read path: serves the stored report, rebuilding it only if it was invalidated"""
+    report = load_import_snapshot(import_id)
+    if report is None:
+        report = build_import_snapshot(import_id)
+    if report is not None:
+        # Project depth changes with every upload; it is read live, not from the snapshot
+        imports_list = database.get_project_imports(report['project_id'])
+        report['n_meses'] = len(imports_list)
+        report['last_month'] = imports_list.iloc[0]['month'] if not imports_list.empty else "N/A"
+    return report
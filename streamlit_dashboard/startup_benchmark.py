@@ -0,0 +1,122 @@
+"""
+Startup benchmark for the dashboard: cold start (fresh interpreter importing the
+app's modules and running the one-time initialization) and warm rerun (the work
+every Streamlit rerun repeats in an already warm process).
+
+Usage:
+    python startup_benchmark.py --runs 5
+
+If Streamlit is installed the warm rerun is measured on app.py itself through
+streamlit.testing (AppTest); otherwise only the per-rerun startup path is timed.
+The import cost of the heavy optional libraries is reported separately: the app
+only loads them when a view needs them.
+"""
+import argparse
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import database
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_MODULES = ["database", "etl", "intent_rules", "ai_reports", "report_engine", "exports", "history_cube"]
+LAZY_MODULES = ["streamlit", "plotly.express", "google.generativeai"]
+
+COLD_START_SNIPPET = """
+import sys, time
+start = time.perf_counter()
+import {modules}
+database.DB_PATH = sys.argv[1]
+database.ensure_db()
+database.begin_request()
+database.get_projects()
+print(time.perf_counter() - start)
+"""
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+
+def _time_subprocess(snippet, *args):
+    out = subprocess.run([sys.executable, "-c", snippet, *args], cwd=APP_DIR, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def _summary(label, seconds):
+    ms = np.array(seconds) * 1000
+    print(f"{label:<28} p50={np.percentile(ms, 50):8.1f} ms  max={ms.max():8.1f} ms  (n={len(ms)})")
+
+
+def cold_start(db_path, runs):
+    snippet = COLD_START_SNIPPET.format(modules=", ".join(APP_MODULES))
+    return [_time_subprocess(snippet, db_path) for _ in range(runs)]
+
+
+def lazy_import_costs(runs):
+    costs = {}
+    for module in LAZY_MODULES:
+        if importlib.util.find_spec(module.split(".")[0]) is None:
+            costs[module] = None
+            continue
+        costs[module] = [_time_subprocess(IMPORT_SNIPPET.format(module=module)) for _ in range(runs)]
+    return costs
+
+
+def warm_rerun(runs):
+    """Times reruns of app.py with AppTest, or the per-rerun startup path without Streamlit"""
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        AppTest = None
+
+    if AppTest is not None:
+        app = AppTest.from_file(os.path.join(APP_DIR, "app.py"), default_timeout=60)
+        app.run()  # first run pays the one-time initialization
+        label = "warm rerun (app.py)"
+        rerun = app.run
+    else:
+        database.ensure_db()
+        label = "warm rerun (startup path)"
+
+        def rerun():
+            database.ensure_db()
+            database.begin_request()
+            database.get_projects()
+
+    seconds = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        rerun()
+        seconds.append(time.perf_counter() - start)
+    return label, seconds
+
+
+def run(runs):
+    database.DB_PATH = os.path.join(tempfile.mkdtemp(), "startup_benchmark.db")
+    database.init_db()
+    database.save_project("Benchmark", "midominio.com")
+
+    _summary("cold start", cold_start(database.DB_PATH, runs))
+    for module, seconds in lazy_import_costs(runs).items():
+        if seconds is None:
+            print(f"{'import ' + module:<28} not installed")
+        else:
+            _summary(f"import {module}", seconds)
+    label, seconds = warm_rerun(runs)
+    _summary(label, seconds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    run(args.runs)
@@ -0,0 +1,144 @@
+"""
+Always-on render latency telemetry for the dashboard: named sections of every
+rerun (data load, AI, tabs, charts, total) are timed, buffered in memory and
+written to the render_timings table in batches, tagged with the release that
+rendered them. The admin performance page reads them back as p50/p95 per view
+and section, and flags sections whose p95 grew after a deploy.
+"""
+import hashlib
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+import database
+
+RELEASE_ENV_VAR = "SEO_APP_RELEASE"
+# Buffered samples are written at most every FLUSH_SECONDS (or once FLUSH_MAX_SAMPLES pile up)
+FLUSH_SECONDS = 30
+FLUSH_MAX_SAMPLES = 500
+RETENTION_DAYS = 30
+# Regression: p95 of the newest release >= REGRESSION_RATIO × p95 of the previous one
+REGRESSION_RATIO = 1.25
+REGRESSION_MIN_SAMPLES = 20
+
+_buffer = []
+_buffer_lock = threading.Lock()
+_last_flush = time.time()
+_release = None
+
+
+def _source_hash():
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(app_dir)):
+        if name.endswith(".py"):
+            with open(os.path.join(app_dir, name), "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def current_release():
+    """SEO_APP_RELEASE, or a hash of the dashboard sources (changes with every deploy)"""
+    global _release
+    if _release is None:
+        _release = os.environ.get(RELEASE_ENV_VAR) or _source_hash()
+    return _release
+
+
+def record(view, section_name, seconds):
+    with _buffer_lock:
+        _buffer.append((time.time(), current_release(), view, section_name, float(seconds)))
+
+
+@contextmanager
+def section(view, name):
+    """Times the enclosed block as one sample of view/name (also when it raises, e.g. st.stop)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(view, name, time.perf_counter() - start)
+
+
+def flush(force=False):
+    """Writes the buffered samples when a flush is due (or force=True). Returns the number written"""
+    global _last_flush
+    with _buffer_lock:
+        due = force or len(_buffer) >= FLUSH_MAX_SAMPLES or time.time() - _last_flush >= FLUSH_SECONDS
+        if not due or not _buffer:
+            return 0
+        rows = list(_buffer)
+        _buffer.clear()
+        _last_flush = time.time()
+    try:
+        database.save_render_timings(rows)
+    except Exception as e:
+        print(f"Telemetry flush failed: {e}")
+        return 0
+    return len(rows)
+
+
+# ============================================
+# Reporting (admin page)
+# ============================================
+
+def load_samples(days=RETENTION_DAYS):
+    """Samples of the last `days` days; older ones are purged first"""
+    flush(force=True)
+    database.purge_render_timings(time.time() - RETENTION_DAYS * 86400)
+    return database.get_render_timings(time.time() - days * 86400)
+
+
+def percentiles(samples, by):
+    """samples / p50 / p95 (seconds) per group"""
+    if samples.empty:
+        return pd.DataFrame(columns=list(by) + ['samples', 'p50', 'p95'])
+    grouped = samples.groupby(list(by))['seconds']
+    return pd.DataFrame({
+        'samples': grouped.size(),
+        'p50': grouped.quantile(0.5),
+        'p95': grouped.quantile(0.95)
+    }).reset_index()
+
+
+def daily_percentiles(samples):
+    """percentiles() per view, section and day"""
+    days = samples.assign(day=pd.to_datetime(samples['recorded_at'], unit='s').dt.strftime('%Y-%m-%d'))
+    return percentiles(days, ['view', 'section', 'day'])
+
+
+def regressions(samples):
+    """
+    p50/p95 per view and section for the newest release (by first sample) against
+    the release before it. Returns (df, newest_release, previous_release); df has
+    p95_prev, ratio and a 'regression' flag (needs REGRESSION_MIN_SAMPLES on both sides).
+    """
+    releases = samples.groupby('release')['recorded_at'].min().sort_values().index.tolist()
+    if not releases:
+        return percentiles(samples, ['view', 'section']), None, None
+    newest = releases[-1]
+    previous = releases[-2] if len(releases) > 1 else None
+
+    table = percentiles(samples[samples['release'] == newest], ['view', 'section'])
+    if previous is None:
+        table['samples_prev'] = 0
+        table['p95_prev'] = np.nan
+    else:
+        prev = percentiles(samples[samples['release'] == previous], ['view', 'section'])
+        table = table.merge(
+            prev[['view', 'section', 'samples', 'p95']].rename(columns={'samples': 'samples_prev', 'p95': 'p95_prev'}),
+            on=['view', 'section'], how='left'
+        )
+        table['samples_prev'] = table['samples_prev'].fillna(0).astype(int)
+    table['ratio'] = table['p95'] / table['p95_prev']
+    table['regression'] = (
+        (table['ratio'] >= REGRESSION_RATIO)
+        & (table['samples'] >= REGRESSION_MIN_SAMPLES)
+        & (table['samples_prev'] >= REGRESSION_MIN_SAMPLES)
+    )
+    table = table.sort_values(['regression', 'p95'], ascending=False).reset_index(drop=True)
+    return table, newest, previous
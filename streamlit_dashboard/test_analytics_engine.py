@@ -0,0 +1,122 @@
+import pandas as pd
+import pytest
+
+import database
+from conftest import DOMAINS, import_frame
+
+KEYWORDS = [f"keyword {i}" for i in range(30)]
+MONTHS = (("2024-01", 0), ("2024-02", 3), ("2024-03", 7))
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch, save_month):
+    # A quote in the path checks that ATTACH gets a properly escaped literal
+    db_dir = tmp_path / "o'brien"
+    db_dir.mkdir()
+    monkeypatch.setattr(database, "DB_PATH", str(db_dir / "seo.db"))
+    monkeypatch.setattr(database, "_duckdb_failed", False)
+    database.init_db()
+    project_id = database.save_project("Test", DOMAINS[0])
+    for month, offset in MONTHS:
+        save_month(project_id, month, KEYWORDS, offset)
+    return project_id
+
+
+@pytest.fixture
+def sqlite_engine(monkeypatch):
+    monkeypatch.setattr(database, "ANALYTICS_ENGINE", "sqlite")
+
+
+def _duckdb_available():
+    duckdb = pytest.importorskip("duckdb")
+    try:
+        duckdb.connect().execute("LOAD sqlite")
+    except Exception as e:
+        pytest.skip(f"DuckDB sqlite extension unavailable: {e}")
+
+
+def test_domain_month_totals_sqlite(project, sqlite_engine):
+    totals = database.get_domain_month_totals(project)
+
+    assert len(totals) == len(MONTHS) * len(DOMAINS)
+    assert list(totals['month'].unique()) == [month for month, _ in MONTHS]
+    for (month, offset), (_, group) in zip(MONTHS, totals.groupby('month')):
+        df, domain_map = import_frame(KEYWORDS, offset)
+        for domain, cols in domain_map.items():
+            row = group.set_index('domain').loc[domain]
+            positions = df[cols['position']]
+            assert row['visibility'] == pytest.approx(df[cols['visibility']].sum())
+            assert row['ranked'] == len(KEYWORDS)
+            assert row['top3'] == (positions <= 3).sum()
+            assert row['top10'] == (positions <= 10).sum()
+        assert group['sov'].sum() == pytest.approx(100)
+
+
+def test_query_project_analytics_sqlite_binds_params(project, sqlite_engine):
+    df = database.query_project_analytics(project, """
+        SELECT k.keyword, r.month, r.position
+        FROM domain_rows r
+        JOIN {schema}keywords k ON k.id = r.keyword_id
+        WHERE r.domain = ? AND r.position <= ?
+        ORDER BY r.month, k.keyword
+    """, (DOMAINS[0], 3))
+
+    expected = []
+    for month, offset in MONTHS:
+        df_month, domain_map = import_frame(KEYWORDS, offset)
+        positions = df_month[domain_map[DOMAINS[0]]['position']]
+        expected += sorted((kw, month) for kw, pos in zip(KEYWORDS, positions) if pos <= 3)
+    assert sorted(zip(df['keyword'], df['month'])) == sorted(expected)
+    assert (df['position'] <= 3).all()
+
+
+def test_position_volatility_sqlite(project, sqlite_engine):
+    volatility = database.get_position_volatility(project, DOMAINS[0])
+
+    assert len(volatility) == len(KEYWORDS)
+    assert (volatility['months'] == len(MONTHS)).all()
+    assert volatility['position_std'].is_monotonic_decreasing
+    assert (volatility['best_position'] <= volatility['worst_position']).all()
+
+
+def test_portfolio_totals(project, sqlite_engine):
+    empty_project = database.save_project("Vacío", "otro.com")
+
+    portfolio = database.get_portfolio_totals(months=2)
+
+    empty = portfolio[portfolio['project_id'] == empty_project]
+    assert len(empty) == 1 and pd.isna(empty['import_id'].iloc[0])
+    rows = portfolio[portfolio['project_id'] == project]
+    assert sorted(rows['month'].unique()) == ["2024-02", "2024-03"]
+    latest = rows[rows['month_rank'] == 1].set_index('domain')
+    assert set(latest.index) == set(DOMAINS)
+    # The stored totals agree with the ones aggregated from the metrics
+    monthly = database.get_domain_month_totals(project)
+    monthly = monthly[monthly['month'] == "2024-03"].set_index('domain')
+    for col in ('visibility', 'top3', 'top10', 'sov'):
+        assert latest[col].astype(float).to_dict() == pytest.approx(monthly[col].astype(float).to_dict())
+
+
+def test_domain_month_totals_match_between_engines(project, monkeypatch):
+    _duckdb_available()
+    monkeypatch.setattr(database, "ANALYTICS_ENGINE", "duckdb")
+    duck = database.get_domain_month_totals(project)
+    monkeypatch.setattr(database, "ANALYTICS_ENGINE", "sqlite")
+    lite = database.get_domain_month_totals(project)
+
+    assert len(duck) == 6
+    columns = ['visibility', 'ranked', 'top3', 'top10', 'sov']
+    pd.testing.assert_frame_equal(
+        duck[['month', 'domain'] + columns].astype({c: float for c in columns}).reset_index(drop=True),
+        lite[['month', 'domain'] + columns].astype({c: float for c in columns}).reset_index(drop=True)
+    )
+
+
+def test_position_volatility_through_duckdb(project, monkeypatch):
+    _duckdb_available()
+    monkeypatch.setattr(database, "ANALYTICS_ENGINE", "duckdb")
+    volatility = database.get_position_volatility(project, "midominio.com")
+
+    assert len(volatility) == 30
+    assert (volatility['months'] == 3).all()
+    assert volatility['position_std'].is_monotonic_decreasing
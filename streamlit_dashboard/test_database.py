@@ -0,0 +1,160 @@
+import pytest
+
+import database
+import report_engine
+
+
+def _free_pages():
+    conn = database.get_connection()
+    try:
+        return conn.execute("PRAGMA freelist_count").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_compact_database_reclaims_every_free_page(db, save_month):
+    project_id = database.save_project("Test", "midominio.com")
+    keywords = [f"keyword {i} " + "x" * 40 for i in range(400)]
+    import_ids = [save_month(project_id, f"2024-0{m}", keywords, offset=m) for m in (1, 2, 3)]
+    database.compact_database()  # switches the new file to incremental auto-vacuum
+
+    for import_id in import_ids[:2]:
+        database.delete_import(import_id)
+    assert _free_pages() > 1
+
+    report = database.compact_database()
+
+    assert report['mode'] == "incremental"
+    assert _free_pages() == 0
+    assert report['free_pages_before'] > 1
+    assert report['freed_bytes'] > 0
+    assert report['after_bytes'] == report['before_bytes'] - report['freed_bytes']
+
+
+def test_migrates_a_baseline_database(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "legacy.db"))
+    # A database as schema version 1 left it, with one month of data
+    conn = database.get_connection()
+    database._migrate_baseline(conn)
+    conn.execute("PRAGMA user_version = 1")
+    conn.execute("INSERT INTO projects (id, name, main_domain) VALUES (1, 'Legacy', 'midominio.com')")
+    conn.execute("INSERT INTO imports (id, project_id, month, filename) VALUES (1, 1, '2024-01', 'old.csv')")
+    conn.execute("INSERT INTO keywords (id, project_id, keyword, keyword_norm) VALUES (1, 1, 'Zapatos Baratos', 'zapatos baratos')")
+    conn.execute("""
+        INSERT INTO keyword_metrics (import_id, keyword_id, volume, difficulty, intent, cpc, data_json)
+        VALUES (1, 1, 100, 10, 'N/D', 1.0, '{"midominio.com": {"pos": 2, "vis": 40, "clics": 5, "media_value": 7.5}}')
+    """)
+    conn.commit()
+    conn.close()
+
+    database.init_db()
+
+    conn = database.get_connection()
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == database.SCHEMA_VERSION
+        job_cols = [row[1] for row in conn.execute("PRAGMA table_info(ai_jobs)")]
+        assert "heartbeat_at" in job_cols
+        totals = conn.execute("SELECT domain, visibility, clics, top3, sov FROM import_domain_totals WHERE import_id = 1").fetchall()
+        assert [tuple(r) for r in totals] == [("midominio.com", 40, 5, 1, 100)]
+    finally:
+        conn.close()
+    imports = database.get_project_imports(1)
+    assert imports['data_version'].tolist() == [1]
+    # Already current: running it again is a no-op
+    database.init_db()
+    assert database.load_import_data(1)[0]['keyword'].tolist() == ["Zapatos Baratos"]
+
+
+SEARCH_KEYWORDS = ["zapatos baratos", "comprar zapatos", "Zapatillas Running", "botas de montaña", "zapato rojo"]
+
+
+def _drop_keyword_search_index():
+    """Same schema as on a SQLite build without FTS5/trigram"""
+    conn = database.get_connection()
+    for name in ("keywords_fts_ai", "keywords_fts_ad", "keywords_fts_au"):
+        conn.execute(f"DROP TRIGGER {name}")
+    conn.execute("DROP TABLE keywords_fts")
+    conn.commit()
+    conn.close()
+
+
+@pytest.mark.parametrize("fts", [True, False], ids=["fts", "like"])
+def test_search_keywords(db, save_month, fts):
+    project_id = database.save_project("Test", "midominio.com")
+    other = database.save_project("Otro", "otro.com")
+    jan = save_month(project_id, "2024-01", SEARCH_KEYWORDS[:3])
+    save_month(project_id, "2024-02", SEARCH_KEYWORDS)
+    save_month(other, "2024-01", ["zapatos de otro proyecto"])
+    if not fts:
+        _drop_keyword_search_index()
+
+    # Prefix matches first (alphabetical), then substring matches
+    assert database.search_keywords(project_id, "zapat") == [
+        "Zapatillas Running", "zapato rojo", "zapatos baratos", "comprar zapatos"
+    ]
+    # Case and accents are ignored
+    assert database.search_keywords(project_id, "MONTANA") == ["botas de montaña"]
+    assert sorted(database.search_keywords(project_id, "pat")) == sorted(SEARCH_KEYWORDS[:3] + ["zapato rojo"])
+    # Under 3 characters the substring match uses LIKE
+    assert sorted(database.search_keywords(project_id, "ar")) == ["comprar zapatos", "zapatos baratos"]
+    assert database.search_keywords(project_id, "zapat", import_id=jan) == [
+        "Zapatillas Running", "zapatos baratos", "comprar zapatos"
+    ]
+    assert database.search_keywords(project_id, "zapat", limit=2) == ["Zapatillas Running", "zapato rojo"]
+    # LIKE wildcards are literal
+    assert database.search_keywords(project_id, "%") == []
+
+
+# Rows of each table that belong to a project (as a subquery on :project_id)
+PROJECT_ROWS = {
+    'imports': "SELECT id FROM imports WHERE project_id = :project_id",
+    'keywords': "SELECT id FROM keywords WHERE project_id = :project_id",
+    'keyword_metrics': "SELECT id FROM keyword_metrics WHERE import_id IN (SELECT id FROM imports WHERE project_id = :project_id)",
+    'import_domain_totals': "SELECT import_id FROM import_domain_totals WHERE import_id IN (SELECT id FROM imports WHERE project_id = :project_id)",
+    'import_diffs': "SELECT import_id FROM import_diffs WHERE import_id IN (SELECT id FROM imports WHERE project_id = :project_id)",
+    'keyword_diffs': "SELECT import_id FROM keyword_diffs WHERE import_id IN (SELECT id FROM imports WHERE project_id = :project_id)",
+    'import_snapshots': "SELECT import_id FROM import_snapshots WHERE project_id = :project_id",
+    'project_snapshots': "SELECT project_id FROM project_snapshots WHERE project_id = :project_id",
+    'report_sections': "SELECT import_id FROM report_sections WHERE project_id = :project_id",
+    'ai_jobs': "SELECT id FROM ai_jobs WHERE project_id = :project_id",
+}
+
+
+def _project_row_counts(project_id):
+    conn = database.get_connection()
+    try:
+        return {
+            table: conn.execute(f"SELECT COUNT(*) FROM ({sql})", {'project_id': project_id}).fetchone()[0]
+            for table, sql in PROJECT_ROWS.items()
+        }
+    finally:
+        conn.close()
+
+
+def test_delete_project_removes_everything_it_owns(db, save_month):
+    project_id = database.save_project("Test", "midominio.com")
+    other = database.save_project("Otro", "otro.com")
+    for project in (project_id, other):
+        for m in (1, 2):
+            save_month(project, f"2024-0{m}", [f"keyword {i}" for i in range(10)], offset=m)
+        report_engine.refresh_after_import_change(project)
+        import_id = int(database.get_project_imports(project).iloc[0]['id'])
+        database.enqueue_ai_job('monthly', project, import_id, "prompt", "stub")
+    deleted_before = _project_row_counts(project_id)
+    other_before = _project_row_counts(other)
+    assert all(deleted_before.values())
+
+    assert database.delete_project(project_id)
+
+    assert all(count == 0 for count in _project_row_counts(project_id).values())
+    assert _project_row_counts(other) == other_before
+    # Counted through imports above: also check no row outlived its import or project
+    conn = database.get_connection()
+    try:
+        for table in ('keyword_metrics', 'import_domain_totals', 'import_diffs', 'keyword_diffs', 'import_snapshots', 'report_sections'):
+            assert conn.execute(f"SELECT COUNT(*) FROM {table} WHERE import_id NOT IN (SELECT id FROM imports)").fetchone()[0] == 0, table
+        for table in ('keywords', 'project_snapshots', 'ai_jobs'):
+            assert conn.execute(f"SELECT COUNT(*) FROM {table} WHERE project_id NOT IN (SELECT id FROM projects)").fetchone()[0] == 0, table
+    finally:
+        conn.close()
+    assert database.search_keywords(other, "keyword", limit=3) == ["keyword 0", "keyword 1", "keyword 2"]
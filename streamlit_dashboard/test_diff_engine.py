@@ -0,0 +1,75 @@
+import pandas as pd
+
+import database
+import diff_engine
+import report_engine
+from conftest import import_frame
+
+MAIN = "midominio.com"
+KEYWORDS = [f"keyword {i}" for i in range(10)]
+STABLE = [5] * len(KEYWORDS)
+TWO_DROPPED = [15, 15] + [5] * (len(KEYWORDS) - 2)
+
+
+def _diff_rows(import_id):
+    conn = database.get_connection()
+    try:
+        return pd.read_sql_query(
+            "SELECT keyword_id, position, prev_position FROM keyword_diffs WHERE import_id = ? AND domain = ?",
+            conn, params=(import_id, MAIN)
+        )
+    finally:
+        conn.close()
+
+
+def test_diff_against_previous_month(db, save_month):
+    project_id = database.save_project("Test", MAIN)
+    jan = save_month(project_id, "2024-01", KEYWORDS, positions=STABLE)
+    feb = save_month(project_id, "2024-02", KEYWORDS, positions=TWO_DROPPED)
+
+    assert diff_engine.refresh_project_diffs(project_id) == [jan, feb]
+    assert database.get_import_diff_headers(project_id) == {jan: None, feb: jan}
+    assert database.count_risk_keywords(feb, MAIN) == 2
+    changes = database.get_keyword_changes(feb, MAIN)
+    assert sorted(changes['keyword']) == ["keyword 0", "keyword 1"]
+    assert set(changes['change_type']) == {'lost_top10'}
+    # Already current: nothing to recompute
+    assert diff_engine.refresh_project_diffs(project_id) == []
+
+
+def test_reupload_recomputes_its_diff_and_the_next_month(db, save_month):
+    project_id = database.save_project("Test", MAIN)
+    save_month(project_id, "2024-01", KEYWORDS, positions=STABLE)
+    feb = save_month(project_id, "2024-02", KEYWORDS, positions=STABLE)
+    mar = save_month(project_id, "2024-03", KEYWORDS, positions=TWO_DROPPED)
+    report_engine.refresh_after_import_change(project_id)
+    assert database.count_risk_keywords(feb, MAIN) == 0
+    assert database.count_risk_keywords(mar, MAIN) == 2
+
+    # Same month again (same import id) with two keywords out of the Top 10
+    assert save_month(project_id, "2024-02", KEYWORDS, positions=TWO_DROPPED) == feb
+    report_engine.refresh_after_import_change(project_id)
+
+    assert database.count_risk_keywords(feb, MAIN) == 2
+    assert len(database.get_keyword_changes(feb, MAIN)) == 2
+    assert report_engine.get_monthly_report_snapshot(feb)['risks_count'] == 2
+    # March now compares against the re-uploaded February
+    assert database.count_risk_keywords(mar, MAIN) == 0
+    assert report_engine.get_monthly_report_snapshot(mar)['risks_count'] == 0
+    assert (_diff_rows(mar)['prev_position'] == 15).sum() == 2
+
+
+def test_repeated_keyword_row_yields_one_diff_row(db):
+    project_id = database.save_project("Test", MAIN)
+    df, domain_map = import_frame(KEYWORDS)
+    database.save_import_data(project_id, "2024-01", "test.csv", df, domain_map)
+    # The CSV of February repeats a keyword
+    df, domain_map = import_frame(KEYWORDS + ["keyword 3"], offset=2)
+    feb = database.save_import_data(project_id, "2024-02", "test.csv", df, domain_map)
+
+    report_engine.refresh_after_import_change(project_id)
+
+    rows = _diff_rows(feb)
+    assert len(rows) == len(KEYWORDS)
+    assert not rows['keyword_id'].duplicated().any()
+    assert report_engine.get_monthly_report_snapshot(feb) is not None
@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+import pytest
+
+import database
+import history_cube
+import report_engine
+
+KEYWORDS = [f"keyword {i}" for i in range(15)]
+
+
+@pytest.fixture
+def project(db, save_month):
+    project_id = database.save_project("Test", "midominio.com")
+    save_month(project_id, "2024-01", KEYWORDS[:10])
+    # New keywords in later months grow the keyword axis
+    save_month(project_id, "2024-02", KEYWORDS[:12], offset=3)
+    save_month(project_id, "2024-03", KEYWORDS[5:], offset=7)
+    return project_id
+
+
+def assert_same_panel(cube, sqlite):
+    """Both panels hold the same data (the cube does not guarantee the domain order)"""
+    assert list(cube['keyword_ids']) == list(sqlite['keyword_ids'])
+    assert list(cube['months']) == list(sqlite['months'])
+    assert list(cube['import_ids']) == list(sqlite['import_ids'])
+    assert sorted(cube['domains']) == sorted(sqlite['domains'])
+    np.testing.assert_array_equal(cube['present'], sqlite['present'])
+    order = [cube['domains'].index(d) for d in sqlite['domains']]
+    for metric in database.PANEL_METRICS:
+        np.testing.assert_allclose(cube[metric][order], sqlite[metric], equal_nan=True, rtol=1e-6)
+
+
+def test_load_panel_matches_sqlite_panel(project):
+    history_cube.sync_cube(project)
+
+    assert_same_panel(history_cube.load_panel(project), database.get_keyword_panel(project))
+
+
+def test_load_panel_restrictions_match_sqlite_panel(project):
+    history_cube.sync_cube(project)
+    imports = database.get_project_imports(project)
+    keyword_ids = database.get_keyword_panel(project)['keyword_ids'][3:8]
+    import_ids = imports['id'].tolist()[:2]
+
+    assert_same_panel(
+        history_cube.load_panel(project, keyword_ids=keyword_ids, domains=["competidor.com"], import_ids=import_ids),
+        database.get_keyword_panel(project, domains=["competidor.com"], keyword_ids=keyword_ids, import_ids=import_ids)
+    )
+
+
+def test_load_panel_is_read_only(project):
+    with pytest.raises(history_cube.StaleCube):
+        history_cube.load_panel(project)
+    assert not os.path.exists(history_cube.cube_dir(project))
+
+
+def test_reupload_makes_the_cube_stale_until_synced(project, save_month):
+    history_cube.sync_cube(project)
+    save_month(project, "2024-02", KEYWORDS, offset=11)
+
+    with pytest.raises(history_cube.StaleCube):
+        history_cube.load_panel(project)
+    # Months not touched by the re-upload are still served
+    jan = int(database.get_project_imports(project).iloc[-1]['id'])
+    history_cube.load_panel(project, import_ids=[jan])
+
+    meta = history_cube.sync_cube(project)
+    assert_same_panel(history_cube.load_panel(project), database.get_keyword_panel(project))
+    # Only the files the metadata references are left (the old February is gone)
+    files = {f for f in os.listdir(history_cube.cube_dir(project)) if f.endswith(".npy")}
+    assert files == {info['file'] for info in meta['months'].values()}
+
+
+def test_delete_drops_the_month(project):
+    history_cube.sync_cube(project)
+    feb = int(database.get_project_imports(project).iloc[1]['id'])
+    database.delete_import(feb)
+
+    meta = history_cube.sync_cube(project)
+
+    assert str(feb) not in meta['months']
+    assert_same_panel(history_cube.load_panel(project), database.get_keyword_panel(project))
+
+
+def test_rebuild_starts_a_new_generation(project):
+    first = history_cube.sync_cube(project)
+    rebuilt = history_cube.sync_cube(project, rebuild=True)
+
+    assert rebuilt['generation'] == first['generation'] + 1
+    assert_same_panel(history_cube.load_panel(project), database.get_keyword_panel(project))
+
+
+def test_report_engine_falls_back_to_sqlite_when_stale(project):
+    panel = report_engine.load_keyword_panel(project)
+
+    assert_same_panel(panel, database.get_keyword_panel(project))
+    assert not os.path.exists(history_cube.cube_dir(project))
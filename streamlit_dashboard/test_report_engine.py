@@ -0,0 +1,114 @@
+import pytest
+
+import database
+import intent_rules
+import report_engine
+
+MAIN = "midominio.com"
+KEYWORDS = [f"keyword {i}" for i in range(20)]
+MONTHS = ["2024-01", "2024-02", "2024-03", "2024-04"]
+
+
+@pytest.fixture
+def project(db, save_month):
+    project_id = database.save_project("Test", MAIN)
+    import_ids = [save_month(project_id, month, KEYWORDS, offset=i) for i, month in enumerate(MONTHS)]
+    assert report_engine.refresh_after_import_change(project_id) == len(MONTHS)
+    return project_id, import_ids
+
+
+def _missing(project_id):
+    return (
+        database.get_imports_missing_snapshot(project_id, report_engine.SNAPSHOT_VERSION),
+        database.get_imports_missing_section(project_id, 'top15', report_engine.SNAPSHOT_VERSION),
+        database.get_project_snapshot(project_id) is None
+    )
+
+
+def test_refresh_stores_every_report(project):
+    project_id, import_ids = project
+
+    assert _missing(project_id) == ([], [], False)
+    stored = report_engine.load_import_snapshot(import_ids[-1])
+    computed = report_engine.compute_monthly_report(import_ids[-1])
+    for key in ('main_sov', 'total_clics', 'top_3', 'top_10', 'risks_count', 'delta_sov'):
+        assert stored[key] == computed[key]
+    # Nothing left to rebuild
+    assert report_engine.rebuild_stale_reports(project_id) == 0
+
+
+def test_reupload_invalidates_the_month_and_the_next_one(project, save_month):
+    project_id, (jan, feb, mar, apr) = project
+
+    save_month(project_id, "2024-02", KEYWORDS, offset=9)
+
+    missing_snapshots, missing_sections, global_missing = _missing(project_id)
+    assert missing_snapshots == [feb, mar]
+    # The Top 15 history of every later month reads February
+    assert missing_sections == [feb, mar, apr]
+    assert global_missing
+    assert report_engine.refresh_after_import_change(project_id) == 2
+    assert _missing(project_id) == ([], [], False)
+
+
+def test_new_month_at_the_end_keeps_earlier_reports(project, save_month):
+    project_id, import_ids = project
+
+    may = save_month(project_id, "2024-05", KEYWORDS, offset=4)
+
+    assert _missing(project_id) == ([may], [may], True)
+
+
+def test_delete_invalidates_the_next_month(project):
+    project_id, (jan, feb, mar, apr) = project
+
+    database.delete_import(feb)
+
+    assert _missing(project_id) == ([mar], [mar, apr], True)
+    assert report_engine.refresh_after_import_change(project_id) == 1
+    # March is now compared against January
+    assert database.get_import_diff_headers(project_id)[mar] == jan
+
+
+def test_intent_edit_invalidates_the_imports_with_the_keyword(project, save_month):
+    project_id, import_ids = project
+    may = save_month(project_id, "2024-05", KEYWORDS + ["solo en mayo"], offset=4)
+    report_engine.refresh_after_import_change(project_id)
+
+    affected = database.upsert_keyword_intent(intent_rules.normalize_keyword("solo en mayo"), "solo en mayo", "Transaccional")
+
+    assert affected == [project_id]
+    assert _missing(project_id)[0] == [may]
+    report_engine.rebuild_stale_reports(project_id)
+    assert _missing(project_id) == ([], [], False)
+
+
+def test_domain_change_invalidates_the_whole_project(project):
+    project_id, import_ids = project
+
+    database.update_project_domain(project_id, "competidor.com")
+
+    assert _missing(project_id) == (import_ids, import_ids, True)
+    report_engine.rebuild_stale_reports(project_id)
+    assert report_engine.get_monthly_report_snapshot(import_ids[-1])['selected_domain'] == "competidor.com"
+
+
+def test_outdated_snapshot_version_is_rebuilt(project):
+    project_id, import_ids = project
+    report = report_engine.load_import_snapshot(import_ids[0])
+    database.save_import_snapshot(import_ids[0], project_id, report_engine.SNAPSHOT_VERSION - 1, b"old")
+
+    assert report_engine.load_import_snapshot(import_ids[0]) is None
+    assert _missing(project_id)[0] == [import_ids[0]]
+    assert report_engine.get_monthly_report_snapshot(import_ids[0])['main_sov'] == report['main_sov']
+    assert _missing(project_id)[0] == []
+
+
+def test_snapshot_reads_project_depth_live(project, save_month):
+    project_id, import_ids = project
+    save_month(project_id, "2024-05", KEYWORDS, offset=4)
+
+    # January's stored report predates May; its depth is read live
+    report = report_engine.get_monthly_report_snapshot(import_ids[0])
+    assert report['n_meses'] == 5
+    assert report['last_month'] == "2024-05"
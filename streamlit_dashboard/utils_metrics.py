@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import logging
 
@@ -5,6 +6,42 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("metrics_hardener")
 
+def harden_visibility_matrix(sov_matrix: pd.DataFrame):
+    """
+    Batch visibility hardening of a month × domain SoV matrix (rows in month order,
+    NaN = domain absent that month), with array operations:
+    - anti-scale: /100 for every domain whose latest value exceeds 1000
+    - clamp to 0-100
+    Corrections are logged once per call as aggregated counts.
+
+    Returns:
+        pd.DataFrame: corrected matrix, same index and columns
+    """
+    values = sov_matrix.to_numpy(dtype=float, copy=True)
+    if values.size == 0:
+        return pd.DataFrame(values, index=sov_matrix.index, columns=sov_matrix.columns)
+
+    # Latest non-NaN value of each domain
+    has_value = ~np.isnan(values)
+    last_row = values.shape[0] - 1 - np.argmax(has_value[::-1], axis=0)
+    last_vals = np.where(has_value.any(axis=0), values[last_row, np.arange(values.shape[1])], np.nan)
+
+    # Auto-correction for common errors (e.g. multiplied by 100 twice)
+    rescale = last_vals > 1000
+    if rescale.any():
+        values[:, rescale] /= 100.0
+        domains = ", ".join(str(d) for d in sov_matrix.columns[rescale])
+        logger.warning(f"Extreme visibility values detected for {int(rescale.sum())} domain(s) ({domains}). Applying anti-scale correction (/100).")
+
+    # Range check and clamp as a safety measure (logged as counts)
+    n_high = int((values > 100.0).sum())
+    n_negative = int((values < 0.0).sum())
+    if n_high or n_negative:
+        logger.error(f"Visibility out of range: {n_high} value(s) above 100% clamped to 100, {n_negative} negative value(s) clamped to 0.")
+        np.clip(values, 0.0, 100.0, out=values)
+
+    return pd.DataFrame(values, index=sov_matrix.index, columns=sov_matrix.columns)
+
 def get_visibility_stats(visibility_series: pd.Series):
     """
     Standardizes visibility calculation and formatting.
@@ -25,27 +62,8 @@ def get_visibility_stats(visibility_series: pd.Series):
             'formatted_value': "0.0%", 'formatted_delta': None
         }
 
-    # 1. HARDENING: Anti-scale guards
-    # We work with 0-100 scale.
-    series = visibility_series.copy().astype(float)
-    
-    # Auto-correction for common errors (e.g. multiplied by 100 twice)
-    last_val = series.iloc[-1]
-    if last_val > 1000:
-        logger.warning(f"Extreme visibility value detected ({last_val}). Applying anti-scale correction (/100).")
-        series = series / 100.0
-    
-    # Double-check range and clamp as a safety measure (but log it)
-    def clamp_and_log(val):
-        if val > 100.0:
-            logger.error(f"Visibility value {val} exceeds 100%. Clamping to 100.")
-            return 100.0
-        if val < 0.0:
-            logger.error(f"Visibility value {val} is negative. Clamping to 0.")
-            return 0.0
-        return val
-
-    series = series.apply(clamp_and_log)
+    # 1. HARDENING: Anti-scale guards + clamp (0-100 scale), see harden_visibility_matrix
+    series = harden_visibility_matrix(visibility_series.to_frame()).iloc[:, 0]
 
     # 2. CALCULATION
     current = series.iloc[-1]